@@ -0,0 +1,173 @@
+# Starts the bot in cluster mode against local stand-ins of Discord, Redis
+# and the item dumps, and measures how long it takes for every cluster to
+# report all of its shards ready. Each entry in --shards is a separate run,
+# the report has the resources every cluster process ended up using:
+#
+#   python benchmarks/cluster.py --shards 4 16 64 --clusters 4 --guilds 2000
+from argparse import ArgumentParser, Namespace
+from asyncio import create_subprocess_exec, run, sleep, wait_for
+from asyncio.subprocess import DEVNULL, Process
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from signal import SIGTERM
+from sys import executable, stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from gateway import FakeDiscord
+from stubs import FakeDumps, FakeRedis, FakeRedisServer
+
+ROOT = Path(__file__).parent.parent
+POLL_INTERVAL = 0.1
+SHUTDOWN_TIMEOUT = 30
+
+
+class ClusterBenchmark:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.dumps = FakeDumps()
+
+    def _get_env(
+        self, discord: FakeDiscord, redis: FakeRedisServer, shards: int, path: Path
+    ) -> dict[str, str]:
+        return {
+            **environ,
+            "PYTHONPATH": str(ROOT / "src"),
+            "DISCORD_TOKEN": "benchmark",
+            "DEBUG": "0",
+            "DISCORD_API_BASE_URL": discord.api_url,
+            "DISCORD_GATEWAY_URL": discord.gateway_url,
+            "REDIS_HOST": "127.0.0.1",
+            "REDIS_PORT": str(redis.port),
+            "REDIS_PASSWORD": "benchmark",
+            "STORAGE_BACKEND": "sqlite",
+            "SQLITE_PATH": str(path / "bridgewatcher.db"),
+            "ITEMS_DUMP_URL": f"{self.dumps.url}/items.json",
+            "ITEM_NAMES_DUMP_URL": f"{self.dumps.url}/items.txt",
+            "CLUSTERS": str(self.args.clusters),
+            "SHARD_COUNT": str(shards),
+            "MAX_CONCURRENCY": str(self.args.max_concurrency),
+            "COMPUTE_WORKERS": str(self.args.workers),
+            "METRICS_PORT": "",
+            "LOOP_STALL_THRESHOLD": "0",
+        }
+
+    async def _read_statuses(
+        self, redis: FakeRedis, clusters: int
+    ) -> list[dict[str, Any]]:
+        values = await redis.mget(
+            [f"cluster:{cluster_id}:status" for cluster_id in range(clusters)]
+        )
+        return [loads(value) for value in values if value is not None]
+
+    async def _stop(self, process: Process) -> None:
+        if process.returncode is None:
+            process.send_signal(SIGTERM)
+        try:
+            await wait_for(process.wait(), SHUTDOWN_TIMEOUT)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+
+    async def run_step(self, shards: int) -> dict[str, Any]:
+        redis = FakeRedis()
+        redis_server = FakeRedisServer(redis)
+        discord = FakeDiscord(self.args.guilds, shards)
+        await redis_server.start()
+        await discord.start()
+
+        clusters = min(self.args.clusters, shards)
+        with TemporaryDirectory() as path:
+            # the log files are relative to the working directory
+            (Path(path) / "logs").mkdir()
+            started = perf_counter()
+            process = await create_subprocess_exec(
+                executable,
+                str(ROOT / "main.py"),
+                cwd=path,
+                env=self._get_env(discord, redis_server, shards, Path(path)),
+                stdout=DEVNULL,
+                stderr=None if self.args.verbose else DEVNULL,
+            )
+            ready_after = None
+            statuses: list[dict[str, Any]] = []
+            try:
+                while perf_counter() - started < self.args.timeout:
+                    if process.returncode is not None:
+                        break
+                    statuses = await self._read_statuses(redis, clusters)
+                    if len(statuses) == clusters and all(
+                        set(status["ready_shards"]) == set(status["shards"])
+                        for status in statuses
+                    ):
+                        ready_after = perf_counter() - started
+                        break
+                    await sleep(POLL_INTERVAL)
+            finally:
+                await self._stop(process)
+                await discord.close()
+                await redis_server.close()
+
+        return {
+            "clusters": clusters,
+            "ready_s": round(ready_after, 2) if ready_after is not None else None,
+            "guilds": sum(status["guilds"] for status in statuses),
+            "identifies": sum(discord.identified.values()),
+            "reidentified_shards": sum(
+                1 for count in discord.identified.values() if count > 1
+            ),
+            "command_syncs": discord.requests["sync"],
+            "exit_code": process.returncode,
+            "per_cluster": [
+                {
+                    "cluster": status["cluster"],
+                    "shards": len(status["shards"]),
+                    "guilds": status["guilds"],
+                    "max_rss_mib": round(status["max_rss_kib"] / 1024, 1),
+                    "cpu_s": round(status["cpu_seconds"], 2),
+                }
+                for status in sorted(statuses, key=lambda status: status["cluster"])
+            ],
+        }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--shards", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    benchmark = ClusterBenchmark(args)
+    await benchmark.dumps.start()
+    results = {}
+    try:
+        for shards in args.shards:
+            results[shards] = await benchmark.run_step(shards)
+            print(
+                f"{shards} shards: ready after {results[shards]["ready_s"]}s, "
+                f"{results[shards]["identifies"]} identifies",
+                file=stderr,
+            )
+    finally:
+        await benchmark.dumps.close()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,213 @@
+# Measures how late the event loop gets while CPU heavy work runs, once on
+# the loop itself and once in the process pool. A probe task sleeps for a few
+# milliseconds in a loop and records how much later than asked it woke up,
+# which is exactly the delay every other command would see at that moment:
+#
+#   python benchmarks/compute.py --items 20000 --variants 200 --workers 2
+from argparse import ArgumentParser, Namespace
+from asyncio import (
+    CancelledError,
+    create_task,
+    get_running_loop,
+    run,
+    sleep,
+    wait_for,
+)
+from collections.abc import Awaitable, Callable
+from json import dumps
+from pathlib import Path
+from statistics import quantiles
+from sys import stderr
+from time import perf_counter
+from typing import Any
+
+from bridgewatcher.api.model import CityPrice, Qualities
+from bridgewatcher.compute import CancellationToken, ComputePool, unpickle_chunks
+from bridgewatcher.db.seed.run import prepare_catalog
+from bridgewatcher.market.matrix import SharedPriceMatrix, scan_flips
+from bridgewatcher.market.model import MarketFlip
+
+from fixtures import make_city_prices, make_item_names_dump, make_items_dump
+
+PROBE_INTERVAL = 0.005
+FLIPS_LIMIT = 25
+
+
+# What a job would look like without the shared memory: every price goes
+# through pickle on the way to the worker
+def scan_pickled_flips(
+    prices: dict[str, list[CityPrice]],
+    quality: Qualities,
+    has_premium: bool,
+    limit: int,
+    token: CancellationToken,
+) -> list[tuple[str, MarketFlip]]:
+    with SharedPriceMatrix.create(prices) as matrix:
+        return scan_flips(matrix.handle, quality, has_premium, limit, token)
+
+
+class LagProbe:
+    def __init__(self) -> None:
+        self.lags: list[float] = []
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = get_running_loop()
+        while True:
+            started = loop.time()
+            await sleep(PROBE_INTERVAL)
+            self.lags.append((loop.time() - started - PROBE_INTERVAL) * 1000)
+
+    def __enter__(self) -> "LagProbe":
+        self._task = create_task(self._run())
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._task.cancel()  # type: ignore
+
+    def summarize(self) -> dict[str, float]:
+        lags = self.lags if len(self.lags) > 1 else [*self.lags, 0.0, 0.0]
+        percentiles = quantiles(lags, n=100, method="inclusive")
+        return {
+            "samples": len(self.lags),
+            "lag_p50_ms": round(percentiles[49], 2),
+            "lag_p99_ms": round(percentiles[98], 2),
+            "lag_max_ms": round(max(lags), 2),
+        }
+
+
+class ComputeBenchmark:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.pool = ComputePool(args.workers)
+        self.items_dump = make_items_dump(args.variants)
+        self.names_dump = make_item_names_dump(args.variants)
+        self.prices = {
+            f"T4_ITEM_{i}": [
+                CityPrice(**price) for price in make_city_prices(f"T4_ITEM_{i}")
+            ]
+            for i in range(args.items)
+        }
+        self.matrix = SharedPriceMatrix.create(self.prices)
+
+    async def prepare_inline(self) -> None:
+        items, names = prepare_catalog(self.items_dump, self.names_dump)
+        await unpickle_chunks(items)
+        await unpickle_chunks(names)
+
+    async def prepare_pool(self) -> None:
+        items, names = await self.pool.run(
+            prepare_catalog, self.items_dump, self.names_dump
+        )
+        await unpickle_chunks(items)
+        await unpickle_chunks(names)
+
+    # the matrix is built on the loop from prices that are already there, it
+    # only has to be done again once they change
+    async def create_matrix(self) -> None:
+        SharedPriceMatrix.create(self.prices).close()
+
+    async def flips_inline(self) -> None:
+        token = CancellationToken()
+        try:
+            scan_flips(self.matrix.handle, Qualities.NORMAL, True, FLIPS_LIMIT, token)
+        finally:
+            token.close()
+
+    async def flips_pool(self) -> None:
+        await self.pool.run_cancellable(
+            scan_flips, self.matrix.handle, Qualities.NORMAL, True, FLIPS_LIMIT
+        )
+
+    async def flips_pool_pickled(self) -> None:
+        await self.pool.run_cancellable(
+            scan_pickled_flips, self.prices, Qualities.NORMAL, True, FLIPS_LIMIT
+        )
+
+    # how long a worker stays busy with a job nobody waits for anymore
+    async def cancelled(self) -> None:
+        job = create_task(
+            self.pool.run_cancellable(
+                scan_flips, self.matrix.handle, Qualities.NORMAL, True, FLIPS_LIMIT
+            )
+        )
+        await sleep(0.01)
+        job.cancel()
+        try:
+            await job
+        except CancelledError:
+            pass
+        # the freed worker picks this up, it waits for the cancelled job
+        # otherwise
+        await wait_for(self.pool.run(sum, [0]), self.args.timeout)
+
+    def get_cases(self) -> dict[str, Callable[[], Awaitable[None]]]:
+        return {
+            "seed.prepare_catalog.inline": self.prepare_inline,
+            "seed.prepare_catalog.pool": self.prepare_pool,
+            "flips.matrix.create": self.create_matrix,
+            "flips.scan.inline": self.flips_inline,
+            "flips.scan.pool": self.flips_pool,
+            "flips.scan.pool_pickled": self.flips_pool_pickled,
+            "flips.scan.cancelled": self.cancelled,
+        }
+
+    async def run_case(self, case: Callable[[], Awaitable[None]]) -> dict[str, Any]:
+        # the first run is left out, it's when the workers import everything
+        await case()
+
+        durations = []
+        with LagProbe() as probe:
+            for _ in range(self.args.iterations):
+                # give the probe a chance to see the loop idle between runs
+                await sleep(PROBE_INTERVAL * 2)
+                started = perf_counter()
+                await case()
+                durations.append((perf_counter() - started) * 1000)
+
+        return {
+            "duration_ms": round(sum(durations) / len(durations), 2),
+            **probe.summarize(),
+        }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--variants", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--cases", nargs="*", help="only run cases with these prefixes")
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    benchmark = ComputeBenchmark(args)
+    await benchmark.pool.start()
+    results = {}
+    try:
+        for name, case in benchmark.get_cases().items():
+            if args.cases and not any(name.startswith(prefix) for prefix in args.cases):
+                continue
+            results[name] = await benchmark.run_case(case)
+            print(
+                f"{name}: {results[name]["duration_ms"]}ms, "
+                f"loop lag p99 {results[name]["lag_p99_ms"]}ms",
+                file=stderr,
+            )
+    finally:
+        benchmark.pool.shutdown()
+        benchmark.matrix.close()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
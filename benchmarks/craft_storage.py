@@ -0,0 +1,118 @@
+# Latency of the storage side of /craft on every storage backend: the guild
+# config lookups, the item name search, the item and material lookups done by
+# Crafter and the name lookups for the embed. Prices come from the fixtures so
+# the upstream doesn't add any noise. MongoDB has to be configured as usual
+# (see .env.example), SQLite runs in a temporary file:
+#
+#   python benchmarks/craft_storage.py --backends sqlite mongo --iterations 500
+from argparse import ArgumentParser
+from asyncio import run
+from dataclasses import dataclass
+from json import dumps
+from os import environ
+from pathlib import Path
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from dacite import from_dict
+
+from bridgewatcher.api import AlbionOnlineServers
+from bridgewatcher.api.model import CityPrice
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.seed.run import get_dump_hash, seed
+from bridgewatcher.discord.formatting import get_item_name_by_id
+from bridgewatcher.discord.server import ServerManager
+from bridgewatcher.market import Crafter
+
+from fixtures import make_city_prices, make_item_names_dump, make_items_dump
+
+QUERIES = ("Tier 6 Sword 3", "Tier 4.2 Bags 1", "Tier 8 Bow 12", "Tier 5.1 Axe 7")
+
+
+@dataclass
+class FixtureGuild:
+    id: int
+
+
+class FixtureAlbion:
+    def __init__(self) -> None:
+        self.server = AlbionOnlineServers.AMERICA
+        self._prices: dict[str, list[CityPrice]] = {}
+
+    async def get_item_prices(self, item_or_id: Any) -> list[CityPrice]:
+        id = item_or_id if isinstance(item_or_id, str) else item_or_id.name
+        if id not in self._prices:
+            self._prices[id] = [
+                from_dict(data_class=CityPrice, data=price)
+                for price in make_city_prices(id)
+            ]
+        return self._prices[id]
+
+    async def get_items_prices(self, items_or_ids: list[Any]) -> dict[str, Any]:
+        return {
+            item_or_id: await self.get_item_prices(item_or_id)
+            for item_or_id in items_or_ids
+        }
+
+
+async def craft_storage_path(query: str, crafter: Crafter) -> None:
+    guild = FixtureGuild(1)
+    await ServerManager.get_albion(guild)  # type: ignore
+
+    results = await backends.store.search_item_names(query, limit=5)
+    item_doc = await backends.store.find_item(results[0]["id"])
+    craft = await crafter.craft(item_doc["name"])  # type: ignore
+
+    await ServerManager.get_or_create_conf(guild)  # type: ignore
+    for purchase in craft.purchases:
+        await get_item_name_by_id(purchase.item.name)
+
+
+async def bench_backend(backend: str, iterations: int) -> dict[str, Any]:
+    environ["STORAGE_BACKEND"] = backend
+    # a fresh registry per backend, the real one is shared by the whole process
+    registry = Backends()
+    backends.configure(store=registry.store)
+
+    items, names = make_items_dump(), make_item_names_dump()
+    await seed(items, names, get_dump_hash(items), forced=True)
+
+    crafter = Crafter(FixtureAlbion())  # type: ignore
+    for query in QUERIES:
+        await craft_storage_path(query, crafter)
+
+    latencies = []
+    for i in range(iterations):
+        started = perf_counter()
+        await craft_storage_path(QUERIES[i % len(QUERIES)], crafter)
+        latencies.append((perf_counter() - started) * 1000)
+
+    await backends.store.close()
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    return {
+        "mean_ms": round(mean(latencies), 3),
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["sqlite"])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    results = {}
+    with TemporaryDirectory() as directory:
+        environ["SQLITE_PATH"] = str(Path(directory) / "bench.db")
+        for backend in args.backends:
+            results[backend] = await bench_backend(backend, args.iterations)
+
+    print(dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,145 @@
+# Measures a cycle of the digest scheduler against local stand-ins of AODP,
+# Redis and Discord with a catalog seeded from the fixtures. Every step
+# subscribes a channel of --guilds guilds to the digest of a random albion
+# server and category, the digests built and the upstream requests should
+# follow the distinct servers and categories and not the guilds:
+#
+#   python benchmarks/digests.py --guilds 10 1000
+from argparse import ArgumentParser, Namespace
+from asyncio import run
+from json import dumps
+from os import environ
+from pathlib import Path
+from random import Random
+from sys import stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from bridgewatcher.api import AlbionOnlineServers
+from bridgewatcher.compute import COMPUTE
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.catalog import mark_catalog_ready
+from bridgewatcher.db.schema import (
+    DigestFrequencies,
+    DigestSubscription,
+    DiscordServer,
+)
+from bridgewatcher.db.seed.run import get_dump_hash, seed
+from bridgewatcher.discord.digests import DigestScheduler
+from bridgewatcher.metrics import DIGESTS_BUILT, enable_metrics
+
+from fixtures import CATEGORIES, make_item_names_dump, make_items_dump
+from stubs import FakeAodp, FakeRedis
+from watches import FakeBot
+
+PROFILE_CATEGORIES = (None, *sorted(set(CATEGORIES.values())))
+
+
+def get_digests_built() -> int:
+    return int(
+        sum(DIGESTS_BUILT.get(server=server.value) for server in AlbionOnlineServers)
+    )
+
+
+class DigestBenchmark:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.aodp = FakeAodp(args.upstream_latency)
+        self.items = make_items_dump()
+        self.names = make_item_names_dump()
+
+    async def run_step(self, directory: str, guilds: int) -> dict[str, Any]:
+        environ["SQLITE_PATH"] = str(Path(directory) / f"digests-{guilds}.db")
+        redis = FakeRedis(self.args.redis_latency)
+        backends.configure(redis=redis, store=Backends().store)  # type: ignore
+        await seed(self.items, self.names, get_dump_hash(self.items), forced=True)
+        mark_catalog_ready()
+
+        rng = Random(guilds)
+        for guild_id in range(guilds):
+            server = DiscordServer(
+                guild_id,
+                rng.choice(tuple(AlbionOnlineServers)).value,
+                [
+                    DigestSubscription(
+                        guild_id,
+                        DigestFrequencies.HOURLY,
+                        rng.choice(PROFILE_CATEGORIES),
+                    )
+                ],
+            )
+            await backends.store.insert_server(server.to_mongo())
+
+        bot = FakeBot()
+        scheduler = DigestScheduler(bot, 60)  # type: ignore
+        # delivery is paced by the bucket on purpose, the benchmark is after
+        # what it takes to build the digests
+        scheduler._bucket.rate = scheduler._bucket.burst = 1_000_000
+        self.aodp.requests.clear()
+        built = get_digests_built()
+
+        started = perf_counter()
+        await scheduler.run_cycle(
+            {DigestFrequencies.HOURLY: f"digests:hourly:benchmark:{guilds}"}
+        )
+        elapsed = perf_counter() - started
+
+        await backends.close()
+        return {
+            "guilds": guilds,
+            "cycle_s": round(elapsed, 3),
+            "digests_built": get_digests_built() - built,
+            "upstream_requests": sum(self.aodp.requests.values()),
+            "messages": sum(bot.messages.values()),
+            # how long sending them takes at the rate the scheduler allows
+            "paced_delivery_s": round(
+                sum(bot.messages.values()) / DigestScheduler.DELIVERIES_PER_SECOND, 1
+            ),
+        }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--guilds", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--redis-latency", type=float, default=0.0005)
+    # the digests wait for the shared budget, 0 leaves it out
+    parser.add_argument("--requests-per-minute", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    environ["STORAGE_BACKEND"] = "sqlite"
+    environ["AODP_REQUESTS_PER_MINUTE"] = str(args.requests_per_minute)
+    enable_metrics()
+    benchmark = DigestBenchmark(args)
+    environ["AODP_BASE_URL"] = await benchmark.aodp.start()
+
+    results = []
+    try:
+        with TemporaryDirectory() as directory:
+            for guilds in args.guilds:
+                result = await benchmark.run_step(directory, guilds)
+                results.append(result)
+                print(
+                    f"{guilds} guilds: {result["cycle_s"]}s, "
+                    f"{result["digests_built"]} digests built, "
+                    f"{result["upstream_requests"]} upstream requests",
+                    file=stderr,
+                )
+    finally:
+        await benchmark.aodp.close()
+        COMPUTE.shutdown()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,187 @@
+# Deterministic stand-ins for the ao-bin-dumps files and the AODP price
+# responses, shaped exactly like the real ones so the real parsers run on them
+from datetime import datetime, timedelta, timezone
+from json import dumps
+from random import Random
+from typing import Any
+
+from bridgewatcher.api.model import Cities
+
+TIERS = range(4, 9)
+RESOURCES = ("METALBAR", "PLANKS", "LEATHER", "CLOTH")
+# subcategory, crafting requirements as (resource, count)
+FAMILIES = {
+    "sword": (("METALBAR", 16), ("LEATHER", 8)),
+    "axe": (("METALBAR", 16), ("PLANKS", 8)),
+    "bow": (("PLANKS", 32),),
+    "cloth_armor": (("CLOTH", 16),),
+    "leather_armor": (("LEATHER", 16),),
+    "plate_armor": (("METALBAR", 16),),
+    "bags": (("CLOTH", 8), ("LEATHER", 8)),
+    "tools": (("METALBAR", 8), ("PLANKS", 8), ("LEATHER", 4), ("CLOTH", 4)),
+}
+CATEGORIES = {
+    "sword": "weapons",
+    "axe": "weapons",
+    "bow": "weapons",
+    "cloth_armor": "armors",
+    "leather_armor": "armors",
+    "plate_armor": "armors",
+    "bags": "bags",
+    "tools": "tools",
+}
+
+
+def get_product_id(tier: int, family: str, variant: int) -> str:
+    return f"T{tier}_{family.upper()}_{variant}"
+
+
+def make_items_dump(variants: int = 20) -> str:
+    resources = [
+        {
+            "@uniquename": f"T{tier}_{resource}{suffix}",
+            "@shopcategory": "resources",
+            "@shopsubcategory1": resource.lower(),
+            "@weight": "0.3",
+            "@maxstacksize": "999",
+        }
+        for tier in TIERS
+        for resource in RESOURCES
+        for suffix in ("", "_LEVEL1", "_LEVEL2", "_LEVEL3", "_LEVEL4")
+    ]
+
+    products = []
+    for family, requirements in FAMILIES.items():
+        for tier in TIERS:
+            for variant in range(variants):
+                products.append(
+                    {
+                        "@uniquename": get_product_id(tier, family, variant),
+                        "@shopcategory": CATEGORIES[family],
+                        "@shopsubcategory1": family,
+                        "@weight": str(round(1 + tier * 0.5, 1)),
+                        "@maxstacksize": "1",
+                        "craftingrequirements": {
+                            "craftresource": [
+                                {
+                                    "@uniquename": f"T{tier}_{resource}",
+                                    "@count": str(count),
+                                }
+                                for resource, count in requirements
+                            ]
+                        },
+                    }
+                )
+
+    return dumps({"items": {"simpleitem": resources, "equipmentitem": products}})
+
+
+def make_item_names_dump(variants: int = 20) -> str:
+    lines = []
+    for tier in TIERS:
+        for resource in RESOURCES:
+            lines.append(f"T{tier}_{resource} : Tier {tier} {resource.title()}")
+            for level in range(1, 5):
+                lines.append(
+                    f"T{tier}_{resource}_LEVEL{level}@{level} : "
+                    f"Tier {tier}.{level} {resource.title()}"
+                )
+        for family in FAMILIES:
+            for variant in range(variants):
+                id = get_product_id(tier, family, variant)
+                lines.append(f"{id} : Tier {tier} {family.title()} {variant}")
+                for level in range(1, 5):
+                    lines.append(
+                        f"{id}@{level} : Tier {tier}.{level} {family.title()} {variant}"
+                    )
+    return "\n".join(f"{i}: {line}" for i, line in enumerate(lines))
+
+
+def get_all_item_ids(variants: int = 20) -> list[str]:
+    ids = []
+    for tier in TIERS:
+        for resource in RESOURCES:
+            ids.append(f"T{tier}_{resource}")
+            ids.extend(f"T{tier}_{resource}_LEVEL{level}" for level in range(1, 5))
+        for family in FAMILIES:
+            for variant in range(variants):
+                id = get_product_id(tier, family, variant)
+                ids.append(id)
+                ids.extend(f"{id}@{level}" for level in range(1, 5))
+    return ids
+
+
+def _timestamp(age: timedelta) -> str:
+    return (datetime.now(timezone.utc) - age).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def make_city_prices(item_id: str, seed: int = 0) -> list[dict[str, Any]]:
+    rng = Random(f"{item_id}:{seed}")
+    base = rng.randint(1_000, 200_000)
+    prices = []
+    for city in Cities:
+        for quality in range(1, 6):
+            price = int(base * rng.uniform(0.8, 1.3) * (1 + (quality - 1) * 0.2))
+            date = _timestamp(timedelta(minutes=rng.randint(0, 600)))
+            prices.append(
+                {
+                    "item_id": item_id,
+                    "city": city.title(),
+                    "quality": quality,
+                    "sell_price_min": price,
+                    "sell_price_min_date": date,
+                    "sell_price_max": int(price * 1.1),
+                    "sell_price_max_date": date,
+                    "buy_price_min": int(price * 0.7),
+                    "buy_price_min_date": date,
+                    "buy_price_max": int(price * 0.9),
+                    "buy_price_max_date": date,
+                }
+            )
+    return prices
+
+
+# Two weeks of daily points for every market and quality, some of the cities
+# barely trade the item at all and skip days
+def make_item_history(item_id: str, seed: int = 0) -> list[dict[str, Any]]:
+    rng = Random(f"history:{item_id}:{seed}")
+    base = rng.randint(1_000, 200_000)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0)
+    histories = []
+    for city in Cities:
+        volume = rng.choice((0.2, 2, 20, 200))
+        for quality in range(1, 6):
+            data = []
+            for days in range(14, -1, -1):
+                count = round(volume * rng.uniform(0, 2) / quality)
+                if count == 0:
+                    continue
+                data.append(
+                    {
+                        "item_count": count,
+                        "avg_price": int(base * rng.uniform(0.8, 1.3)),
+                        "timestamp": (today - timedelta(days=days)).strftime(
+                            "%Y-%m-%dT%H:%M:%S"
+                        ),
+                    }
+                )
+            histories.append(
+                {
+                    "location": city.title(),
+                    "item_id": item_id,
+                    "quality": quality,
+                    "data": data,
+                }
+            )
+    return histories
+
+
+def make_gold_prices(count: int = 24) -> list[dict[str, Any]]:
+    rng = Random("gold")
+    return [
+        {
+            "price": rng.randint(4_000, 6_000),
+            "timestamp": _timestamp(timedelta(hours=i)),
+        }
+        for i in range(count)
+    ]
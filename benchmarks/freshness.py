@@ -0,0 +1,148 @@
+# Replays a simulated day of price uploads and lookups against the flat item
+# expiration and the adaptive one, with the clock driven by the simulation
+# instead of waiting it out. Items get uploaded to anywhere from every few
+# minutes to once a day and looked up anywhere from every few seconds to once
+# an hour. The report has the upstream requests each of them ends up making
+# and how many of the answers had newer prices uploaded already:
+#
+#   python benchmarks/freshness.py --items 2000 --hours 24
+from argparse import ArgumentParser, Namespace
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from json import dumps
+from pathlib import Path
+from random import Random
+from statistics import mean, quantiles
+from sys import stderr
+from typing import Any
+
+from bridgewatcher.api import AlbionOnline
+from bridgewatcher.api.freshness import AdaptiveExpiration, Freshness
+
+
+@dataclass
+class SimulatedItem:
+    uploads: list[float]
+    lookups: list[float]
+
+
+@dataclass
+class Outcome:
+    requests: int = 0
+    stale_answers: int = 0
+    answers: int = 0
+    # seconds the newer prices of every stale answer had been around for
+    staleness: list[float] = field(default_factory=list)
+    ttls: list[int] = field(default_factory=list)
+
+
+def get_log_uniform(rng: Random, low: float, high: float) -> float:
+    return low * (high / low) ** rng.random()
+
+
+def make_events(rng: Random, interval: float, duration: float) -> list[float]:
+    events = []
+    now = rng.expovariate(1 / interval)
+    while now < duration:
+        events.append(now)
+        now += rng.expovariate(1 / interval)
+    return events
+
+
+def make_items(args: Namespace) -> list[SimulatedItem]:
+    rng = Random(args.seed)
+    duration = args.hours * 60 * 60
+    return [
+        SimulatedItem(
+            make_events(rng, get_log_uniform(rng, 120, 24 * 60 * 60), duration),
+            make_events(rng, get_log_uniform(rng, 5, 60 * 60), duration),
+        )
+        for _ in range(args.items)
+    ]
+
+
+def replay(item: SimulatedItem, outcome: Outcome, get_ttl: Any) -> None:
+    fetched_at = expires_at = -1.0
+    freshness: Freshness | None = None
+    for now in item.lookups:
+        uploaded = bisect_right(item.uploads, now)
+        if now >= expires_at:
+            outcome.requests += 1
+            newest = item.uploads[uploaded - 1] if uploaded else None
+            freshness, ttl = get_ttl(freshness, uploaded, newest, now)
+            fetched_at, expires_at = now, now + ttl
+            outcome.ttls.append(ttl)
+
+        outcome.answers += 1
+        missed = bisect_right(item.uploads, fetched_at)
+        if missed < uploaded:
+            outcome.stale_answers += 1
+            outcome.staleness.append(now - item.uploads[missed])
+
+
+def summarize(outcome: Outcome) -> dict[str, Any]:
+    return {
+        "upstream_requests": outcome.requests,
+        "answers": outcome.answers,
+        "stale_answers_pct": round(
+            outcome.stale_answers * 100 / max(outcome.answers, 1), 2
+        ),
+        "staleness_p50_s": (
+            round(quantiles(outcome.staleness, n=100, method="inclusive")[49], 1)
+            if len(outcome.staleness) > 1
+            else 0
+        ),
+        "mean_ttl_s": round(mean(outcome.ttls), 1) if outcome.ttls else 0,
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    items = make_items(args)
+    baseline = AlbionOnline.ITEM_CACHE_EXPIRATION_PERIOD
+    expiration = AdaptiveExpiration("simulated", baseline)
+
+    def get_flat_ttl(
+        freshness: Freshness | None, version: int, newest: float | None, now: float
+    ) -> tuple[None, int]:
+        return None, baseline
+
+    def get_adaptive_ttl(
+        freshness: Freshness | None, version: int, newest: float | None, now: float
+    ) -> tuple[Freshness, int]:
+        updated = expiration._update(freshness, version, newest, int(now))
+        return updated, updated.ttl
+
+    flat, adaptive = Outcome(), Outcome()
+    for item in items:
+        replay(item, flat, get_flat_ttl)
+        replay(item, adaptive, get_adaptive_ttl)
+
+    results = {"flat": summarize(flat), "adaptive": summarize(adaptive)}
+    saved = flat.requests - adaptive.requests
+    print(
+        f"adaptive expiration saved {saved} of {flat.requests} upstream requests "
+        f"({saved * 100 / max(flat.requests, 1):.1f}%)",
+        file=stderr,
+    )
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "floor": expiration.floor,
+        "ceiling": expiration.ceiling,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# A local stand-in of the Discord REST api and gateway, enough of them for
+# discord.py to log in, IDENTIFY any number of shards and receive its guilds,
+# and to answer interactions. Point the bot at it with
+# DISCORD_API_BASE_URL=<api_url> and DISCORD_GATEWAY_URL=<gateway_url>
+from asyncio import Future, get_running_loop
+from collections import Counter
+from datetime import datetime, timezone
+from json import dumps
+from typing import Any
+
+from aiohttp import WSMsgType, web
+
+APPLICATION_ID = "1000000000000000000"
+HEARTBEAT_INTERVAL = 41250
+
+
+def get_guild_id(i: int) -> int:
+    # the shard of a guild is (guild_id >> 22) % shard_count
+    return (i + 1) << 22
+
+
+def get_shard_id(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def make_user() -> dict[str, Any]:
+    return {
+        "id": APPLICATION_ID,
+        "username": "bridgewatcher",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": True,
+        "flags": 0,
+    }
+
+
+def make_guild(guild_id: int) -> dict[str, Any]:
+    return {
+        "id": str(guild_id),
+        "name": f"Guild {guild_id >> 22}",
+        "owner_id": "1",
+        "member_count": 10,
+        "unavailable": False,
+        "roles": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "channels": [],
+        "threads": [],
+        "members": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "soundboard_sounds": [],
+    }
+
+
+# discord.py only parses bodies whose content type is exactly this, without
+# the charset aiohttp adds on its own
+def json_response(data: Any) -> web.Response:
+    return web.Response(body=dumps(data), headers={"Content-Type": "application/json"})
+
+
+def make_message(message_id: int) -> dict[str, Any]:
+    return {
+        "id": str(message_id),
+        "channel_id": "1",
+        "type": 0,
+        "content": "",
+        "author": make_user(),
+        "embeds": [],
+        "attachments": [],
+        "components": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "flags": 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "edited_timestamp": None,
+    }
+
+
+class FakeDiscord:
+    def __init__(self, guilds: int, shard_count: int) -> None:
+        self.guilds = [get_guild_id(i) for i in range(guilds)]
+        self.shard_count = shard_count
+        self.requests: Counter[str] = Counter()
+        # shard id -> how many times it has IDENTIFY'd
+        self.identified: Counter[int] = Counter()
+        # interaction token -> resolved once its answer arrives over REST
+        self.answers: dict[str, Future[None]] = {}
+        self._messages = 0
+        self._runner: web.AppRunner | None = None
+        self.api_url = ""
+        self.gateway_url = ""
+
+    async def _get_gateway(self, request: web.Request) -> web.Response:
+        self.requests["gateway"] += 1
+        return json_response({"url": self.gateway_url})
+
+    async def _get_bot_gateway(self, request: web.Request) -> web.Response:
+        self.requests["gateway_bot"] += 1
+        return json_response(
+            {
+                "url": self.gateway_url,
+                "shards": self.shard_count,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": 16,
+                },
+            }
+        )
+
+    async def _get_user(self, request: web.Request) -> web.Response:
+        self.requests["user"] += 1
+        return json_response(make_user())
+
+    async def _get_application(self, request: web.Request) -> web.Response:
+        self.requests["application"] += 1
+        return json_response(
+            {
+                "id": APPLICATION_ID,
+                "name": "bridgewatcher",
+                "description": "",
+                "icon": None,
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "verify_key": "0" * 64,
+                "owner": {**make_user(), "id": "1", "bot": False},
+                "flags": 0,
+            }
+        )
+
+    async def _sync_commands(self, request: web.Request) -> web.Response:
+        self.requests["sync"] += 1
+        commands = await request.json()
+        return json_response(
+            [
+                {
+                    **command,
+                    "id": str(i + 1),
+                    "application_id": APPLICATION_ID,
+                    "version": "1",
+                }
+                for i, command in enumerate(commands)
+            ]
+        )
+
+    def expect_answer(self, token: str) -> Future[None]:
+        answer = self.answers[token] = get_running_loop().create_future()
+        return answer
+
+    def _answer(self, request: web.Request, name: str) -> web.Response:
+        self.requests[name] += 1
+        answer = self.answers.pop(request.match_info["token"], None)
+        if answer is not None and not answer.done():
+            answer.set_result(None)
+        self._messages += 1
+        return json_response(make_message(self._messages))
+
+    async def _create_interaction_response(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.requests["callback"] += 1
+        return json_response({"interaction": {"id": request.match_info["id"]}})
+
+    async def _edit_original(self, request: web.Request) -> web.Response:
+        await request.read()
+        return self._answer(request, "edit_original")
+
+    async def _get_original(self, request: web.Request) -> web.Response:
+        self.requests["get_original"] += 1
+        self._messages += 1
+        return json_response(make_message(self._messages))
+
+    async def _send_followup(self, request: web.Request) -> web.Response:
+        await request.read()
+        return self._answer(request, "followup")
+
+    async def _dispatch(
+        self, ws: web.WebSocketResponse, sequence: int, event: str, data: Any
+    ) -> int:
+        await ws.send_str(dumps({"op": 0, "s": sequence, "t": event, "d": data}))
+        return sequence + 1
+
+    async def _serve_gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(
+            dumps({"op": 10, "d": {"heartbeat_interval": HEARTBEAT_INTERVAL}})
+        )
+
+        sequence = 1
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+
+            payload = message.json()
+            if payload["op"] == 1:
+                await ws.send_str(dumps({"op": 11}))
+            elif payload["op"] == 2:
+                shard_id, shard_count = payload["d"].get("shard", [0, 1])
+                self.identified[shard_id] += 1
+                guilds = [
+                    guild_id
+                    for guild_id in self.guilds
+                    if get_shard_id(guild_id, shard_count) == shard_id
+                ]
+                sequence = await self._dispatch(
+                    ws,
+                    sequence,
+                    "READY",
+                    {
+                        "v": 10,
+                        "user": make_user(),
+                        "guilds": [
+                            {"id": str(guild_id), "unavailable": True}
+                            for guild_id in guilds
+                        ],
+                        "session_id": f"session-{shard_id}",
+                        "resume_gateway_url": self.gateway_url,
+                        "shard": [shard_id, shard_count],
+                        "application": {"id": APPLICATION_ID, "flags": 0},
+                    },
+                )
+                for guild_id in guilds:
+                    sequence = await self._dispatch(
+                        ws, sequence, "GUILD_CREATE", make_guild(guild_id)
+                    )
+        return ws
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/api/v10/gateway", self._get_gateway)
+        app.router.add_get("/api/v10/gateway/bot", self._get_bot_gateway)
+        app.router.add_get("/api/v10/users/@me", self._get_user)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self._get_application)
+        app.router.add_put(
+            "/api/v10/applications/{application_id}/commands", self._sync_commands
+        )
+        app.router.add_post(
+            "/api/v10/interactions/{id}/{token}/callback",
+            self._create_interaction_response,
+        )
+        original = "/api/v10/webhooks/{application_id}/{token}/messages/@original"
+        app.router.add_patch(original, self._edit_original)
+        app.router.add_get(original, self._get_original)
+        app.router.add_post(
+            "/api/v10/webhooks/{application_id}/{token}", self._send_followup
+        )
+        app.router.add_get("/gateway", self._serve_gateway)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.api_url = f"http://127.0.0.1:{port}/api/v10"
+        self.gateway_url = f"ws://127.0.0.1:{port}/gateway"
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,77 @@
+# Import-time budget for the bridgewatcher package. Every module is imported in
+# a fresh interpreter with -X importtime and the best of a few runs is compared
+# against its budget. Exits with 1 if any module got slower than allowed or
+# pulled in a database client it doesn't need:
+#
+#   python benchmarks/import_time.py [--runs 5] [--scale 1.0]
+from argparse import ArgumentParser
+from json import dumps
+from subprocess import run
+from sys import executable, exit
+
+# cumulative import time in milliseconds
+BUDGETS = {
+    "bridgewatcher.db": 100,
+    "bridgewatcher.db.schema": 500,
+    "bridgewatcher.market": 500,
+    "bridgewatcher.discord.formatting": 700,
+    "bridgewatcher.discord": 700,
+    "bridgewatcher.discord.cogs.market": 900,
+}
+
+# these are only needed once the bot actually talks to the databases
+FORBIDDEN = ("pymongo", "redis")
+
+
+def measure(module: str) -> tuple[float, set[str]]:
+    result = run(
+        [executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative = int(cumulative_us)
+
+    return cumulative / 1000, imported
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    failed = False
+    results = {}
+    for module, budget in BUDGETS.items():
+        measurements = [measure(module) for _ in range(args.runs)]
+        best = min(elapsed for elapsed, _ in measurements)
+        forbidden = sorted(set(FORBIDDEN) & measurements[0][1])
+        within_budget = best <= budget * args.scale
+
+        results[module] = {
+            "milliseconds": round(best, 1),
+            "budget": budget * args.scale,
+            "forbidden_imports": forbidden,
+        }
+        if not within_budget or forbidden:
+            failed = True
+
+    print(dumps(results, indent=2))
+    if failed:
+        print("Import time budget exceeded")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+# Replays interactions against the HTTP interactions endpoint the way Discord
+# delivers them: signed POSTs arriving at a fixed average rate no matter how
+# fast they're answered. Each entry in --workers starts that many copies of
+# interactions.py sharing one port against local stand-ins of Discord, Redis,
+# AODP and the item dumps, then runs every rate in --rates. An interaction is
+# done once its answer is in, whether that's the body of the HTTP response or
+# a REST call made after deferring it:
+#
+#   python benchmarks/interactions.py --workers 1 2 4 --rates 50 100 200
+#
+# Commands come from the same mix as load.py unless --replay points at a file
+# with the data of one application command interaction per line, e.g.
+#   {"name": "utc", "type": 1}
+from argparse import ArgumentParser, Namespace
+from asyncio import (
+    Task,
+    create_subprocess_exec,
+    create_task,
+    get_running_loop,
+    run,
+    sleep,
+    wait,
+    wait_for,
+)
+from asyncio.subprocess import DEVNULL, Process
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from itertools import count, cycle
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from random import Random
+from signal import SIGTERM
+from socket import socket
+from sys import executable, stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from typing import Any, Iterator
+
+from aiohttp import ClientError, ClientSession, TCPConnector
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from discord import InteractionResponseType, InteractionType
+
+from bridgewatcher.api.model import Qualities
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.schema import DiscordServer
+from bridgewatcher.db.seed.run import (
+    get_catalog_version,
+    get_dump_hash,
+    seed,
+    update_hash,
+)
+
+from gateway import APPLICATION_ID, FakeDiscord
+from load import SATURATION_RATIO, Zipf, get_item_names, parse_weights, summarize
+from stubs import FakeAodp, FakeDumps, FakeRedis, FakeRedisServer
+
+ROOT = Path(__file__).parent.parent
+DISCORD_EPOCH = 1420070400000
+POLL_INTERVAL = 0.1
+SHUTDOWN_TIMEOUT = 30
+ANSWERED = (
+    InteractionResponseType.channel_message.value,
+    InteractionResponseType.message_update.value,
+)
+
+
+def get_free_port() -> int:
+    with socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_snowflakes() -> Iterator[int]:
+    for increment in count():
+        yield ((int(time() * 1000) - DISCORD_EPOCH) << 22) | (increment & 0xFFF)
+
+
+def make_option(name: str, value: Any) -> dict[str, Any]:
+    # string, integer and boolean options
+    option_type = {str: 3, int: 4, bool: 5}[type(value)]
+    return {"name": name, "type": option_type, "value": value}
+
+
+def make_interaction(
+    interaction_id: int, guild_id: int, user_id: int, data: dict[str, Any]
+) -> dict[str, Any]:
+    user = {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+    }
+    return {
+        "id": str(interaction_id),
+        "application_id": APPLICATION_ID,
+        "type": InteractionType.application_command.value,
+        "token": f"token-{interaction_id}",
+        "version": 1,
+        "guild_id": str(guild_id),
+        "guild": {"id": str(guild_id), "locale": "en-US", "features": []},
+        "channel_id": "1",
+        "channel": {
+            "id": "1",
+            "type": 0,
+            "name": "general",
+            "guild_id": str(guild_id),
+            "position": 0,
+            "permission_overwrites": [],
+        },
+        "member": {
+            "user": user,
+            "roles": [],
+            "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+            "permissions": "0",
+        },
+        "app_permissions": "0",
+        "locale": "en-US",
+        "guild_locale": "en-US",
+        "entitlements": [],
+        "authorizing_integration_owners": {"0": str(guild_id)},
+        "context": 0,
+        "attachment_size_limit": 10 * 1024 * 1024,
+        "data": {"id": "1", "type": 1, **data},
+    }
+
+
+@dataclass
+class Step:
+    rate: float
+    started: float = 0.0
+    finished: float = 0.0
+    acks: list[float] = field(default_factory=list)
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    responses: Counter[str] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+    offered: int = 0
+
+    @property
+    def completed(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+
+class ReplayClient:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.rng = Random(args.seed)
+        self.key = Ed25519PrivateKey.generate()
+        self.snowflakes = make_snowflakes()
+        self.items = Zipf(get_item_names(), args.zipf, self.rng)
+        self.mix = parse_weights(args.mix)
+        self.replay = (
+            cycle(
+                [
+                    loads(line)
+                    for line in Path(args.replay).read_text().splitlines()
+                    if line.strip()
+                ]
+            )
+            if args.replay
+            else None
+        )
+        self.aodp = FakeAodp(args.upstream_latency)
+        self.dumps = FakeDumps()
+        self.url = ""
+        self._session: ClientSession | None = None
+
+    def quality(self) -> int:
+        return self.rng.choice(list(Qualities)).value
+
+    # the data of an application command interaction, what's inside is
+    # exactly what Discord sends for these commands
+    def make_command(self) -> dict[str, Any]:
+        if self.replay is not None:
+            return next(self.replay)
+
+        name = self.rng.choices(list(self.mix), list(self.mix.values()))[0]
+        options = {
+            "price": lambda: [
+                make_option("item_name", self.items.pick()),
+                make_option("quality", self.quality()),
+            ],
+            "flip": lambda: [
+                make_option("item_name", self.items.pick()),
+                make_option("quality", self.quality()),
+                make_option("has_premium", True),
+            ],
+            "craft": lambda: [
+                make_option("item_name", self.items.pick()),
+                make_option("has_premium", True),
+                make_option("count", self.rng.randint(1, 10)),
+            ],
+        }.get(name, lambda: [])()
+        return {"name": name, "options": options}
+
+    async def prepare(self, directory: Path) -> None:
+        await self.aodp.start()
+        await self.dumps.start()
+
+        # the workers find the catalog seeded already, the hash of the dump
+        # they download matches the stored one
+        environ["STORAGE_BACKEND"] = "sqlite"
+        environ["SQLITE_PATH"] = str(directory / "interactions.db")
+        backends.configure(redis=FakeRedis(), store=Backends().store)  # type: ignore
+        hash = get_catalog_version(get_dump_hash(self.dumps.items))
+        await seed(self.dumps.items, self.dumps.names, hash, True)
+        await update_hash(hash)
+        servers = parse_weights(self.args.servers)
+        for guild_id in range(1, self.args.guilds + 1):
+            server = self.rng.choices(list(servers), list(servers.values()))[0]
+            await backends.store.insert_server(
+                DiscordServer(guild_id, server).to_mongo()
+            )
+        await backends.close()
+
+    def get_env(
+        self, discord: FakeDiscord, redis: FakeRedisServer, port: int, directory: Path
+    ) -> dict[str, str]:
+        public_key = self.key.public_key().public_bytes_raw().hex()
+        return {
+            **environ,
+            "PYTHONPATH": str(ROOT / "src"),
+            "DISCORD_TOKEN": "benchmark",
+            "DEBUG": "0",
+            "DISCORD_API_BASE_URL": discord.api_url,
+            "DISCORD_PUBLIC_KEY": public_key,
+            "REDIS_HOST": "127.0.0.1",
+            "REDIS_PORT": str(redis.port),
+            "REDIS_PASSWORD": "benchmark",
+            "STORAGE_BACKEND": "sqlite",
+            "SQLITE_PATH": str(directory / "interactions.db"),
+            "ITEMS_DUMP_URL": f"{self.dumps.url}/items.json",
+            "ITEM_NAMES_DUMP_URL": f"{self.dumps.url}/items.txt",
+            "AODP_BASE_URL": self.aodp.url,
+            "AODP_REQUESTS_PER_MINUTE": "0",
+            "ENDPOINT_HOST": "127.0.0.1",
+            "ENDPOINT_PORT": str(port),
+            "COMPUTE_WORKERS": "0",
+            "METRICS_PORT": "",
+            "LOOP_STALL_THRESHOLD": "0",
+        }
+
+    async def post(self, payload: dict[str, Any]) -> dict[str, Any]:
+        assert self._session is not None
+        body = dumps(payload).encode("utf-8")
+        timestamp = str(int(time()))
+        signature = self.key.sign(timestamp.encode("utf-8") + body).hex()
+        async with self._session.post(
+            self.url,
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-Signature-Ed25519": signature,
+                "X-Signature-Timestamp": timestamp,
+            },
+        ) as res:
+            res.raise_for_status()
+            return await res.json()
+
+    async def wait_until_ready(
+        self, discord: FakeDiscord, workers: list[Process]
+    ) -> None:
+        deadline = perf_counter() + self.args.startup_timeout
+        # every worker fetches the application once it's logged in
+        while discord.requests["application"] < len(workers):
+            if perf_counter() > deadline:
+                raise TimeoutError("The workers didn't log in in time")
+            if any(worker.returncode is not None for worker in workers):
+                raise RuntimeError("A worker exited while starting")
+            await sleep(POLL_INTERVAL)
+
+        while True:
+            try:
+                if await self.post({"type": InteractionType.ping.value}) == {
+                    "type": InteractionResponseType.pong.value
+                }:
+                    break
+            except ClientError:
+                pass
+            if perf_counter() > deadline:
+                raise TimeoutError("The endpoint didn't answer in time")
+            await sleep(POLL_INTERVAL)
+        await sleep(self.args.warmup)
+
+    async def invoke(self, step: Step, discord: FakeDiscord) -> None:
+        data = self.make_command()
+        interaction = make_interaction(
+            next(self.snowflakes),
+            self.rng.randint(1, self.args.guilds),
+            self.rng.randint(1, 10**6),
+            data,
+        )
+        # registered before sending, the answer may arrive before the response
+        answer = discord.expect_answer(interaction["token"])
+        name = data["name"]
+        started = perf_counter()
+        try:
+            response = await self.post(interaction)
+            step.acks.append((perf_counter() - started) * 1000)
+            if response["type"] in ANSWERED:
+                step.responses["body"] += 1
+            else:
+                step.responses["deferred"] += 1
+                await wait_for(answer, self.args.answer_timeout)
+        except Exception as e:
+            step.errors[f"{name}: {type(e).__name__}"] += 1
+            return
+        finally:
+            discord.answers.pop(interaction["token"], None)
+        step.latencies[name].append((perf_counter() - started) * 1000)
+
+    async def run_step(self, rate: float, discord: FakeDiscord) -> Step:
+        step = Step(rate)
+        tasks: set[Task] = set()
+
+        loop = get_running_loop()
+        step.started = loop.time()
+        next_arrival = step.started
+        deadline = step.started + self.args.duration
+        while True:
+            next_arrival += self.rng.expovariate(rate)
+            if next_arrival >= deadline:
+                break
+            await sleep(max(0.0, next_arrival - loop.time()))
+
+            task = create_task(self.invoke(step, discord))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            step.offered += 1
+
+        if tasks:
+            await wait(tasks, timeout=self.args.answer_timeout)
+        step.finished = loop.time()
+        return step
+
+    async def _stop(self, workers: list[Process]) -> None:
+        for worker in workers:
+            if worker.returncode is None:
+                worker.send_signal(SIGTERM)
+        for worker in workers:
+            try:
+                await wait_for(worker.wait(), SHUTDOWN_TIMEOUT)
+            except TimeoutError:
+                worker.kill()
+                await worker.wait()
+
+    async def run_workers(self, count: int, directory: Path) -> list[dict[str, Any]]:
+        redis_server = FakeRedisServer(FakeRedis())
+        discord = FakeDiscord(0, 1)
+        await redis_server.start()
+        await discord.start()
+
+        port = get_free_port()
+        self.url = f"http://127.0.0.1:{port}/interactions"
+        env = self.get_env(discord, redis_server, port, directory)
+        workers = [
+            await create_subprocess_exec(
+                executable,
+                str(ROOT / "interactions.py"),
+                cwd=directory,
+                env=env,
+                stdout=DEVNULL,
+                stderr=None if self.args.verbose else DEVNULL,
+            )
+            for _ in range(count)
+        ]
+        connector = TCPConnector(limit=self.args.connections)
+        self._session = ClientSession(connector=connector)
+        steps = []
+        try:
+            await self.wait_until_ready(discord, workers)
+            for rate in self.args.rates:
+                before = Counter(discord.requests)
+                step = await self.run_step(rate, discord)
+                result = report_step(step, discord.requests - before)
+                steps.append(result)
+                print(
+                    f"{count} workers, {rate}/s offered: "
+                    f"{result["throughput"]}/s done, "
+                    f"p99 {result["latency"]["p99_ms"]}ms, "
+                    f"{sum(step.errors.values())} errors",
+                    file=stderr,
+                )
+        finally:
+            await self._session.close()
+            await self._stop(workers)
+            await discord.close()
+            await redis_server.close()
+        return steps
+
+    async def close(self) -> None:
+        await self.aodp.close()
+        await self.dumps.close()
+
+
+def report_step(step: Step, requests: Counter[str]) -> dict[str, Any]:
+    elapsed = step.finished - step.started
+    all_latencies = [
+        latency for latencies in step.latencies.values() for latency in latencies
+    ]
+    return {
+        "offered_rate": step.rate,
+        "offered": step.offered,
+        "completed": step.completed,
+        "throughput": round(step.completed / elapsed, 2),
+        "errors": dict(step.errors),
+        "responses": dict(step.responses),
+        "ack": summarize(step.acks),
+        "latency": summarize(all_latencies),
+        "commands": {
+            name: summarize(latencies) for name, latencies in step.latencies.items()
+        },
+        "discord_requests": dict(requests),
+        "discord_requests_per_command": round(
+            sum(requests.values()) / max(step.completed, 1), 3
+        ),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--rates", nargs="+", type=float, default=[25, 50, 100])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--answer-timeout", type=float, default=30.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--zipf", type=float, default=1.1, help="item popularity skew")
+    parser.add_argument(
+        "--mix", nargs="+", default=["price=5", "flip=3", "craft=2", "utc=0.5"]
+    )
+    parser.add_argument(
+        "--servers", nargs="+", default=["west=6", "europe=3", "east=1"]
+    )
+    parser.add_argument("--replay", help="interaction data to replay, one per line")
+    parser.add_argument("--upstream-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    client = ReplayClient(args)
+    results = {}
+    with TemporaryDirectory() as directory:
+        # the log files are relative to the working directory
+        (Path(directory) / "logs").mkdir()
+        await client.prepare(Path(directory))
+        try:
+            for workers in args.workers:
+                results[workers] = await client.run_workers(workers, Path(directory))
+        finally:
+            await client.close()
+
+    saturated_at = {
+        workers: next(
+            (
+                step["offered_rate"]
+                for step in steps
+                if step["throughput"] < step["offered_rate"] * SATURATION_RATIO
+            ),
+            None,
+        )
+        for workers, steps in results.items()
+    }
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "saturated_at": saturated_at,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
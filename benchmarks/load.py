@@ -0,0 +1,319 @@
+# Open-loop load generator: commands arrive at a fixed average rate no matter
+# how fast the bot answers them, which is what Discord does as well. The cog
+# handlers are called directly with synthetic interactions while Discord REST,
+# AODP and Redis are local stand-ins and the catalog lives in SQLite. Each
+# rate in --rates is a separate step, the report tells where the achieved
+# throughput stops keeping up with the offered one:
+#
+#   python benchmarks/load.py --rates 25 50 100 200 --duration 20 \
+#       --upstream-latency 0.15 --discord-latency 0.05
+from argparse import ArgumentParser, Namespace
+from asyncio import Task, create_task, get_running_loop, run, sleep, wait
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from json import dumps
+from os import environ
+from pathlib import Path
+from random import Random
+from statistics import quantiles
+from sys import stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Awaitable, Callable
+
+from discord.app_commands import Choice
+
+from bridgewatcher.api.model import Qualities
+from bridgewatcher.compute import COMPUTE
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.catalog import mark_catalog_ready
+from bridgewatcher.db.schema import DiscordServer
+from bridgewatcher.db.seed.run import get_dump_hash, seed
+from bridgewatcher.discord.cogs.ext import ExtCog
+from bridgewatcher.discord.cogs.market import MarketCog
+from bridgewatcher.metrics import ADMISSION_SHED, CACHE_REQUESTS, enable_metrics
+
+from fixtures import FAMILIES, TIERS, make_item_names_dump, make_items_dump
+from stubs import DiscordCalls, FakeAodp, FakeInteraction, FakeRedis
+
+# the same variants the fixtures are generated with
+VARIANTS = 20
+SATURATION_RATIO = 0.95
+
+
+def parse_weights(values: list[str]) -> dict[str, float]:
+    weights = {}
+    for value in values:
+        name, _, weight = value.partition("=")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+# Every name here matches exactly one item, so the guesser never stops to
+# wait for somebody to pick from a list. Variant 1 is left out because it's
+# also a part of the names of variants 10 to 19
+def get_item_names() -> list[str]:
+    return [
+        f"Tier {tier} {family.title()} {variant}"
+        for tier in TIERS
+        for family in FAMILIES
+        for variant in range(VARIANTS)
+        if variant != 1
+    ]
+
+
+class Zipf:
+    def __init__(self, values: list[str], s: float, rng: Random) -> None:
+        self.values = values[:]
+        rng.shuffle(self.values)
+        self.rng = rng
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, len(self.values) + 1):
+            total += 1 / rank**s
+            self.cum_weights.append(total)
+
+    def pick(self) -> str:
+        return self.rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+@dataclass
+class Step:
+    rate: float
+    started: float = 0.0
+    finished: float = 0.0
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Counter[str] = field(default_factory=Counter)
+    offered: int = 0
+
+    @property
+    def completed(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+
+class LoadGenerator:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.rng = Random(args.seed)
+        self.aodp = FakeAodp(args.upstream_latency)
+        self.redis = FakeRedis(args.redis_latency)
+        self.rest = DiscordCalls(args.discord_latency)
+        self.market = MarketCog()
+        self.ext = ExtCog()
+        self.items = Zipf(get_item_names(), args.zipf, self.rng)
+        self.mix = parse_weights(args.mix)
+        self.commands: dict[str, Callable[[Any], Awaitable[None]]] = {
+            "price": self.price,
+            "flip": self.flip,
+            "craft": self.craft,
+            "utc": self.utc,
+            "conf": self.conf,
+        }
+        unknown = set(self.mix) - set(self.commands)
+        if unknown:
+            raise ValueError(f"Unknown commands in the mix: {unknown}")
+
+    async def start(self, directory: str) -> None:
+        environ["STORAGE_BACKEND"] = "sqlite"
+        environ["SQLITE_PATH"] = str(Path(directory) / "load.db")
+        environ["AODP_BASE_URL"] = await self.aodp.start()
+        # the budget would throttle the offered load and add redis round trips
+        environ["AODP_REQUESTS_PER_MINUTE"] = "0"
+        backends.configure(redis=self.redis, store=Backends().store)  # type: ignore
+        enable_metrics()
+
+        items = make_items_dump(VARIANTS)
+        await seed(items, make_item_names_dump(VARIANTS), get_dump_hash(items), True)
+        mark_catalog_ready()
+
+        servers = parse_weights(self.args.servers)
+        for guild_id in range(1, self.args.guilds + 1):
+            server = self.rng.choices(list(servers), list(servers.values()))[0]
+            await backends.store.insert_server(
+                DiscordServer(guild_id, server).to_mongo()
+            )
+
+    async def close(self) -> None:
+        await backends.close()
+        await self.aodp.close()
+        COMPUTE.shutdown()
+
+    def quality(self) -> Choice[int]:
+        quality = self.rng.choice(list(Qualities))
+        return Choice(name=quality.name.lower(), value=quality.value)
+
+    async def price(self, interaction: Any) -> None:
+        await self.market.get_item_prices.callback(  # type: ignore
+            self.market, interaction, self.items.pick(), self.quality()
+        )
+
+    async def flip(self, interaction: Any) -> None:
+        await self.market.flip_item.callback(  # type: ignore
+            self.market, interaction, self.items.pick(), self.quality(), True
+        )
+
+    async def craft(self, interaction: Any) -> None:
+        await self.market.craft_item.callback(  # type: ignore
+            self.market, interaction, self.items.pick(), True, self.rng.randint(1, 10)
+        )
+
+    async def utc(self, interaction: Any) -> None:
+        await self.ext.show_utc.callback(self.ext, interaction)  # type: ignore
+
+    async def conf(self, interaction: Any) -> None:
+        await self.ext.show_conf.callback(self.ext, interaction)  # type: ignore
+
+    async def invoke(self, step: Step, name: str) -> None:
+        interaction = FakeInteraction(
+            self.rng.randint(1, self.args.guilds), self.rng.randint(1, 10**6), self.rest
+        )
+        started = perf_counter()
+        try:
+            await self.commands[name](interaction)
+        except Exception as e:
+            step.errors[f"{name}: {type(e).__name__}"] += 1
+            return
+        step.latencies[name].append((perf_counter() - started) * 1000)
+
+    async def run_step(self, rate: float) -> Step:
+        await self.redis.flushall()
+        step = Step(rate)
+        names, weights = list(self.mix), list(self.mix.values())
+        tasks: set[Task] = set()
+
+        loop = get_running_loop()
+        step.started = loop.time()
+        next_arrival = step.started
+        deadline = step.started + self.args.duration
+        while True:
+            next_arrival += self.rng.expovariate(rate)
+            if next_arrival >= deadline:
+                break
+            await sleep(max(0.0, next_arrival - loop.time()))
+
+            name = self.rng.choices(names, weights)[0]
+            task = create_task(self.invoke(step, name))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            step.offered += 1
+
+        if tasks:
+            await wait(tasks, timeout=self.args.drain_timeout)
+        step.finished = loop.time()
+        return step
+
+    def get_counters(self) -> dict[str, float]:
+        return {
+            "upstream": sum(self.aodp.requests.values()),
+            "discord": sum(self.rest.calls.values()),
+            "redis": self.redis.round_trips,
+            "hits": CACHE_REQUESTS.get(family="item", result="hit"),
+            "misses": CACHE_REQUESTS.get(family="item", result="miss"),
+            "shed": sum(ADMISSION_SHED._values.values()),
+        }
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    if len(latencies) < 2:
+        latencies = latencies * 2 or [0.0, 0.0]
+    percentiles = quantiles(latencies, n=1000, method="inclusive")
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentiles[499], 2),
+        "p95_ms": round(percentiles[949], 2),
+        "p99_ms": round(percentiles[989], 2),
+        "p999_ms": round(percentiles[998], 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def report_step(
+    step: Step, before: dict[str, float], after: dict[str, float]
+) -> dict[str, Any]:
+    elapsed = step.finished - step.started
+    delta = {key: after[key] - before[key] for key in after}
+    lookups = delta["hits"] + delta["misses"]
+    all_latencies = [
+        latency for latencies in step.latencies.values() for latency in latencies
+    ]
+    return {
+        "offered_rate": step.rate,
+        "offered": step.offered,
+        "completed": step.completed,
+        "throughput": round(step.completed / elapsed, 2),
+        "errors": dict(step.errors),
+        "latency": summarize(all_latencies),
+        "commands": {
+            name: summarize(latencies) for name, latencies in step.latencies.items()
+        },
+        "upstream_requests": int(delta["upstream"]),
+        "upstream_requests_per_command": round(
+            delta["upstream"] / max(step.completed, 1), 3
+        ),
+        "discord_requests": int(delta["discord"]),
+        "redis_round_trips": int(delta["redis"]),
+        "cache_hit_ratio": round(delta["hits"] / lookups, 3) if lookups else None,
+        "shed": int(delta["shed"]),
+    }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--rates", nargs="+", type=float, default=[10, 25, 50, 100])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--zipf", type=float, default=1.1, help="item popularity skew")
+    parser.add_argument(
+        "--mix", nargs="+", default=["price=5", "flip=3", "craft=2", "utc=0.5"]
+    )
+    parser.add_argument(
+        "--servers", nargs="+", default=["west=6", "europe=3", "east=1"]
+    )
+    parser.add_argument("--upstream-latency", type=float, default=0.1)
+    parser.add_argument("--redis-latency", type=float, default=0.0005)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args)
+    steps = []
+    with TemporaryDirectory() as directory:
+        await generator.start(directory)
+        try:
+            for rate in args.rates:
+                before = generator.get_counters()
+                step = await generator.run_step(rate)
+                result = report_step(step, before, generator.get_counters())
+                steps.append(result)
+                print(
+                    f"{rate}/s offered: {result["throughput"]}/s done, "
+                    f"p99 {result["latency"]["p99_ms"]}ms, "
+                    f"{sum(step.errors.values())} errors, {result["shed"]} shed",
+                    file=stderr,
+                )
+        finally:
+            await generator.close()
+
+    saturated_at = next(
+        (
+            step["offered_rate"]
+            for step in steps
+            if step["throughput"] < step["offered_rate"] * SATURATION_RATIO
+        ),
+        None,
+    )
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "saturated_at": saturated_at,
+        "steps": steps,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,406 @@
+# Benchmarks the market engine end to end against local stand-ins: a fake
+# AODP server with configurable latency, an in-memory Redis and the embedded
+# SQLite store seeded from the fixtures or from recorded dumps. Results are
+# written as JSON, pass an earlier result file with --compare to see what
+# changed between two commits:
+#
+#   python benchmarks/market.py --output before.json
+#   python benchmarks/market.py --compare before.json --upstream-latency 0.05
+from argparse import ArgumentParser, Namespace
+from asyncio import run
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from platform import python_version
+from statistics import mean, quantiles
+from subprocess import DEVNULL, check_output
+from sys import stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Awaitable, Callable
+
+from dacite import from_dict
+
+from bridgewatcher.api import AlbionOnline, AlbionOnlineServers
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.compute import COMPUTE
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.catalog import mark_catalog_ready
+from bridgewatcher.db.schema import Item
+from bridgewatcher.db.seed.run import get_dump_hash, seed
+from bridgewatcher.discord.items import ItemGuesser
+from bridgewatcher.market import (
+    Crafter,
+    CraftSweeper,
+    InventoryPlanner,
+    MarketFlipper,
+    MarketQuery,
+    TransportPlanner,
+)
+from bridgewatcher.market.liquidity import LiquidityIndex, LiquidityRefresher
+from bridgewatcher.market.model import Cargo
+from bridgewatcher.market.transport import solve_haul
+from bridgewatcher.util.exc import InsufficientDataError
+
+from fixtures import (
+    get_product_id,
+    make_city_prices,
+    make_item_names_dump,
+    make_items_dump,
+)
+from reseed import make_patch
+from stubs import DiscordCalls, FakeAodp, FakeInteraction, FakeRedis
+
+# items with recipes of 1, 2 and 4 materials
+RECIPES = {1: "bow", 2: "sword", 4: "tools"}
+# each of them matches a single item, more than one would wait for a pick
+GUESSER_QUERIES = (
+    "Tier 6 Sword 3",
+    "Tier 4.2 Bags 7",
+    "Tier 8 Bow 12",
+    "Tier 5.1 Axe 7",
+)
+BATCH_SIZE = 16
+# silver, kg and slots of a haul
+HAUL = (10_000_000, 2_000.0, 48)
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[int], Awaitable[None]]
+    iterations: int
+    # runs before every iteration without being timed
+    reset: Callable[[], Awaitable[None]] | None = None
+    # calls made by a single iteration, the latencies are reported per call
+    calls: int = 1
+
+
+class MarketBenchmark:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.aodp = FakeAodp(args.upstream_latency)
+        self.redis = FakeRedis(args.redis_latency)
+        self.albion = AlbionOnline(AlbionOnlineServers.AMERICA)
+        self.ids = [
+            get_product_id(tier, family, variant)
+            for tier in range(4, 9)
+            for family in ("sword", "bow", "bags")
+            for variant in range(10)
+        ]
+        self.sample_prices = [
+            from_dict(data_class=CityPrice, data=price)
+            for price in make_city_prices(self.ids[0])
+        ]
+        self.transport_candidates: list[Cargo] | None = None
+        self.liquidity = LiquidityIndex(AlbionOnlineServers.AMERICA)
+        self.liquid_ids = self.ids[: LiquidityRefresher.BATCH_SIZE]
+        self.liquidity_ready = False
+
+    async def start(self, directory: str) -> None:
+        environ["STORAGE_BACKEND"] = "sqlite"
+        environ["SQLITE_PATH"] = str(Path(directory) / "bench.db")
+        environ["AODP_BASE_URL"] = await self.aodp.start()
+        # the budget adds redis round trips of its own to every upstream request
+        environ["AODP_REQUESTS_PER_MINUTE"] = "0"
+        backends.configure(redis=self.redis, store=Backends().store)  # type: ignore
+
+        self.items, self.names = self.load_dumps()
+        await seed(self.items, self.names, get_dump_hash(self.items), forced=True)
+        mark_catalog_ready()
+
+    async def close(self) -> None:
+        await backends.close()
+        await self.aodp.close()
+        COMPUTE.shutdown()
+
+    def load_dumps(self) -> tuple[str, str]:
+        if self.args.items_dump and self.args.names_dump:
+            return (
+                Path(self.args.items_dump).read_text(),
+                Path(self.args.names_dump).read_text(),
+            )
+        return make_items_dump(), make_item_names_dump()
+
+    async def flush(self) -> None:
+        await self.redis.flushall()
+
+    def get_id(self, i: int) -> str:
+        return self.ids[i % len(self.ids)]
+
+    async def prices(self, i: int) -> None:
+        await self.albion.get_item_prices(self.get_id(i))
+
+    async def prices_sequential(self, i: int) -> None:
+        for j in range(BATCH_SIZE):
+            await self.albion.get_item_prices(self.get_id(i * BATCH_SIZE + j))
+
+    async def prices_batched(self, i: int) -> None:
+        await self.albion.get_items_prices(
+            [self.get_id(i * BATCH_SIZE + j) for j in range(BATCH_SIZE)]
+        )
+
+    async def find_cheapest(self, _: int) -> None:
+        helper = MarketFlipper(self.albion)
+        for _ in range(100):
+            helper._find_cheapest_buy_price(self.sample_prices, Qualities.NORMAL, False)
+
+    async def find_expensive(self, _: int) -> None:
+        helper = MarketFlipper(self.albion)
+        for _ in range(100):
+            helper._find_expensive_sell_price(
+                self.sample_prices, Qualities.NORMAL, True
+            )
+
+    async def flip(self, i: int) -> None:
+        query = MarketQuery.with_black_market_included(self.get_id(i), Qualities.GOOD)
+        await MarketFlipper(self.albion).flip(query)
+
+    async def queue_liquidity(self) -> None:
+        await self.redis.sadd(self.liquidity.pending_key, *self.liquid_ids)
+
+    async def liquidity_refresh(self, _: int) -> None:
+        await self.liquidity.refresh(self.albion, LiquidityRefresher.BATCH_SIZE)
+
+    async def ensure_liquidity(self) -> None:
+        if not self.liquidity_ready:
+            await self.queue_liquidity()
+            await self.liquidity_refresh(0)
+            self.liquidity_ready = True
+
+    async def flip_liquid(self, i: int) -> None:
+        id = self.liquid_ids[i % len(self.liquid_ids)]
+        query = MarketQuery.with_black_market_included(id, Qualities.NORMAL)
+        try:
+            await MarketFlipper(self.albion).flip(
+                query, min_volume=10, rank_by_fill=True
+            )
+        except InsufficientDataError:
+            # no city trades enough of it, which is an answer as well
+            pass
+
+    def craft(self, family: str) -> Callable[[int], Awaitable[None]]:
+        async def craft(i: int) -> None:
+            await Crafter(self.albion).craft(get_product_id(4 + i % 5, family, i % 20))
+
+        return craft
+
+    # the same request over and over, answered from the derived results
+    # after the first one
+    async def craft_repeated(self, _: int) -> None:
+        await Crafter(self.albion).craft(get_product_id(6, "tools", 3), 10)
+
+    async def flip_repeated(self, _: int) -> None:
+        query = MarketQuery.with_black_market_included(self.ids[0], Qualities.GOOD)
+        await MarketFlipper(self.albion).flip(query)
+
+    async def sweep(self, i: int) -> None:
+        await CraftSweeper(self.albion).sweep(get_product_id(6, "sword", i % 20))
+
+    # what the sweep replaces: a craft of every tier and enchantment, one
+    # after another
+    async def sweep_sequential(self, i: int) -> None:
+        crafter = Crafter(self.albion)
+        for tier in range(4, 9):
+            for enchantment in range(5):
+                id = get_product_id(tier, "sword", i % 20)
+                try:
+                    await crafter.craft(f"{id}@{enchantment}" if enchantment else id)
+                except InsufficientDataError:
+                    pass
+
+    async def plan_inventory(self, i: int) -> None:
+        tier = 4 + i % 5
+        inventory = {
+            f"T{tier}_METALBAR": 400,
+            f"T{tier}_LEATHER": 200,
+            f"T{tier}_PLANKS": 200,
+            f"T{tier}_CLOTH@1": 100,
+        }
+        await InventoryPlanner(self.albion).plan(inventory)
+
+    async def guess(self, i: int) -> None:
+        interaction = FakeInteraction(1, 1, DiscordCalls())
+        query = GUESSER_QUERIES[i % len(GUESSER_QUERIES)]
+        await ItemGuesser.guess_item_by_name(interaction, query)  # type: ignore
+
+    async def transport(self, _: int) -> None:
+        planner = TransportPlanner(self.albion)
+        await planner.plan(Cities.MARTLOCK, Cities.CAERLEON, *HAUL)
+
+    async def transport_solve(self, _: int) -> None:
+        if self.transport_candidates is None:
+            planner = TransportPlanner(self.albion)
+            items = [Item.from_mongo(doc) for doc in await backends.store.find_items()]
+            prices = await planner.get_available_prices([item.name for item in items])
+            # every item of the catalog, fresh or not, is what the solver
+            # would get in the worst case
+            self.transport_candidates = planner._get_candidates(
+                items, prices, Cities.MARTLOCK, Cities.CAERLEON, True, 1, timedelta.max
+            )
+        solve_haul(self.transport_candidates, *HAUL)
+
+    async def seed_full(self, _: int) -> None:
+        await seed(self.items, self.names, get_dump_hash(self.items), forced=True)
+
+    async def seed_incremental(self, _: int) -> None:
+        patched = self.patched_items
+        await seed(patched, self.names, get_dump_hash(patched), forced=False)
+
+    async def reset_seed(self) -> None:
+        await seed(self.items, self.names, get_dump_hash(self.items), forced=True)
+
+    def get_cases(self) -> list[Case]:
+        n = self.args.iterations
+        self.patched_items = make_patch(self.items, 50, 20, 0)
+        cases = [
+            Case("prices.cold", self.prices, n, self.flush),
+            Case("prices.redis_hit", self.prices, n),
+            Case("prices.sequential_cold", self.prices_sequential, n // 4, self.flush),
+            Case("prices.batched_cold", self.prices_batched, n // 4, self.flush),
+            Case("helper.find_cheapest_buy_price", self.find_cheapest, n, calls=100),
+            Case("helper.find_expensive_sell_price", self.find_expensive, n, calls=100),
+            Case("flipper.flip.cold", self.flip, n, self.flush),
+            Case("flipper.flip.redis_hit", self.flip, n),
+            Case("flipper.flip.repeated", self.flip_repeated, n),
+            Case("flipper.flip.min_volume", self.flip_liquid, n, self.ensure_liquidity),
+            Case(
+                "liquidity.refresh",
+                self.liquidity_refresh,
+                max(n // 20, 2),
+                self.queue_liquidity,
+                calls=len(self.liquid_ids),
+            ),
+            *(
+                Case(
+                    f"crafter.craft.{size}_materials", self.craft(family), n, self.flush
+                )
+                for size, family in RECIPES.items()
+            ),
+            Case("crafter.craft.repeated", self.craft_repeated, n),
+            Case("sweep.cold", self.sweep, n // 4, self.flush),
+            Case("sweep.redis_hit", self.sweep, n),
+            Case("sweep.sequential_cold", self.sweep_sequential, n // 8, self.flush),
+            Case("inventory.plan.cold", self.plan_inventory, n // 4, self.flush),
+            Case("inventory.plan.redis_hit", self.plan_inventory, n),
+            Case("guesser.guess_item_by_name", self.guess, n),
+            Case("transport.plan.redis_hit", self.transport, max(n // 20, 2)),
+            Case("transport.solve", self.transport_solve, max(n // 20, 2)),
+            Case("seed.full", self.seed_full, self.args.seed_iterations),
+            Case(
+                "seed.incremental",
+                self.seed_incremental,
+                self.args.seed_iterations,
+                self.reset_seed,
+            ),
+        ]
+        if self.args.cases:
+            cases = [
+                case
+                for case in cases
+                if any(case.name.startswith(prefix) for prefix in self.args.cases)
+            ]
+        return cases
+
+    async def run_case(self, case: Case) -> dict[str, Any]:
+        # one untimed round so connections and statement caches are warm
+        if case.reset is not None:
+            await case.reset()
+        await case.run(0)
+
+        latencies = []
+        upstream = round_trips = 0
+        for i in range(1, case.iterations + 1):
+            if case.reset is not None:
+                await case.reset()
+            requests = sum(self.aodp.requests.values())
+            before = self.redis.round_trips
+            started = perf_counter()
+            await case.run(i)
+            latencies.append((perf_counter() - started) * 1000 / case.calls)
+            upstream += sum(self.aodp.requests.values()) - requests
+            round_trips += self.redis.round_trips - before
+
+        percentiles = (
+            quantiles(latencies, n=100, method="inclusive")
+            if len(latencies) > 1
+            else latencies * 99
+        )
+        iterations = case.iterations
+        return {
+            "iterations": iterations,
+            "mean_ms": round(mean(latencies), 4),
+            "p50_ms": round(percentiles[49], 4),
+            "p95_ms": round(percentiles[94], 4),
+            "p99_ms": round(percentiles[98], 4),
+            "upstream_requests": round(upstream / iterations, 2),
+            "redis_round_trips": round(round_trips / iterations, 2),
+        }
+
+
+def get_commit() -> str | None:
+    try:
+        return check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(results: dict[str, Any], path: str) -> None:
+    baseline = loads(Path(path).read_text())["results"]
+    print(f"{"case":<36} {"before":>10} {"after":>10} {"change":>8}", file=stderr)
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50_ms"], result["p50_ms"]
+        change = (after - before) / before if before else 0.0
+        print(f"{name:<36} {before:>10.4f} {after:>10.4f} {change:>+8.1%}", file=stderr)
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed-iterations", type=int, default=3)
+    parser.add_argument("--upstream-latency", type=float, default=0.0)
+    parser.add_argument("--redis-latency", type=float, default=0.0)
+    parser.add_argument("--items-dump", help="recorded items.json to seed from")
+    parser.add_argument("--names-dump", help="recorded items.txt to seed from")
+    parser.add_argument("--cases", nargs="*", help="only run cases with these prefixes")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    benchmark = MarketBenchmark(args)
+    results = {}
+    with TemporaryDirectory() as directory:
+        await benchmark.start(directory)
+        try:
+            for case in benchmark.get_cases():
+                results[case.name] = await benchmark.run_case(case)
+                print(f"{case.name}: {results[case.name]["p50_ms"]}ms", file=stderr)
+        finally:
+            await benchmark.close()
+
+    report = {
+        "meta": {
+            "commit": get_commit(),
+            "python": python_version(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "upstream_latency": args.upstream_latency,
+            "redis_latency": args.redis_latency,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,96 @@
+# Compares a full blue/green reseed against an incremental diff-based update
+# for a synthetic game patch. Needs a MongoDB configured the same way as the
+# bot (see .env.example) and local copies of the ao-bin-dumps files:
+#
+#   python benchmarks/reseed.py items.json items.txt --changed 50 --added 20
+from argparse import ArgumentParser
+from asyncio import run
+from copy import deepcopy
+from json import dumps, loads
+from random import Random
+from time import perf_counter
+from typing import Any
+
+from bridgewatcher.db.seed.run import (
+    NOT_INCLUDED_IN_DATABASE,
+    get_dump_hash,
+    seed,
+    update_hash,
+)
+
+
+def make_patch(content: str, changed: int, added: int, seed: int) -> str:
+    rng = Random(seed)
+    dump: dict[str, Any] = loads(content)
+    categories = [
+        category_items
+        for category, category_items in dump["items"].items()
+        if category not in NOT_INCLUDED_IN_DATABASE and isinstance(category_items, list)
+    ]
+    items = [item for category_items in categories for item in category_items]
+
+    for item in rng.sample(items, changed):
+        requirements = item.get("craftingrequirements")
+        if isinstance(requirements, list):
+            requirements = requirements[0]
+        resources = (requirements or {}).get("craftresource")
+        if isinstance(resources, dict):
+            resources = [resources]
+        if resources:
+            resource = rng.choice(resources)
+            resource["@count"] = str(int(resource["@count"]) + 1)
+        else:
+            item["@shopsubcategory2"] = "patched"
+
+    for i, item in enumerate(rng.sample(items, added)):
+        new_item = deepcopy(item)
+        new_item["@uniquename"] = f"{item['@uniquename']}_PATCH{i}"
+        rng.choice(categories).append(new_item)
+
+    return dumps(dump)
+
+
+async def timed_seed(items_content: str, names_content: str, forced: bool) -> float:
+    hash = get_dump_hash(items_content)
+    started = perf_counter()
+    await seed(items_content, names_content, hash, forced)
+    await update_hash(hash)
+    return perf_counter() - started
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("items")
+    parser.add_argument("names")
+    parser.add_argument("--changed", type=int, default=50)
+    parser.add_argument("--added", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.items) as f:
+        old_items = f.read()
+    with open(args.names) as f:
+        names = f.read()
+    new_items = make_patch(old_items, args.changed, args.added, args.seed)
+
+    await timed_seed(old_items, names, forced=True)
+    full = await timed_seed(new_items, names, forced=True)
+
+    await timed_seed(old_items, names, forced=True)
+    incremental = await timed_seed(new_items, names, forced=False)
+
+    print(
+        dumps(
+            {
+                "changed": args.changed,
+                "added": args.added,
+                "full_reseed_seconds": round(full, 3),
+                "incremental_seconds": round(incremental, 3),
+                "speedup": round(full / incremental, 2),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    run(main())
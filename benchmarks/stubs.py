@@ -0,0 +1,490 @@
+# Local stand-ins for everything the bot talks to over the network, so the
+# benchmarks run on a single box without any of it
+from asyncio import (
+    IncompleteReadError,
+    Server,
+    StreamReader,
+    StreamWriter,
+    sleep,
+    start_server,
+)
+from collections import Counter
+from dataclasses import dataclass, field
+from json import dumps
+from time import monotonic
+from typing import Any
+
+from aiohttp import web
+from discord import InteractionResponseType
+
+from fixtures import (
+    make_city_prices,
+    make_gold_prices,
+    make_item_history,
+    make_item_names_dump,
+    make_items_dump,
+)
+
+
+# Serves the AODP endpoints the bot uses from the fixtures, point the bot at
+# it with AODP_BASE_URL=<url>
+class FakeAodp:
+    def __init__(self, latency: float = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self.seed = seed
+        self.requests: Counter[str] = Counter()
+        self._responses: dict[str, list[dict[str, Any]]] = {}
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    def _get_prices(self, id: str) -> list[dict[str, Any]]:
+        if id not in self._responses:
+            self._responses[id] = make_city_prices(id, self.seed)
+        return self._responses[id]
+
+    async def _serve_prices(self, request: web.Request) -> web.Response:
+        self.requests["prices"] += 1
+        await sleep(self.latency)
+        ids = request.match_info["ids"].split(",")
+        body = [price for id in ids for price in self._get_prices(id)]
+        return web.Response(text=dumps(body), content_type="application/json")
+
+    async def _serve_history(self, request: web.Request) -> web.Response:
+        self.requests["history"] += 1
+        await sleep(self.latency)
+        ids = request.match_info["ids"].split(",")
+        body = [history for id in ids for history in make_item_history(id, self.seed)]
+        return web.Response(text=dumps(body), content_type="application/json")
+
+    async def _serve_gold(self, request: web.Request) -> web.Response:
+        self.requests["gold"] += 1
+        await sleep(self.latency)
+        count = int(request.query.get("count", 24))
+        return web.json_response(make_gold_prices(count))
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/{server}/prices/{ids}", self._serve_prices)
+        app.router.add_get("/{server}/history/{ids}", self._serve_history)
+        app.router.add_get("/{server}/gold", self._serve_gold)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://127.0.0.1:{port}/{{server}}"
+        return self.url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+# Serves the item dumps the bot seeds the catalog from
+class FakeDumps:
+    def __init__(self) -> None:
+        self.items = make_items_dump()
+        self.names = make_item_names_dump()
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/items.json", lambda _: web.Response(text=self.items))
+        app.router.add_get("/items.txt", lambda _: web.Response(text=self.names))
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis") -> None:
+        self.redis = redis
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        self._commands.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        def queue(*args, **kwargs) -> "FakePipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list[Any]:
+        self.redis.round_trips += 1
+        results = []
+        for name, args, kwargs in self._commands:
+            results.append(await getattr(self.redis, f"_{name}")(*args, **kwargs))
+        self._commands.clear()
+        return results
+
+
+# In-memory Redis with the handful of commands the bot uses and an optional
+# round trip latency, every command counts as one round trip
+class FakeRedis:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.round_trips = 0
+        self._values: dict[str, tuple[bytes, float | None]] = {}
+        self._sets: dict[str, set[bytes]] = {}
+        self._hashes: dict[str, dict[str, bytes]] = {}
+
+    def _read(self, key: str) -> bytes | None:
+        value = self._values.get(key)
+        if value is None:
+            return None
+        data, expires_at = value
+        if expires_at is not None and expires_at <= monotonic():
+            del self._values[key]
+            return None
+        return data
+
+    async def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.latency:
+            await sleep(self.latency)
+
+    async def _get(self, key: str) -> bytes | None:
+        return self._read(key)
+
+    async def _mget(self, keys: list[str]) -> list[bytes | None]:
+        return [self._read(key) for key in keys]
+
+    async def _set(
+        self,
+        key: str,
+        value: Any,
+        ex: float | None = None,
+        px: int | None = None,
+        nx: bool = False,
+        xx: bool = False,
+    ) -> bool | None:
+        exists = self._read(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        if px is not None:
+            ex = px / 1000
+        self._values[key] = (data, monotonic() + ex if ex is not None else None)
+        return True
+
+    async def _incr(self, key: str, amount: int = 1) -> int:
+        value = int(self._read(key) or 0) + amount
+        _, expires_at = self._values.get(key, (b"", None))
+        self._values[key] = (str(value).encode("utf-8"), expires_at)
+        return value
+
+    async def _expire(self, key: str, seconds: float) -> bool:
+        data = self._read(key)
+        if data is None:
+            return False
+        self._values[key] = (data, monotonic() + seconds)
+        return True
+
+    async def _delete(self, *keys: str) -> int:
+        return sum(self._values.pop(key, None) is not None for key in keys)
+
+    async def _sadd(self, key: str, *members: Any) -> int:
+        values = self._sets.setdefault(key, set())
+        added = {str(member).encode("utf-8") for member in members} - values
+        values.update(added)
+        return len(added)
+
+    async def _srem(self, key: str, *members: Any) -> int:
+        values = self._sets.get(key, set())
+        removed = {str(member).encode("utf-8") for member in members} & values
+        values.difference_update(removed)
+        return len(removed)
+
+    async def _smembers(self, key: str) -> "set[bytes]":
+        return set(self._sets.get(key, ()))
+
+    async def _spop(self, key: str, count: int | None = None) -> Any:
+        values = self._sets.get(key, set())
+        popped = [values.pop() for _ in range(min(count or 1, len(values)))]
+        if count is None:
+            return popped[0] if popped else None
+        return popped
+
+    async def _hset(self, key: str, mapping: dict[str, Any]) -> int:
+        values = self._hashes.setdefault(key, {})
+        added = len(mapping.keys() - values.keys())
+        for field, value in mapping.items():
+            values[field] = (
+                value if isinstance(value, bytes) else str(value).encode("utf-8")
+            )
+        return added
+
+    async def _hmget(self, key: str, fields: list[str]) -> list[bytes | None]:
+        values = self._hashes.get(key, {})
+        return [values.get(field) for field in fields]
+
+    async def get(self, key: str) -> bytes | None:
+        await self._round_trip()
+        return await self._get(key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        await self._round_trip()
+        return await self._mget(keys)
+
+    async def set(self, key: str, value: Any, **options: Any) -> bool | None:
+        await self._round_trip()
+        return await self._set(key, value, **options)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        await self._round_trip()
+        return await self._incr(key, amount)
+
+    async def expire(self, key: str, seconds: float) -> bool:
+        await self._round_trip()
+        return await self._expire(key, seconds)
+
+    async def delete(self, *keys: str) -> int:
+        await self._round_trip()
+        return await self._delete(*keys)
+
+    async def sadd(self, key: str, *members: Any) -> int:
+        await self._round_trip()
+        return await self._sadd(key, *members)
+
+    async def srem(self, key: str, *members: Any) -> int:
+        await self._round_trip()
+        return await self._srem(key, *members)
+
+    async def smembers(self, key: str) -> "set[bytes]":
+        await self._round_trip()
+        return await self._smembers(key)
+
+    async def spop(self, key: str, count: int | None = None) -> Any:
+        await self._round_trip()
+        return await self._spop(key, count)
+
+    async def hset(self, key: str, mapping: dict[str, Any]) -> int:
+        await self._round_trip()
+        return await self._hset(key, mapping)
+
+    async def hmget(self, key: str, fields: list[str]) -> list[bytes | None]:
+        await self._round_trip()
+        return await self._hmget(key, fields)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    async def ping(self) -> bool:
+        await self._round_trip()
+        return True
+
+    async def flushall(self) -> None:
+        self._values.clear()
+        self._sets.clear()
+        self._hashes.clear()
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _Status(str): ...
+
+
+# Serves a FakeRedis over the redis protocol for benchmarks that run the bot in
+# processes of its own. Only the commands the bot sends are understood, point
+# the bot at it with REDIS_HOST=127.0.0.1 and REDIS_PORT=<port>
+class FakeRedisServer:
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: Counter[str] = Counter()
+        self._server: Server | None = None
+        self.port = 0
+
+    async def start(self) -> int:
+        self._server = await start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_command(self, reader: StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _encode(self, value: Any, resp3: bool) -> bytes:
+        if isinstance(value, _Status):
+            return f"+{value}\r\n".encode("utf-8")
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode("utf-8")
+        if value is None:
+            return b"_\r\n" if resp3 else b"$-1\r\n"
+        if isinstance(value, (bool, int)):
+            return f":{int(value)}\r\n".encode("utf-8")
+        if isinstance(value, dict):
+            return f"%{len(value)}\r\n".encode("utf-8") + b"".join(
+                self._encode(item, resp3) for pair in value.items() for item in pair
+            )
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode("utf-8") + b"".join(
+                self._encode(item, resp3) for item in value
+            )
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        return f"${len(data)}\r\n".encode("utf-8") + data + b"\r\n"
+
+    async def _execute(self, name: str, args: list[str]) -> Any:
+        match name:
+            case "PING":
+                return _Status("PONG")
+            case "AUTH" | "CLIENT" | "SELECT":
+                return _Status("OK")
+            case "HELLO":
+                # a RESP3 map, newer clients authenticate with this
+                return {"server": "redis", "version": "7.4.0", "proto": int(args[0])}
+            case "GET":
+                return await self.redis._get(args[0])
+            case "MGET":
+                return await self.redis._mget(args)
+            case "SET":
+                options: dict[str, Any] = {}
+                flags = [flag.upper() for flag in args[2:]]
+                for i, flag in enumerate(flags):
+                    if flag == "EX":
+                        options["ex"] = float(flags[i + 1])
+                    elif flag == "PX":
+                        options["px"] = int(flags[i + 1])
+                    elif flag in ("NX", "XX"):
+                        options[flag.lower()] = True
+                result = await self.redis._set(args[0], args[1], **options)
+                return _Status("OK") if result else None
+            case "DEL":
+                return await self.redis._delete(*args)
+            case "INCR":
+                return await self.redis._incr(args[0])
+            case "INCRBY":
+                return await self.redis._incr(args[0], int(args[1]))
+            case "EXPIRE":
+                return await self.redis._expire(args[0], float(args[1]))
+            case "SADD":
+                return await self.redis._sadd(*args)
+            case "SREM":
+                return await self.redis._srem(*args)
+            case "SMEMBERS":
+                return list(await self.redis._smembers(args[0]))
+            case "SPOP":
+                return await self.redis._spop(
+                    args[0], int(args[1]) if len(args) > 1 else None
+                )
+            case "HSET":
+                return await self.redis._hset(
+                    args[0], dict(zip(args[1::2], args[2::2]))
+                )
+            case "HMGET":
+                return await self.redis._hmget(args[0], args[1:])
+            case "FLUSHALL":
+                await self.redis.flushall()
+                return _Status("OK")
+        return ValueError(f"unknown command {name!r}")
+
+    async def _serve(self, reader: StreamReader, writer: StreamWriter) -> None:
+        resp3 = False
+        try:
+            while (command := await self._read_command(reader)) is not None:
+                name = command[0].decode("utf-8").upper()
+                self.commands[name] += 1
+                args = [arg.decode("utf-8") for arg in command[1:]]
+                if name == "HELLO":
+                    resp3 = args[0] == "3"
+                writer.write(self._encode(await self._execute(name, args), resp3))
+                await writer.drain()
+        except (ConnectionError, IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+@dataclass
+class FakeGuild:
+    id: int
+
+
+@dataclass
+class FakeUser:
+    id: int
+    display_name: str = "benchmark"
+    display_avatar: str = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+# Records the Discord REST calls an interaction would make and sleeps for the
+# configured latency on each of them instead
+@dataclass
+class DiscordCalls:
+    latency: float = 0.0
+    calls: Counter[str] = field(default_factory=Counter)
+
+    async def call(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await sleep(self.latency)
+
+
+class FakeResponse:
+    def __init__(self, rest: DiscordCalls) -> None:
+        self.rest = rest
+        self.type: InteractionResponseType | None = None
+
+    def is_done(self) -> bool:
+        return self.type is not None
+
+    async def send_message(self, *args, **kwargs) -> None:
+        self.type = InteractionResponseType.channel_message
+        await self.rest.call("send_message")
+
+    async def defer(self, *args, **kwargs) -> None:
+        self.type = InteractionResponseType.deferred_channel_message
+        await self.rest.call("defer")
+
+
+class FakeFollowup:
+    def __init__(self, rest: DiscordCalls) -> None:
+        self.rest = rest
+        self.sent: list[dict[str, Any]] = []
+
+    async def send(self, *args, **kwargs) -> None:
+        self.sent.append(kwargs)
+        await self.rest.call("followup")
+
+
+class FakeInteraction:
+    def __init__(self, guild_id: int, user_id: int, rest: DiscordCalls) -> None:
+        self.guild = FakeGuild(guild_id)
+        self.guild_id = guild_id
+        self.user = FakeUser(user_id)
+        self.rest = rest
+        self.response = FakeResponse(rest)
+        self.followup = FakeFollowup(rest)
+
+    async def edit_original_response(self, *args, **kwargs) -> None:
+        await self.rest.call("edit_original_response")
+
+    async def delete_original_response(self) -> None:
+        await self.rest.call("delete_original_response")
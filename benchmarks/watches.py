@@ -0,0 +1,163 @@
+# Measures a cycle of the watch scheduler against local stand-ins of AODP,
+# Redis and Discord. Every step puts --watches watches on a number of
+# distinct items, the upstream requests and the cycle time should follow the
+# items and not the watches:
+#
+#   python benchmarks/watches.py --items 50 500 --watches 100 10000
+from argparse import ArgumentParser, Namespace
+from asyncio import run
+from collections import Counter
+from json import dumps
+from os import environ
+from pathlib import Path
+from random import Random
+from sys import stderr
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from bridgewatcher.api.model import Cities, Qualities
+from bridgewatcher.db import Backends, backends
+from bridgewatcher.db.schema import Watch, WatchKinds
+from bridgewatcher.discord.watches import WatchScheduler
+
+from fixtures import get_all_item_ids
+from stubs import FakeAodp, FakeRedis
+
+GUILDS = 200
+CHANNELS_PER_GUILD = 3
+
+
+class FakeChannel:
+    def __init__(self, messages: Counter[int], channel_id: int) -> None:
+        self.messages = messages
+        self.channel_id = channel_id
+
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        self.messages[self.channel_id] += 1
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.messages: Counter[int] = Counter()
+
+    def get_partial_messageable(self, channel_id: int) -> FakeChannel:
+        return FakeChannel(self.messages, channel_id)
+
+
+def make_watches(count: int, items: list[str], rng: Random) -> list[Watch]:
+    watches = []
+    for i in range(count):
+        guild_id = rng.randrange(GUILDS)
+        kind = rng.choice(tuple(WatchKinds))
+        watches.append(
+            Watch(
+                id=f"{i:010x}",
+                guild_id=guild_id,
+                channel_id=guild_id * CHANNELS_PER_GUILD
+                + rng.randrange(CHANNELS_PER_GUILD),
+                user_id=rng.choice((None, rng.randrange(10_000))),
+                server="west",
+                item_id=rng.choice(items),
+                quality=rng.choice(tuple(Qualities)),
+                kind=kind,
+                threshold=(
+                    rng.randint(0, 40)
+                    if kind == WatchKinds.MARGIN
+                    else rng.randint(1_000, 200_000)
+                ),
+                city=rng.choice((None, *Cities)),
+            )
+        )
+    return watches
+
+
+class WatchBenchmark:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.aodp = FakeAodp(args.upstream_latency)
+        self.all_items = get_all_item_ids()
+
+    async def run_step(
+        self, directory: str, items: int, watches: int
+    ) -> dict[str, Any]:
+        environ["SQLITE_PATH"] = str(Path(directory) / f"watches-{items}-{watches}.db")
+        redis = FakeRedis(self.args.redis_latency)
+        backends.configure(redis=redis, store=Backends().store)  # type: ignore
+        await backends.store.start()
+
+        rng = Random(f"{items}:{watches}")
+        for watch in make_watches(watches, rng.sample(self.all_items, items), rng):
+            await backends.store.insert_watch(watch.to_mongo())
+
+        bot = FakeBot()
+        scheduler = WatchScheduler(bot, 300)  # type: ignore
+        # nothing gets in the way of the alerts
+        scheduler._bucket.rate = scheduler._bucket.burst = 1_000_000
+        self.aodp.requests.clear()
+
+        started = perf_counter()
+        await scheduler.run_cycle()
+        cold = perf_counter() - started
+        cold_requests = self.aodp.requests["prices"]
+        cold_messages = sum(bot.messages.values())
+
+        # the same prices again, nothing is new so nothing gets sent
+        started = perf_counter()
+        await scheduler.run_cycle()
+        warm = perf_counter() - started
+
+        await backends.close()
+        return {
+            "items": items,
+            "watches": watches,
+            "cold_cycle_s": round(cold, 3),
+            "warm_cycle_s": round(warm, 3),
+            "upstream_requests": cold_requests,
+            "channels_alerted": len(bot.messages),
+            "messages": cold_messages,
+            "repeated_messages": sum(bot.messages.values()) - cold_messages,
+        }
+
+
+async def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--watches", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--redis-latency", type=float, default=0.0005)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    environ["STORAGE_BACKEND"] = "sqlite"
+    environ["AODP_REQUESTS_PER_MINUTE"] = "0"
+    benchmark = WatchBenchmark(args)
+    environ["AODP_BASE_URL"] = await benchmark.aodp.start()
+
+    results = []
+    try:
+        with TemporaryDirectory() as directory:
+            for items in args.items:
+                for watches in args.watches:
+                    result = await benchmark.run_step(directory, items, watches)
+                    results.append(result)
+                    print(
+                        f"{items} items, {watches} watches: {result["cold_cycle_s"]}s, "
+                        f"{result["upstream_requests"]} upstream requests",
+                        file=stderr,
+                    )
+    finally:
+        await benchmark.aodp.close()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,42 @@
+from asyncio import run
+from os import getenv
+from sys import stderr
+
+from dotenv import load_dotenv
+
+from bridgewatcher.db import backends
+from bridgewatcher.discord.endpoint import serve_interactions
+from bridgewatcher.loggers import load_logging_config
+from bridgewatcher.util.exc import BackendConfigurationError, EndpointConfigurationError
+
+
+# Serves the commands from an HTTP endpoint Discord delivers interactions to
+# instead of connecting to the gateway, see the interactions endpoint url in
+# the settings of the application
+def main() -> None:
+    load_logging_config()
+    load_dotenv()
+
+    MAIN_TOKEN = getenv("DISCORD_TOKEN")
+    DEBUG_TOKEN = getenv("DEBUG_TOKEN")
+    debug = getenv("DEBUG", "false").lower() in ("true", "1")
+    token = DEBUG_TOKEN if debug else MAIN_TOKEN
+    if token is None:
+        print(f"FATAL: Currently chosen token is null. {debug=!r}", file=stderr)
+        exit(1)
+
+    try:
+        backends.validate()
+    except BackendConfigurationError as e:
+        print(f"FATAL: {e}", file=stderr)
+        exit(1)
+
+    try:
+        run(serve_interactions(token))
+    except EndpointConfigurationError as e:
+        print(f"FATAL: {e}", file=stderr)
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,11 @@ from sys import stderr
 
 from dotenv import load_dotenv
 
-from bridgewatcher.discord import bot
+from bridgewatcher.cluster import run_clusters
+from bridgewatcher.db import backends
+from bridgewatcher.discord import bot, use_discord_stand_in
 from bridgewatcher.loggers import load_logging_config
+from bridgewatcher.util.exc import BackendConfigurationError, ClusterConfigurationError
 
 
 def main() -> None:
@@ -19,7 +22,25 @@ def main() -> None:
         print(f"FATAL: Currently chosen token is null. {debug=!r}", file=stderr)
         exit(1)
 
-    bot.run(token)
+    try:
+        backends.validate()
+    except BackendConfigurationError as e:
+        print(f"FATAL: {e}", file=stderr)
+        exit(1)
+
+    # spreads the shards across this many processes, a single process
+    # without sharding otherwise
+    clusters = int(getenv("CLUSTERS", 0))
+    if clusters <= 0:
+        use_discord_stand_in()
+        bot.run(token)
+        return
+
+    try:
+        run_clusters(token, clusters)
+    except ClusterConfigurationError as e:
+        print(f"FATAL: {e}", file=stderr)
+        exit(1)
 
 
 if __name__ == "__main__":
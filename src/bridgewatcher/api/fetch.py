@@ -1,16 +1,40 @@
+from asyncio import gather, sleep
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
 from enum import StrEnum
 from json import dumps, loads
-from typing import Any, overload
+from math import ceil
+from os import getenv
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Iterator, overload
+from zlib import crc32
 
 from aiohttp import ClientError, ClientSession, ClientTimeout
 from dacite import from_dict
 
-from bridgewatcher.api.model import CityPrice, GoldPrice
-from bridgewatcher.db import redis
-from bridgewatcher.db.schema import Item
+from bridgewatcher.api.freshness import AdaptiveExpiration
+from bridgewatcher.api.model import CityPrice, GoldPrice, ItemHistory
+from bridgewatcher.db import backends
+from bridgewatcher.db.coordination import SharedRateLimit
+from bridgewatcher.db.dependents import invalidate_dependents
 from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import CACHE_REQUESTS, UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from bridgewatcher.tracing import span
 from bridgewatcher.util.exc import PriceProviderError
 
+# Versions of the price lists read by the current task, set by
+# record_versions. Concurrent computations on one AlbionOnline each record
+# into their own, the tasks they start share it
+_recorded_versions: ContextVar[dict[str, int] | None] = ContextVar(
+    "recorded_versions", default=None
+)
+
+# the item schema depends on the api models, importing it at runtime would
+# make importing bridgewatcher.db.schema first a circular import
+if TYPE_CHECKING:
+    from bridgewatcher.db.schema import Item
+
 
 class AlbionOnlineServers(StrEnum):
     AMERICA = "west"
@@ -27,7 +51,25 @@ class AlbionOnlineServers(StrEnum):
 
 class AlbionOnline:
     MAX_GOLD_PRICE_COUNT = 24
+    # keeps the batched urls well below the 4096 characters the api accepts
+    MAX_ITEMS_PER_REQUEST = 100
+
+    # the api allows 180 requests a minute per address, every process of the
+    # bot draws from the same budget
+    DEFAULT_REQUESTS_PER_MINUTE = 180
+    REQUESTS_BUDGET_PERIOD = 10
+    # paced scans never take more than this much of a window, the rest is
+    # left to the commands
+    PACED_BUDGET_SHARE = 0.5
+
+    # daily points are what the liquidity index is built from, every further
+    # day only adds to the response size
+    HISTORY_TIME_SCALE = 24
+    HISTORY_DAYS = 14
 
+    # the item prices get an expiration of their own between the floor and
+    # the ceiling, this is only what they're compared against and the
+    # default interval of the watches
     ITEM_CACHE_EXPIRATION_PERIOD = 60 * 5
     GOLD_CACHE_EXPIRATION_PERIOD = 60 * 60
 
@@ -35,60 +77,247 @@ class AlbionOnline:
     # the server you want to fetch data from
     base_uri: str = "albion-online-data.com/api/v2/stats"
 
-    def __init__(self, server: AlbionOnlineServers) -> None:
+    # A paced client waits for the budget instead of failing once it's spent,
+    # for background scans nobody is waiting on
+    def __init__(self, server: AlbionOnlineServers, paced: bool = False) -> None:
         self.server = server
+        self.paced = paced
+        self.expiration = AdaptiveExpiration(
+            server.value, self.ITEM_CACHE_EXPIRATION_PERIOD
+        )
+
+    def _get_base_url(self) -> str:
+        # points the bot at a local stand-in of the api instead, the template
+        # gets the server filled in, e.g. http://127.0.0.1:8080/{server}
+        template = getenv("AODP_BASE_URL")
+        if template:
+            return template.format(server=self.server.value)
+        return f"https://{self.server.value}.{self.base_uri}"
+
+    def _get_requests_budget(self) -> SharedRateLimit | None:
+        per_minute = int(
+            getenv("AODP_REQUESTS_PER_MINUTE") or self.DEFAULT_REQUESTS_PER_MINUTE
+        )
+        if per_minute <= 0:
+            return None
+        limit = ceil(per_minute * self.REQUESTS_BUDGET_PERIOD / 60)
+        return SharedRateLimit("aodp", limit, self.REQUESTS_BUDGET_PERIOD)
+
+    async def _wait_for_budget(self, budget: SharedRateLimit) -> None:
+        share = SharedRateLimit(
+            f"{budget.name}:paced",
+            max(1, int(budget.limit * self.PACED_BUDGET_SHARE)),
+            budget.period,
+        )
+        for limit in (share, budget):
+            while (delay := await limit.take()) > 0:
+                await sleep(delay)
 
     async def _fetch_prices(self, url: str) -> list[dict[str, Any]]:
+        status = "error"
+        started = perf_counter()
         try:
-            async with ClientSession(timeout=ClientTimeout(total=5)) as session:
-                async with session.get(url) as res:
-                    if not res.ok:
-                        raise PriceProviderError(
-                            f"Albion Online data returned: {res.status}"
-                        )
-                    return await res.json()
+            # going over the budget gets the address blocked for a while,
+            # failing right away is what a 429 would end in anyway
+            budget = self._get_requests_budget()
+            if budget is not None and self.paced:
+                await self._wait_for_budget(budget)
+            elif budget is not None and await budget.take():
+                status = "throttled"
+                raise PriceProviderError("Albion Online data rate limit reached")
+
+            with span("GET albion-online-data", "http", url=url) as s:
+                async with ClientSession(timeout=ClientTimeout(total=5)) as session:
+                    async with session.get(url) as res:
+                        status = str(res.status)
+                        if s is not None:
+                            s.attributes["status"] = status
+                        if not res.ok:
+                            raise PriceProviderError(
+                                f"Albion Online data returned: {res.status}"
+                            )
+                        return await res.json()
         except TimeoutError as e:
+            status = "timeout"
             raise PriceProviderError("Albion Online data timed out") from e
         except ClientError as e:
             raise PriceProviderError("Albion Online data is unavailable") from e
+        finally:
+            server = self.server.value
+            UPSTREAM_DURATION.observe(perf_counter() - started, server=server)
+            UPSTREAM_REQUESTS.inc(server=server, status=status)
+
+    async def _get_cached(self, key: str, family: str) -> Any | None:
+        # a single GET is enough, checking with EXISTS first costs another round trip
+        with span("GET", "redis", key=key) as s:
+            cached = await backends.redis.get(key)
+            if s is not None:
+                s.attributes["hit"] = cached is not None
+        CACHE_REQUESTS.inc(family=family, result="miss" if cached is None else "hit")
+        return loads(cached) if cached is not None else None
+
+    async def _set_cached(self, key: str, body: Any, expiration: int) -> None:
+        with span("SET", "redis", key=key):
+            await backends.redis.set(key, dumps(body), ex=expiration)
+
+    def get_item_key(self, id: str) -> str:
+        # items are stored as item_id:server
+        return f"{id}:{self.server.value}"
+
+    # Collects the versions of every price list read inside of it, by item id.
+    # The version of a cached body is its checksum, the same one its
+    # freshness has
+    @contextmanager
+    def record_versions(self) -> Iterator[dict[str, int]]:
+        versions: dict[str, int] = {}
+        token = _recorded_versions.set(versions)
+        try:
+            yield versions
+        finally:
+            _recorded_versions.reset(token)
+
+    async def _cache_prices(self, bodies: dict[str, list[dict[str, Any]]]) -> None:
+        entries = await self.expiration.get_entries(bodies)
+        if not entries:
+            return
+        versions = _recorded_versions.get()
+        if versions is not None:
+            for id, entry in entries.items():
+                versions[id] = entry.freshness.version
+
+        with span("SET", "redis", keys=len(entries)):
+            async with backends.redis.pipeline(transaction=False) as pipeline:
+                for id, entry in entries.items():
+                    pipeline.set(
+                        self.get_item_key(id),
+                        entry.payload,
+                        ex=entry.freshness.ttl,
+                    )
+                pipeline.hset(
+                    self.expiration.key,
+                    mapping={
+                        id: entry.freshness.pack() for id, entry in entries.items()
+                    },
+                )
+                await pipeline.execute()
+        # results computed from the previous bodies are out of date now
+        await invalidate_dependents([self.get_item_key(id) for id in entries])
 
     @overload
-    async def get_item_prices(self, item_or_id: Item) -> list[CityPrice]: ...
+    async def get_item_prices(self, item_or_id: "Item") -> list[CityPrice]: ...
 
     @overload
     async def get_item_prices(self, item_or_id: str) -> list[CityPrice]: ...
 
-    async def get_item_prices(self, item_or_id: Item | str) -> list[CityPrice]:
-        id = item_or_id.name if isinstance(item_or_id, Item) else item_or_id
+    async def get_item_prices(self, item_or_id: "Item | str") -> list[CityPrice]:
+        id = item_or_id if isinstance(item_or_id, str) else item_or_id.name
+        return (await self.get_items_prices([id]))[id]
 
-        # items are stored as item_id:server
-        key = f"{id}:{self.server.value}"
-        if await redis.exists(key):
-            raw_prices = loads(await redis.get(key))  # type: ignore
-            prices = [
-                from_dict(data_class=CityPrice, data=raw_price)
-                for raw_price in raw_prices
+    # Same as get_item_prices for many items at once: a single MGET for all of
+    # them and a single upstream request per MAX_ITEMS_PER_REQUEST misses. The
+    # requests that went through are cached even when another one fails. With
+    # partial, the items of the failed requests are left out instead
+    async def get_items_prices(
+        self, items_or_ids: "list[Item] | list[str]", partial: bool = False
+    ) -> dict[str, list[CityPrice]]:
+        ids = list(
+            dict.fromkeys(
+                item_or_id if isinstance(item_or_id, str) else item_or_id.name
+                for item_or_id in items_or_ids
+            )
+        )
+        if not ids:
+            return {}
+
+        keys = [self.get_item_key(id) for id in ids]
+        with span("MGET", "redis", keys=len(keys)):
+            cached = await backends.redis.mget(keys)
+
+        versions = _recorded_versions.get()
+        raw_prices: dict[str, list[dict[str, Any]]] = {}
+        missing = []
+        for id, raw in zip(ids, cached):
+            CACHE_REQUESTS.inc(family="item", result="miss" if raw is None else "hit")
+            if raw is None:
+                missing.append(id)
+            else:
+                raw_prices[id] = loads(raw)
+                if versions is not None:
+                    versions[id] = crc32(raw)
+
+        if missing:
+            chunks = [
+                missing[i : i + self.MAX_ITEMS_PER_REQUEST]
+                for i in range(0, len(missing), self.MAX_ITEMS_PER_REQUEST)
             ]
-            return prices
+            bodies = await gather(
+                *(
+                    self._fetch_prices(
+                        f"{self._get_base_url()}/prices/{",".join(chunk)}"
+                    )
+                    for chunk in chunks
+                ),
+                return_exceptions=True,
+            )
 
-        url = f"https://{self.server.value}.{self.base_uri}/prices/{id}"
-        body = await self._fetch_prices(url)
-        prices = [from_dict(data_class=CityPrice, data=price) for price in body]
-        await redis.set(key, dumps(body), ex=self.ITEM_CACHE_EXPIRATION_PERIOD)
-        return prices
+            fetched: dict[str, list[dict[str, Any]]] = {}
+            error = None
+            for chunk, body in zip(chunks, bodies):
+                if isinstance(body, PriceProviderError):
+                    error = error or body
+                    continue
+                if isinstance(body, BaseException):
+                    raise body
+                chunk_prices: dict[str, list[dict[str, Any]]] = {id: [] for id in chunk}
+                for price in body:
+                    if price["item_id"] in chunk_prices:
+                        chunk_prices[price["item_id"]].append(price)
+                fetched.update(chunk_prices)
+
+            await self._cache_prices(fetched)
+            raw_prices.update(fetched)
+            if error is not None and not partial:
+                raise error
+
+        return {
+            id: [CityPrice.from_api(price) for price in raw_prices[id]]
+            for id in ids
+            if id in raw_prices
+        }
+
+    # Not cached, the liquidity index is what keeps the history around
+    async def get_items_history(self, ids: list[str]) -> list[ItemHistory]:
+        if not ids:
+            return []
+
+        since = (datetime.now(timezone.utc) - timedelta(days=self.HISTORY_DAYS)).date()
+        chunks = [
+            ids[i : i + self.MAX_ITEMS_PER_REQUEST]
+            for i in range(0, len(ids), self.MAX_ITEMS_PER_REQUEST)
+        ]
+        bodies = await gather(
+            *(
+                self._fetch_prices(
+                    f"{self._get_base_url()}/history/{",".join(chunk)}"
+                    f"?time-scale={self.HISTORY_TIME_SCALE}&date={since.isoformat()}"
+                )
+                for chunk in chunks
+            )
+        )
+        return [ItemHistory.from_api(raw) for body in bodies for raw in body]
 
     async def get_gold_prices(self) -> list[GoldPrice]:
         key = f"gold:{self.server.value}"
-        if await redis.exists(key):
-            raw_prices = loads(await redis.get(key))  # type: ignore
+        raw_prices = await self._get_cached(key, "gold")
+        if raw_prices is not None:
             prices = [
                 from_dict(data_class=GoldPrice, data=raw_price)
                 for raw_price in raw_prices
             ]
             return prices
 
-        url = f"https://{self.server.value}.{self.base_uri}/gold?count={self.MAX_GOLD_PRICE_COUNT}"
+        url = f"{self._get_base_url()}/gold?count={self.MAX_GOLD_PRICE_COUNT}"
         body = await self._fetch_prices(url)
         prices = [from_dict(data_class=GoldPrice, data=price) for price in body]
-        await redis.set(key, dumps(body), ex=self.GOLD_CACHE_EXPIRATION_PERIOD)
+        await self._set_cached(key, body, self.GOLD_CACHE_EXPIRATION_PERIOD)
         return prices
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from enum import IntEnum, StrEnum
+from typing import Any
 
 
 class Qualities(IntEnum):
@@ -53,8 +54,57 @@ class CityPrice:
     buy_price_max: int  # top of the buy orders
     buy_price_max_date: str
 
+    # dacite checks every field against its type, which ends up being most of
+    # the time a scan over thousands of items takes. The api always sends
+    # exactly these fields
+    @classmethod
+    def from_api(cls, raw: dict[str, Any]) -> "CityPrice":
+        return cls(
+            raw["item_id"],
+            raw["city"],
+            raw["quality"],
+            raw["sell_price_min"],
+            raw["sell_price_min_date"],
+            raw["sell_price_max"],
+            raw["sell_price_max_date"],
+            raw["buy_price_min"],
+            raw["buy_price_min_date"],
+            raw["buy_price_max"],
+            raw["buy_price_max_date"],
+        )
+
 
 @dataclass
 class GoldPrice:
     price: int
     timestamp: str
+
+
+@dataclass
+class HistoryPoint:
+    item_count: int
+    avg_price: int
+    timestamp: str
+
+
+# Traded volume of an item in a single location, one point per time scale
+@dataclass
+class ItemHistory:
+    location: str
+    item_id: str
+    quality: int
+    data: list[HistoryPoint]
+
+    @classmethod
+    def from_api(cls, raw: dict[str, Any]) -> "ItemHistory":
+        return cls(
+            raw["location"],
+            raw["item_id"],
+            raw["quality"],
+            [
+                HistoryPoint(
+                    point["item_count"], point["avg_price"], point["timestamp"]
+                )
+                for point in raw["data"]
+            ],
+        )
@@ -0,0 +1,306 @@
+from asyncio import (
+    CancelledError,
+    Event,
+    create_task,
+    get_running_loop,
+    run,
+    sleep,
+    wait_for,
+)
+from collections import defaultdict
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from json import dumps, loads
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from os import getenv
+from signal import SIG_IGN, SIGINT, SIGTERM, signal
+from time import monotonic
+
+from aiohttp import ClientError, ClientSession
+from discord.http import Route
+
+from bridgewatcher.db import backends
+from bridgewatcher.loggers import LOGGER, load_logging_config
+from bridgewatcher.util.exc import ClusterConfigurationError
+
+CLUSTER_STATUS_INTERVAL = 5
+CLUSTER_STATUS_EXPIRATION = CLUSTER_STATUS_INTERVAL * 3
+CLUSTER_SUPERVISION_INTERVAL = 1
+CLUSTER_RESTART_DELAY = 2
+CLUSTER_MAX_RESTART_DELAY = 60
+CLUSTER_SHUTDOWN_TIMEOUT = 15
+# https://discord.com/developers/docs/events/gateway#rate-limiting, a single
+# IDENTIFY per bucket every 5 seconds, no matter which process sends it
+IDENTIFY_INTERVAL = 5.0
+IDENTIFY_RETRY_DELAY = 0.25
+
+
+@dataclass(frozen=True)
+class ClusterInfo:
+    id: int
+    shard_ids: tuple[int, ...]
+    shard_count: int
+    # shards whose ids differ modulo this may IDENTIFY at the same time
+    max_concurrency: int = 1
+
+    @property
+    def name(self) -> str:
+        return f"cluster-{self.id}"
+
+
+@dataclass
+class ClusterStatus:
+    cluster: int
+    pid: int
+    shards: list[int]
+    ready_shards: list[int]
+    guilds: int
+    latency: float
+    max_rss_kib: int
+    cpu_seconds: float
+
+    @property
+    def ready(self) -> bool:
+        return set(self.ready_shards) == set(self.shards)
+
+
+def format_shards(shard_ids: tuple[int, ...] | list[int]) -> str:
+    if not shard_ids:
+        return "none"
+    return f"{min(shard_ids)}-{max(shard_ids)}"
+
+
+def _get_cluster_status_key(cluster_id: int) -> str:
+    return f"cluster:{cluster_id}:status"
+
+
+# Every cluster keeps refreshing its status, one that stops doing that simply
+# expires and counts as gone
+async def publish_cluster_status(status: ClusterStatus) -> None:
+    await backends.redis.set(
+        _get_cluster_status_key(status.cluster),
+        dumps(asdict(status)),
+        ex=CLUSTER_STATUS_EXPIRATION,
+    )
+
+
+async def get_cluster_statuses(count: int) -> dict[int, ClusterStatus]:
+    values = await backends.redis.mget(
+        [_get_cluster_status_key(cluster_id) for cluster_id in range(count)]
+    )
+    return {
+        cluster_id: ClusterStatus(**loads(value))
+        for cluster_id, value in enumerate(values)
+        if value is not None
+    }
+
+
+async def wait_for_identify_slot(shard_id: int, max_concurrency: int) -> None:
+    key = f"identify:{shard_id % max_concurrency}"
+    interval = int(IDENTIFY_INTERVAL * 1000)
+    while not await backends.redis.set(key, shard_id, nx=True, px=interval):
+        await sleep(IDENTIFY_RETRY_DELAY)
+
+
+# Contiguous shard ranges of (almost) the same size, the first clusters take
+# one more shard when they don't divide evenly
+def plan_clusters(
+    shard_count: int, clusters: int, max_concurrency: int = 1
+) -> list[ClusterInfo]:
+    if shard_count <= 0 or clusters <= 0:
+        raise ClusterConfigurationError(
+            f"Can't spread {shard_count} shards across {clusters} clusters"
+        )
+
+    clusters = min(clusters, shard_count)
+    size, extra = divmod(shard_count, clusters)
+    plan = []
+    start = 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < extra else 0)
+        plan.append(
+            ClusterInfo(
+                cluster_id, tuple(range(start, end)), shard_count, max_concurrency
+            )
+        )
+        start = end
+    return plan
+
+
+async def get_recommended_sharding(token: str) -> tuple[int, int]:
+    try:
+        async with ClientSession() as session:
+            async with session.get(
+                f"{Route.BASE}/gateway/bot", headers={"Authorization": f"Bot {token}"}
+            ) as res:
+                if not res.ok:
+                    raise ClusterConfigurationError(
+                        f"Discord returned {res.status} for the recommended shard count"
+                    )
+                data = await res.json()
+    except ClientError as e:
+        raise ClusterConfigurationError("Discord is unavailable") from e
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+
+def run_cluster(cluster: ClusterInfo, token: str) -> None:
+    # ctrl+c reaches the whole process group, the launcher stops its clusters
+    # on its own
+    signal(SIGINT, SIG_IGN)
+    load_logging_config(cluster.name)
+    run(_serve_cluster(cluster, token))
+
+
+async def _serve_cluster(cluster: ClusterInfo, token: str) -> None:
+    from bridgewatcher.discord import (
+        ShardedBridgewatcher,
+        get_intents,
+        use_discord_stand_in,
+    )
+
+    # every cluster is a process spawned from scratch
+    use_discord_stand_in()
+    bot = ShardedBridgewatcher(get_intents(), cluster)
+    # the same as what Client.run does on ctrl+c, leaving the context closes
+    # the bot exactly once
+    async with bot:
+        serving = create_task(bot.start(token))
+        get_running_loop().add_signal_handler(SIGTERM, serving.cancel)
+        with suppress(CancelledError):
+            await serving
+
+
+class ClusterLauncher:
+    def __init__(self, token: str, clusters: list[ClusterInfo]) -> None:
+        self.token = token
+        self.clusters = clusters
+        self._context = get_context("spawn")
+        self._processes: dict[int, BaseProcess] = {}
+        self._restarts: dict[int, int] = defaultdict(int)
+        self._restart_at: dict[int, float] = {}
+        self._ready: set[int] = set()
+        self._all_ready = False
+        self._started_at = monotonic()
+
+    def _start(self, cluster: ClusterInfo) -> None:
+        process = self._context.Process(
+            target=run_cluster, args=(cluster, self.token), name=cluster.name
+        )
+        process.start()
+        self._processes[cluster.id] = process
+        LOGGER.info(
+            f"Started cluster {cluster.id} with shards "
+            f"{format_shards(cluster.shard_ids)} as process {process.pid}"
+        )
+
+    def _supervise(self) -> None:
+        now = monotonic()
+        for cluster in self.clusters:
+            process = self._processes.get(cluster.id)
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                del self._processes[cluster.id]
+                self._ready.discard(cluster.id)
+                self._all_ready = False
+                # a cluster that keeps crashing right away shouldn't burn
+                # through the IDENTIFY budget
+                delay = min(
+                    CLUSTER_RESTART_DELAY * 2 ** self._restarts[cluster.id],
+                    CLUSTER_MAX_RESTART_DELAY,
+                )
+                self._restarts[cluster.id] += 1
+                self._restart_at[cluster.id] = now + delay
+                LOGGER.error(
+                    f"Cluster {cluster.id} exited with {process.exitcode}, "
+                    f"restarting it in {delay}s"
+                )
+            elif now >= self._restart_at.get(cluster.id, 0):
+                self._start(cluster)
+
+    async def _check_readiness(self) -> None:
+        statuses = await get_cluster_statuses(len(self.clusters))
+        for cluster in self.clusters:
+            status = statuses.get(cluster.id)
+            process = self._processes.get(cluster.id)
+            # the status of a process that has been restarted may linger
+            ready = (
+                status is not None
+                and process is not None
+                and status.pid == process.pid
+                and status.ready
+            )
+            if ready and cluster.id not in self._ready:
+                self._ready.add(cluster.id)
+                self._restarts[cluster.id] = 0
+                LOGGER.info(
+                    f"Cluster {cluster.id} is ready for {status.guilds} servers "  # type: ignore
+                    f"after {monotonic() - self._started_at:.2f}s"
+                )
+            elif not ready and cluster.id in self._ready:
+                self._ready.discard(cluster.id)
+                self._all_ready = False
+                LOGGER.warning(f"Cluster {cluster.id} is no longer ready")
+
+        if not self._all_ready and len(self._ready) == len(self.clusters):
+            self._all_ready = True
+            LOGGER.info(
+                f"All {len(self.clusters)} clusters are ready "
+                f"after {monotonic() - self._started_at:.2f}s"
+            )
+
+    def _stop(self) -> None:
+        for process in self._processes.values():
+            process.terminate()
+
+        deadline = monotonic() + CLUSTER_SHUTDOWN_TIMEOUT
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - monotonic()))
+            if process.is_alive():
+                LOGGER.warning(f"{process.name} didn't stop in time, killing it")
+                process.kill()
+                process.join()
+        self._processes.clear()
+
+    async def run(self) -> None:
+        stopped = Event()
+        loop = get_running_loop()
+        for signum in (SIGINT, SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+
+        try:
+            while not stopped.is_set():
+                self._supervise()
+                try:
+                    await self._check_readiness()
+                except Exception:
+                    LOGGER.exception("Couldn't read the cluster statuses")
+
+                with suppress(TimeoutError):
+                    await wait_for(stopped.wait(), CLUSTER_SUPERVISION_INTERVAL)
+        finally:
+            LOGGER.info("Stopping the clusters...")
+            self._stop()
+            await backends.close()
+
+
+async def _launch_clusters(token: str, clusters: int) -> None:
+    from bridgewatcher.discord import use_discord_stand_in
+
+    use_discord_stand_in()
+    shard_count = getenv("SHARD_COUNT")
+    if shard_count:
+        shards = int(shard_count)
+        max_concurrency = int(getenv("MAX_CONCURRENCY") or 1)
+    else:
+        shards, max_concurrency = await get_recommended_sharding(token)
+
+    plan = plan_clusters(shards, clusters, max_concurrency)
+    LOGGER.info(f"Spreading {shards} shards across {len(plan)} clusters")
+    await ClusterLauncher(token, plan).run()
+
+
+def run_clusters(token: str, clusters: int) -> None:
+    run(_launch_clusters(token, clusters))
@@ -0,0 +1,182 @@
+from asyncio import CancelledError, gather, get_running_loop, sleep, wait_for
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from os import getenv
+from pickle import dumps, loads
+from signal import SIG_IGN, SIGINT, signal
+from typing import Any, Callable, TypeVar
+
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import COMPUTE_JOB_DURATION, COMPUTE_JOBS
+from bridgewatcher.tracing import span
+from bridgewatcher.util.exc import JobCancelledError
+
+T = TypeVar("T")
+
+DEFAULT_COMPUTE_WORKERS = 2
+# values per pickled chunk of a big result
+RESULT_CHUNK_SIZE = 1000
+# modules every job needs, the fork server imports them once and every worker
+# forked from it starts with them already loaded
+PRELOADED_MODULES = ("bridgewatcher.db.seed.run", "bridgewatcher.market.matrix")
+
+
+# A single byte of shared memory the caller flips when it no longer wants the
+# result. Jobs check it every now and then and bail out, there's no way to
+# interrupt a worker that is in the middle of something without killing it.
+# Unpickling the token in the worker attaches to the same byte
+class CancellationToken:
+    def __init__(self) -> None:
+        self._shm: SharedMemory | None = SharedMemory(create=True, size=1)
+        self._buf: memoryview | bytearray = self._shm.buf
+        self._owner = True
+
+    @staticmethod
+    def attach(name: str) -> "CancellationToken":
+        token = CancellationToken.__new__(CancellationToken)
+        token._owner = False
+        try:
+            token._shm = SharedMemory(name, track=False)
+            token._buf = token._shm.buf
+        except FileNotFoundError:
+            # the caller gave up and cleaned up before the job even started,
+            # failing here would take the whole worker down with it
+            token._shm = None
+            token._buf = bytearray(b"\x01")
+        return token
+
+    def __reduce__(self) -> tuple[Callable, tuple[str]]:
+        return CancellationToken.attach, (self._shm.name,)  # type: ignore
+
+    @property
+    def cancelled(self) -> bool:
+        return self._buf[0] == 1
+
+    def cancel(self) -> None:
+        self._buf[0] = 1
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelledError("The job has been cancelled")
+
+    def close(self) -> None:
+        if self._shm is None:
+            return
+        self._buf = bytearray(self._buf)
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# The thread that reads results from the workers unpickles each of them in a
+# single call with the GIL held, which stalls the loop for as long as that
+# takes on results with many thousands of values. Such jobs return them in
+# pickled chunks, the loop then unpickles one at a time
+def pickle_chunks(values: list, size: int = RESULT_CHUNK_SIZE) -> list[bytes]:
+    return [dumps(values[i : i + size]) for i in range(0, len(values), size)]
+
+
+async def unpickle_chunks(chunks: list[bytes]) -> list:
+    values = []
+    for chunk in chunks:
+        values.extend(loads(chunk))
+        await sleep(0)
+    return values
+
+
+def _init_worker() -> None:
+    # ctrl+c is meant for the bot, it shuts the pool down on its own
+    signal(SIGINT, SIG_IGN)
+
+
+def _warm_up() -> None:
+    pass
+
+
+class ComputePool:
+    def __init__(self, workers: int | None = None) -> None:
+        self.workers = (
+            workers
+            if workers is not None
+            else int(getenv("COMPUTE_WORKERS", DEFAULT_COMPUTE_WORKERS))
+        )
+        self._executor: ProcessPoolExecutor | None = None
+
+    # Workers are only started on demand, so the first jobs would pay for
+    # forking and importing everything. Starting is cheap to call again
+    async def start(self) -> None:
+        if self._executor is not None or self.workers <= 0:
+            return
+
+        context = get_context("forkserver")
+        context.set_forkserver_preload(list(PRELOADED_MODULES))
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_worker
+        )
+        loop = get_running_loop()
+        await gather(
+            *(
+                loop.run_in_executor(self._executor, _warm_up)
+                for _ in range(self.workers)
+            )
+        )
+        LOGGER.info(f"Started {self.workers} compute workers")
+
+    async def _submit(self, func: Callable, *args: Any) -> Any:
+        if self.workers <= 0:
+            # without workers there's nothing to offload to, handy for
+            # debugging and boxes with a single core
+            return func(*args)
+
+        await self.start()
+        return await get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _run(
+        self,
+        func: Callable[..., T],
+        args: tuple,
+        timeout: float | None,
+        token: CancellationToken | None,
+    ) -> T:
+        name = func.__name__
+        with span(name, "compute"), COMPUTE_JOB_DURATION.time(job=name):
+            try:
+                if token is not None:
+                    args = (*args, token)
+                result = await wait_for(self._submit(func, *args), timeout)
+            except (CancelledError, TimeoutError, JobCancelledError):
+                # a job that hasn't started yet is dropped from the queue by
+                # cancelling its future, a running one sees the token
+                if token is not None:
+                    token.cancel()
+                COMPUTE_JOBS.inc(job=name, result="cancelled")
+                raise
+            except Exception:
+                COMPUTE_JOBS.inc(job=name, result="error")
+                raise
+            finally:
+                if token is not None:
+                    token.close()
+
+        COMPUTE_JOBS.inc(job=name, result="ok")
+        return result
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        return await self._run(func, args, None, None)
+
+    # The job gets a CancellationToken as its last argument and is expected
+    # to check it, commands pass the time the interaction has left as timeout
+    async def run_cancellable(
+        self, func: Callable[..., T], *args: Any, timeout: float | None = None
+    ) -> T:
+        return await self._run(func, args, timeout, CancellationToken())
+
+    def shutdown(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+COMPUTE = ComputePool()
@@ -1,44 +1,146 @@
+from asyncio import gather
 from os import getenv
-from sys import stderr
+from typing import TYPE_CHECKING, Any
 from urllib.parse import quote
 
 from dotenv import load_dotenv
-from pymongo import AsyncMongoClient
-from redis.asyncio import Redis
 
-load_dotenv()
+from bridgewatcher.util.exc import BackendConfigurationError
 
-_MONGO_USER = getenv("MONGO_USERNAME")
-_MONGO_PASSWORD = getenv("MONGO_PASSWORD")
-_MONGO_HOST = getenv("MONGO_HOST")
-_MONGO_PORT = getenv("MONGO_PORT")
+# pymongo and redis are pretty heavy to import, so they are only pulled in when
+# a client is actually needed and not by everything that imports a schema
+if TYPE_CHECKING:
+    from pymongo import AsyncMongoClient
+    from pymongo.asynchronous.database import AsyncDatabase
+    from redis.asyncio import Redis
 
-_MONGO_DB = getenv("MONGO_DB")
+    from bridgewatcher.db.store import Store
 
-if not all((_MONGO_USER, _MONGO_PASSWORD, _MONGO_HOST, _MONGO_PORT)):
-    print(
-        "FATAL: MongoDB is not setup properly. See .env.example for environment variables expected",
-        file=stderr,
-    )
-    exit(1)
+STORAGE_BACKENDS = ("mongo", "sqlite")
 
-connection_string = f"mongodb://{quote(_MONGO_USER)}:{quote(_MONGO_PASSWORD)}@{quote(_MONGO_HOST)}:{_MONGO_PORT}/?authSource=admin"  # type: ignore
 
-client = AsyncMongoClient(connection_string)
-db = client.get_database(_MONGO_DB)
+def get_storage_backend() -> str:
+    load_dotenv()
+    backend = getenv("STORAGE_BACKEND", "mongo").lower()
+    if backend not in STORAGE_BACKENDS:
+        raise BackendConfigurationError(
+            f"Unknown storage backend {backend!r}, expected one of {STORAGE_BACKENDS}"
+        )
+    return backend
 
 
-_REDIS_HOST = getenv("REDIS_HOST")
-_REDIS_PORT = getenv("REDIS_PORT")
-_REDIS_PASSWORD = getenv("REDIS_PASSWORD")
+def get_mongo_connection_string() -> str:
+    load_dotenv()
+    user = getenv("MONGO_USERNAME")
+    password = getenv("MONGO_PASSWORD")
+    host = getenv("MONGO_HOST")
+    port = getenv("MONGO_PORT")
 
-if not all((_REDIS_HOST, _REDIS_PORT, _REDIS_PASSWORD)):
-    print(
-        "FATAL: Redis is not setup properly. See .env.example for environment variables expected",
-        file=stderr,
-    )
-    exit(1)
+    if not all((user, password, host, port)):
+        raise BackendConfigurationError(
+            "MongoDB is not setup properly. See .env.example for environment variables expected"
+        )
 
-redis = Redis(host=_REDIS_HOST, port=_REDIS_PORT, password=_REDIS_PASSWORD)  # type: ignore
+    return f"mongodb://{quote(user)}:{quote(password)}@{quote(host)}:{port}/?authSource=admin"  # type: ignore
 
-__all__ = ("client", "db", "redis")
+
+def get_redis_settings() -> dict[str, Any]:
+    load_dotenv()
+    host = getenv("REDIS_HOST")
+    port = getenv("REDIS_PORT")
+    password = getenv("REDIS_PASSWORD")
+
+    if not all((host, port, password)):
+        raise BackendConfigurationError(
+            "Redis is not setup properly. See .env.example for environment variables expected"
+        )
+
+    return {"host": host, "port": port, "password": password}
+
+
+class Backends:
+    def __init__(self) -> None:
+        self._client: "AsyncMongoClient | None" = None
+        self._db: "AsyncDatabase | None" = None
+        self._redis: "Redis | None" = None
+        self._store: "Store | None" = None
+
+    # Lets tests and tools inject their own clients before anything touches
+    # the lazily created ones
+    def configure(
+        self,
+        *,
+        client: "AsyncMongoClient | None" = None,
+        db: "AsyncDatabase | None" = None,
+        redis: "Redis | None" = None,
+        store: "Store | None" = None,
+    ) -> None:
+        if client is not None:
+            self._client = client
+        if db is not None:
+            self._db = db
+        if redis is not None:
+            self._redis = redis
+        if store is not None:
+            self._store = store
+
+    def validate(self) -> None:
+        if get_storage_backend() == "mongo":
+            get_mongo_connection_string()
+        get_redis_settings()
+
+    @property
+    def client(self) -> "AsyncMongoClient":
+        if self._client is None:
+            from pymongo import AsyncMongoClient
+
+            self._client = AsyncMongoClient(get_mongo_connection_string())
+        return self._client
+
+    @property
+    def db(self) -> "AsyncDatabase":
+        if self._db is None:
+            self._db = self.client.get_database(getenv("MONGO_DB"))
+        return self._db
+
+    @property
+    def redis(self) -> "Redis":
+        if self._redis is None:
+            from redis.asyncio import Redis
+
+            self._redis = Redis(**get_redis_settings())
+        return self._redis
+
+    @property
+    def store(self) -> "Store":
+        if self._store is None:
+            if get_storage_backend() == "sqlite":
+                from bridgewatcher.db.store.sqlite import SqliteStore
+
+                self._store = SqliteStore(getenv("SQLITE_PATH", "bridgewatcher.db"))
+            else:
+                from bridgewatcher.db.store.mongo import MongoStore
+
+                self._store = MongoStore(self.db)
+        return self._store
+
+    async def start(self) -> None:
+        await gather(self.store.start(), self.redis.ping())  # type: ignore
+
+    async def close(self) -> None:
+        if self._store is not None:
+            await self._store.close()
+        elif self._client is not None:
+            await self._client.close()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+        self._client = None
+        self._db = None
+        self._redis = None
+        self._store = None
+
+
+backends = Backends()
+
+__all__ = ("backends", "Backends")
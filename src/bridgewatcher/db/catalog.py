@@ -0,0 +1,31 @@
+from asyncio import Event, wait_for
+
+from bridgewatcher.util.exc import CatalogNotReadyError
+
+CATALOG_READY_TIMEOUT = 10
+
+_catalog_ready = Event()
+
+
+# Results computed from an item of the catalog depend on this key, a catalog
+# update invalidates its dependents
+def get_catalog_key(id: str) -> str:
+    return f"catalog:{id}"
+
+
+def is_catalog_ready() -> bool:
+    return _catalog_ready.is_set()
+
+
+def mark_catalog_ready() -> None:
+    _catalog_ready.set()
+
+
+async def wait_for_catalog(timeout: float = CATALOG_READY_TIMEOUT) -> None:
+    if _catalog_ready.is_set():
+        return
+
+    try:
+        await wait_for(_catalog_ready.wait(), timeout)
+    except TimeoutError as e:
+        raise CatalogNotReadyError("Item catalog is still being seeded") from e
@@ -0,0 +1,62 @@
+from contextlib import asynccontextmanager
+from math import ceil
+from time import time
+from typing import AsyncIterator
+from uuid import uuid4
+
+from bridgewatcher.db import backends
+
+
+# A lock that expires on its own, so a process that dies while holding it
+# can't keep everybody else out forever. Releasing isn't atomic without a
+# script, everything behind these is safe to run twice anyway, they only keep
+# every process from doing the same thing at the same time
+@asynccontextmanager
+async def lease(name: str, ttl: float) -> AsyncIterator[bool]:
+    key = f"lease:{name}"
+    token = uuid4().hex
+    acquired = bool(await backends.redis.set(key, token, nx=True, px=int(ttl * 1000)))
+    try:
+        yield acquired
+    finally:
+        if acquired and await backends.redis.get(key) == token.encode("utf-8"):
+            await backends.redis.delete(key)
+
+
+# A budget shared by every process talking to the same redis, counted in
+# fixed windows. Like TokenBucket.take it returns 0 when a request fits and
+# otherwise how long it takes until the next window starts
+class SharedRateLimit:
+    def __init__(self, name: str, limit: int, period: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.period = period
+
+    async def take(self) -> float:
+        now = time()
+        window = int(now // self.period)
+        key = f"ratelimit:{self.name}:{window}"
+        async with backends.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, ceil(self.period) + 1)
+            count, _ = await pipe.execute()
+
+        if count <= self.limit:
+            return 0.0
+        return (window + 1) * self.period - now
+
+
+# Lets a single process do something once per period. Unlike a lease it's
+# only released when doing it failed, otherwise whoever comes next has to wait
+# for it to run out
+async def claim(name: str, period: float) -> bool:
+    key = f"claim:{name}"
+    return bool(
+        await backends.redis.set(key, uuid4().hex, nx=True, px=int(period * 1000))
+    )
+
+
+# Hands what was claimed back, so the next one to check does it again
+async def release(*names: str) -> None:
+    if names:
+        await backends.redis.delete(*(f"claim:{name}" for name in names))
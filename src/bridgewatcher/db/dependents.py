@@ -0,0 +1,43 @@
+from bridgewatcher.db import backends
+
+
+def get_dependents_key(key: str) -> str:
+    return f"dependents:{key}"
+
+
+# Stores a value computed from the values under inputs, refreshing any of
+# them deletes it. The sets of dependents are only ever added to, index_ttl
+# has to be at least as long as any value in them lives
+async def set_dependent(
+    key: str, value: str, ttl: int, inputs: list[str], index_ttl: int
+) -> None:
+    async with backends.redis.pipeline(transaction=False) as pipeline:
+        pipeline.set(key, value, ex=ttl)
+        for input in inputs:
+            pipeline.sadd(get_dependents_key(input), key)
+            pipeline.expire(get_dependents_key(input), index_ttl)
+        await pipeline.execute()
+
+
+# Returns how many dependents were deleted. Costs a single round trip when
+# nothing depends on the inputs and two otherwise
+async def invalidate_dependents(inputs: list[str]) -> int:
+    if not inputs:
+        return 0
+
+    async with backends.redis.pipeline(transaction=False) as pipeline:
+        for input in inputs:
+            pipeline.smembers(get_dependents_key(input))
+        members = await pipeline.execute()
+
+    dependents = {
+        dependent.decode("utf-8") for values in members for dependent in values
+    }
+    if not dependents:
+        return 0
+
+    sets = [
+        get_dependents_key(input) for input, values in zip(inputs, members) if values
+    ]
+    await backends.redis.delete(*dependents, *sets)
+    return len(dependents)
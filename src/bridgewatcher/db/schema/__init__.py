@@ -2,7 +2,8 @@ from .item import Item
 from .crafting_requirement import CraftingRequirement
 from .item_name import ItemName
 from .version import Version
-from .discord_server import DiscordServer
+from .discord_server import DiscordServer, DigestFrequencies, DigestSubscription
+from .watch import Watch, WatchKinds
 
 from .mongo_collection_item import MongoCollectionItem
 
@@ -12,5 +13,9 @@ __all__ = (
     "Version",
     "ItemName",
     "DiscordServer",
+    "DigestFrequencies",
+    "DigestSubscription",
+    "Watch",
+    "WatchKinds",
     "MongoCollectionItem",
 )
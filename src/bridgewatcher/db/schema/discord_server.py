@@ -1,19 +1,65 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import StrEnum
 from typing import Any, override
 
 from .mongo_collection_item import MongoCollectionItem
 
 
+class DigestFrequencies(StrEnum):
+    HOURLY = "hourly"
+    DAILY = "daily"
+
+    @property
+    def period(self) -> int:
+        return 60 * 60 if self == DigestFrequencies.HOURLY else 24 * 60 * 60
+
+
+# A channel getting the market digest. Every subscription with the same
+# category on the same albion server gets the very same digest
+@dataclass
+class DigestSubscription:
+    channel_id: int
+    frequency: DigestFrequencies
+    # shop category the flips and crafts are picked from, None for all of them
+    category: str | None
+
+    @classmethod
+    def from_mongo(cls, doc: dict[Any, Any]) -> "DigestSubscription":
+        return cls(
+            doc["channel_id"], DigestFrequencies(doc["frequency"]), doc["category"]
+        )
+
+    def to_mongo(self) -> dict[Any, Any]:
+        return {
+            "channel_id": self.channel_id,
+            "frequency": self.frequency.value,
+            "category": self.category,
+        }
+
+
 @dataclass
 class DiscordServer(MongoCollectionItem):
     id: int
     fetch_server: str
+    # servers configured before digests existed have none stored
+    digests: list[DigestSubscription] = field(default_factory=list)
 
     @override
     @classmethod
     def from_mongo(cls, doc: dict[Any, Any]) -> "DiscordServer":
-        return cls(doc["id"], doc["fetch_server"])
+        return cls(
+            doc["id"],
+            doc["fetch_server"],
+            [
+                DigestSubscription.from_mongo(digest)
+                for digest in doc.get("digests", [])
+            ],
+        )
 
     @override
     def to_mongo(self) -> dict[Any, Any]:
-        return {"id": self.id, "fetch_server": self.fetch_server}
+        return {
+            "id": self.id,
+            "fetch_server": self.fetch_server,
+            "digests": [digest.to_mongo() for digest in self.digests],
+        }
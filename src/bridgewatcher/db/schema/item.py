@@ -15,6 +15,10 @@ class Item(MongoCollectionItem):
     shop_subcategory_type: str | None
     city_with_bonus: Cities | None
     crafting_requirements: list[CraftingRequirement] | None
+    # kilograms per unit, what a mount can carry is limited by the total
+    weight: float = 0.0
+    # units that fit into a single inventory slot
+    max_stack_size: int = 1
 
     @override
     @classmethod
@@ -34,6 +38,9 @@ class Item(MongoCollectionItem):
             doc["shop_subcategory_type"],
             city,
             requirements if requirements else None,
+            # catalogs seeded before these existed don't have them
+            doc.get("weight", 0.0),
+            doc.get("max_stack_size", 1),
         )
 
     @override
@@ -51,4 +58,6 @@ class Item(MongoCollectionItem):
                 if self.crafting_requirements
                 else None
             ),
+            "weight": self.weight,
+            "max_stack_size": self.max_stack_size,
         }
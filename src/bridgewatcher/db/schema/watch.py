@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, override
+
+from bridgewatcher.api.model import Cities, Qualities
+
+from .mongo_collection_item import MongoCollectionItem
+
+
+class WatchKinds(StrEnum):
+    # the cheapest sell order drops to the threshold
+    BELOW = "below"
+    # the most expensive sell order rises to the threshold
+    ABOVE = "above"
+    # flipping the item makes at least the threshold in percent of the buy price
+    MARGIN = "margin"
+
+
+@dataclass
+class Watch(MongoCollectionItem):
+    id: str
+    guild_id: int
+    channel_id: int
+    # None for the watches of the whole server, nobody gets mentioned then
+    user_id: int | None
+    # the albion server of the guild, kept here so evaluating the watches
+    # doesn't need the configuration of every guild
+    server: str
+    item_id: str
+    quality: Qualities
+    kind: WatchKinds
+    threshold: int
+    # None to watch every city
+    city: Cities | None
+
+    @override
+    @classmethod
+    def from_mongo(cls, doc: dict[Any, Any]) -> "Watch":
+        return cls(
+            doc["id"],
+            doc["guild_id"],
+            doc["channel_id"],
+            doc["user_id"],
+            doc["server"],
+            doc["item_id"],
+            Qualities.from_int(doc["quality"]),
+            WatchKinds(doc["kind"]),
+            doc["threshold"],
+            Cities.from_str(doc["city"]) if doc["city"] is not None else None,
+        )
+
+    @override
+    def to_mongo(self) -> dict[Any, Any]:
+        return {
+            "id": self.id,
+            "guild_id": self.guild_id,
+            "channel_id": self.channel_id,
+            "user_id": self.user_id,
+            "server": self.server,
+            "item_id": self.item_id,
+            "quality": self.quality.value,
+            "kind": self.kind.value,
+            "threshold": self.threshold,
+            "city": self.city.value if self.city is not None else None,
+        }
@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+from hashlib import sha256
+from json import dumps
+from typing import Any, Awaitable, Callable
+
+CONTENT_HASH_FIELD = "content_hash"
+
+
+@dataclass
+class CatalogChangeSet:
+    collection: str
+    key: str
+    inserted: list[dict[str, Any]] = field(default_factory=list)
+    updated: list[dict[str, Any]] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    # set when the whole collection has been replaced, listeners should
+    # rebuild everything from scratch instead of patching themselves
+    full_reseed: bool = False
+
+    @property
+    def size(self) -> int:
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.size == 0
+
+
+CatalogListener = Callable[[CatalogChangeSet], Awaitable[None]]
+
+_listeners: list[CatalogListener] = []
+
+
+def add_catalog_listener(listener: CatalogListener) -> None:
+    _listeners.append(listener)
+
+
+async def notify_catalog_listeners(changes: CatalogChangeSet) -> None:
+    for listener in _listeners:
+        await listener(changes)
+
+
+def get_content_hash(doc: dict[str, Any]) -> str:
+    content = dumps(doc, sort_keys=True, separators=(",", ":"))
+    return sha256(content.encode("utf-8")).hexdigest()
+
+
+def with_content_hashes(docs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    return [{**doc, CONTENT_HASH_FIELD: get_content_hash(doc)} for doc in docs]
+
+
+def diff_catalog(
+    collection: str,
+    key: str,
+    stored_hashes: dict[str, str | None],
+    docs: list[dict[str, Any]],
+) -> CatalogChangeSet:
+    changes = CatalogChangeSet(collection, key)
+
+    seen = set()
+    for doc in docs:
+        doc_key = doc[key]
+        # the dumps aren't guaranteed to be free of duplicates, the first
+        # occurrence wins just like it does for find_one on a full reseed
+        if doc_key in seen:
+            continue
+        seen.add(doc_key)
+
+        if doc_key not in stored_hashes:
+            changes.inserted.append(doc)
+        elif stored_hashes[doc_key] != doc[CONTENT_HASH_FIELD]:
+            changes.updated.append(doc)
+
+    changes.deleted = [doc_key for doc_key in stored_hashes if doc_key not in seen]
+    return changes
@@ -1,18 +1,32 @@
-from asyncio import run
+from asyncio import Lock, gather, run, sleep
 from copy import copy
 from datetime import datetime, timezone
 from hashlib import sha256
 from json import dumps, loads
+from os import getenv
+from time import perf_counter
 from typing import Any
 
 from aiohttp import ClientSession
-from pymongo.collation import Collation
 
 from bridgewatcher.api.model import Cities
-from bridgewatcher.db import db
+from bridgewatcher.compute import COMPUTE, pickle_chunks, unpickle_chunks
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import is_catalog_ready, mark_catalog_ready
+from bridgewatcher.db.coordination import lease
 from bridgewatcher.db.schema import Version, Item, CraftingRequirement, ItemName
+from bridgewatcher.db.seed.diff import (
+    CatalogChangeSet,
+    diff_catalog,
+    notify_catalog_listeners,
+    with_content_hashes,
+)
 from bridgewatcher.loggers import LOGGER
 
+# bumped whenever the items are stored with new fields: 2 added the weight
+# and the max stack size
+CATALOG_FORMAT = 2
+
 ITEMS_URL = "https://raw.githubusercontent.com/ao-data/ao-bin-dumps/refs/heads/master/items.json"
 ITEM_NAMES_URL = "https://raw.githubusercontent.com/ao-data/ao-bin-dumps/refs/heads/master/formatted/items.txt"
 
@@ -42,6 +56,14 @@ CAN_BE_ENCHANTED = (
     # "crafting", for some reason the ao dump does include the enchanted versions of raw and refined materials
 )
 
+INCREMENTAL_UPDATE_THRESHOLD = 0.2
+
+SEEDING_CHECK_PERIOD = 60 * 60 * 6
+SEEDING_RETRY_DELAY = 30
+# long enough for the slowest full reseed, a process that died midway
+# doesn't keep the others from seeding for longer than that
+SEEDING_LEASE = 60 * 30
+
 REFINED_RESOURCES = ("PLANKS", "METALBAR", "LEATHER", "CLOTH", "STONEBLOCK")
 RAW_RESOURCES = ("WOOD", "ORE", "HIDE", "FIBER", "ROCK")
 
@@ -103,6 +125,8 @@ CITIES_WITH_CRAFTING_BONUSES = {
     Cities.BRECILIEN: ["accessoires_capes_capes", "bags", "potions"],
 }
 
+_seeding_lock = Lock()
+
 
 def get_crafting_requirements(
     source_requirements: dict[Any, Any],
@@ -190,22 +214,14 @@ def get_enchanted_versions_of_item(item: Item) -> list[Item]:
 # There's a lot of ambiguity with this schema, for example craftresource may be not an array
 # but a map if there's only one craft resource. Or it can also be absent if there's no
 # crafting requirements instead of having a null value
-async def seed_items_collection() -> None:
-    async with ClientSession() as session:
-        async with session.get(ITEMS_URL) as res:
-            if not res.ok:
-                raise ValueError("Unsatisfied response gotten from items dump")
-            dump_items: dict[str, Any] = loads(await res.text())["items"]
-
-    items_collection = db.get_collection("items")
-    await items_collection.drop()
-    await items_collection.create_index("name")
-
+def parse_items_dump(content: str) -> list[dict[str, Any]]:
+    dump_items: dict[str, Any] = loads(content)["items"]
     dump_items = {
         k: v for k, v in dump_items.items() if k not in NOT_INCLUDED_IN_DATABASE
     }
+
+    items = []
     for category_items in dump_items.values():
-        items = []
         for category_item in category_items:
             # this is the most stupid shit ive ever done, messing up with the types
             # of the variable but hey, python allows me to write shitty code, why not
@@ -224,35 +240,22 @@ async def seed_items_collection() -> None:
                 category_item.get("@shopsubcategory2"),
                 city_with_bonus,
                 requirements if requirements else None,
+                float(category_item.get("@weight", 0)),
+                int(category_item.get("@maxstacksize", 1)),
             )
             items.append(item.to_mongo())
 
             enchanted_items = map(Item.to_mongo, get_enchanted_versions_of_item(item))
             items.extend(enchanted_items)
 
-        await items_collection.insert_many(items)
+    return items
 
 
 # This file is formatted differently but easily understandable. Here's an example:
 # 1: ITEM_UNIQUE_NAME                   : Item Readable Name
 # 2: MUCH_LONGER_ITEM_UNIQUE_NAME       : Much Longer Item Readable Name
 # 3: ITEM_WITH_MISSING_READABLE_NAME
-async def seed_item_names_collection() -> None:
-    async with ClientSession() as session:
-        async with session.get(ITEM_NAMES_URL) as res:
-            if not res.ok:
-                raise ValueError("Unsatisfied response gotten from item names dump")
-            content = await res.text()
-
-    names_collection = db.get_collection("item_names")
-    await names_collection.drop()
-
-    names_collection = await db.create_collection(
-        "item_names", collation=Collation(locale="en_US", strength=2)
-    )
-    await names_collection.create_index("id")
-    await names_collection.create_index("name")
-
+def parse_item_names_dump(content: str) -> list[dict[str, Any]]:
     names = []
     lines = content.split("\n")
     for line in lines:
@@ -271,54 +274,198 @@ async def seed_item_names_collection() -> None:
             id = id[:-2]
 
         names.append(ItemName(id, name).to_mongo())
-    await names_collection.insert_many(names)
-
+    return names
 
-async def add_needed_constraints() -> None:
-    servers = db.get_collection("discord_servers")
-    await servers.create_index("id", unique=True)
 
-
-async def seed() -> None:
-    await add_needed_constraints()
-    await seed_items_collection()
-    await seed_item_names_collection()
+# local stand-ins of the dumps, only for benchmarks and testing
+def get_dump_urls() -> tuple[str, str]:
+    return (
+        getenv("ITEMS_DUMP_URL") or ITEMS_URL,
+        getenv("ITEM_NAMES_DUMP_URL") or ITEM_NAMES_URL,
+    )
 
 
-async def get_current_hash() -> str:
+async def fetch_dump(url: str) -> str:
     async with ClientSession() as session:
-        async with session.get(ITEMS_URL) as res:
+        async with session.get(url) as res:
             if not res.ok:
-                raise ValueError("Unsatisfied response gotten from items dump")
-            json = loads(await res.text())
-            content = dumps(json, separators=(":", ","))
+                raise ValueError(f"Unsatisfied response gotten from {url}")
+            return await res.text()
+
+
+def get_dump_hash(content: str) -> str:
+    json = loads(content)
+    content = dumps(json, separators=(":", ","))
     return sha256(content.encode("utf-8")).hexdigest()
 
 
-async def update_hash(hash: str) -> None:
-    version_collection = db.get_collection("version")
-    await version_collection.drop()
+# What's stored as the version of the catalog, the hash of the dump along with
+# the format of the items it was seeded in. Items seeded in an older format
+# miss fields, so the catalog is seeded again even if the dump stayed the same
+def get_catalog_version(dump_hash: str) -> str:
+    return f"{CATALOG_FORMAT}:{dump_hash}"
 
-    version = Version(hash, datetime.now(timezone.utc))
-    await version_collection.insert_one(version.to_mongo())
+
+# Parsing and hashing the whole dump keeps a core busy for seconds, so it
+# runs in the process pool and the bot keeps answering in the meantime
+def prepare_catalog(
+    items_content: str, names_content: str
+) -> tuple[list[bytes], list[bytes]]:
+    return (
+        pickle_chunks(with_content_hashes(parse_items_dump(items_content))),
+        pickle_chunks(with_content_hashes(parse_item_names_dump(names_content))),
+    )
 
 
-async def seed_if_needed(forced: bool = False) -> None:
-    current_hash = await get_current_hash()
+async def reseed(
+    items: list[dict[str, Any]], names: list[dict[str, Any]], hash: str
+) -> None:
+    await backends.store.replace_catalog(items, names, hash)
+
+    await notify_catalog_listeners(
+        CatalogChangeSet("items", "name", inserted=items, full_reseed=True)
+    )
+    await notify_catalog_listeners(
+        CatalogChangeSet("item_names", "id", inserted=names, full_reseed=True)
+    )
+
+
+async def get_catalog_changes(
+    collection_name: str, key: str, docs: list[dict[str, Any]]
+) -> CatalogChangeSet | None:
+    stored_hashes = await backends.store.get_content_hashes(collection_name, key)
+    changes = diff_catalog(collection_name, key, stored_hashes, docs)
+    # a patch that touches a large chunk of the catalog (or a catalog seeded
+    # before content hashes existed) is cheaper to rebuild than to patch
+    if (
+        not stored_hashes
+        or changes.size > len(stored_hashes) * INCREMENTAL_UPDATE_THRESHOLD
+    ):
+        return None
+    return changes
+
+
+async def apply_catalog_changes(changes: CatalogChangeSet) -> None:
+    LOGGER.info(
+        f"Updating {changes.collection}: {len(changes.inserted)} inserted, "
+        f"{len(changes.updated)} updated, {len(changes.deleted)} deleted"
+    )
+    if changes.is_empty:
+        return
+
+    await backends.store.apply_catalog_changes(changes)
+    await notify_catalog_listeners(changes)
+
+
+async def seed(
+    items_content: str, names_content: str, hash: str, forced: bool = False
+) -> None:
+    await backends.store.add_needed_constraints()
+
+    items_chunks, names_chunks = await COMPUTE.run(
+        prepare_catalog, items_content, names_content
+    )
+    items = await unpickle_chunks(items_chunks)
+    names = await unpickle_chunks(names_chunks)
 
     if not forced:
-        version_doc = await db.get_collection("version").find_one()
-        if version_doc is not None:
-            version = Version.from_mongo(version_doc)
-            if version.hash == current_hash:
-                LOGGER.info("Hashes match. No seeding will run")
-                return
-    else:
-        LOGGER.info("Forced seeding detected")
+        item_changes, name_changes = await gather(
+            get_catalog_changes("items", "name", items),
+            get_catalog_changes("item_names", "id", names),
+        )
+        if item_changes is not None and name_changes is not None:
+            await apply_catalog_changes(item_changes)
+            await apply_catalog_changes(name_changes)
+            return
+
+    LOGGER.info("Rebuilding the whole catalog")
+    await reseed(items, names, hash)
+
+
+async def get_current_hash() -> str:
+    items_url, _ = get_dump_urls()
+    dump_hash = await COMPUTE.run(get_dump_hash, await fetch_dump(items_url))
+    return get_catalog_version(dump_hash)
+
+
+async def update_hash(hash: str) -> None:
+    version = Version(hash, datetime.now(timezone.utc))
+    await backends.store.set_version(version.to_mongo())
+
+
+# Returns False when another process is seeding already, it may well be
+# another cluster of the same bot
+async def seed_if_needed(forced: bool = False) -> bool:
+    async with _seeding_lock, lease("seeding", SEEDING_LEASE) as acquired:
+        if not acquired:
+            LOGGER.info("The catalog is being seeded by another process")
+            return False
+
+        # a catalog that doesn't need seeding still gets the indexes added
+        # since it was seeded, creating them again costs nothing
+        await backends.store.add_needed_constraints()
+
+        items_url, names_url = get_dump_urls()
+        content = await fetch_dump(items_url)
+        current_hash = get_catalog_version(await COMPUTE.run(get_dump_hash, content))
+
+        if not forced:
+            version_doc = await backends.store.get_version()
+            if version_doc is not None:
+                version = Version.from_mongo(version_doc)
+                if version.hash == current_hash:
+                    LOGGER.info("Hashes match. No seeding will run")
+                    return True
+        else:
+            LOGGER.info("Forced seeding detected")
+
+        LOGGER.info("Seeding the database")
+        started = perf_counter()
+        names_content = await fetch_dump(names_url)
+        await seed(content, names_content, current_hash, forced)
+        # the version only advances once the whole change set has landed, so a
+        # seeding that failed midway is simply diffed again on the next run
+        await update_hash(current_hash)
+        LOGGER.info(f"Seeding finished in {perf_counter() - started:.2f}s")
+        return True
+
+
+async def supervise_seeding(period: float = SEEDING_CHECK_PERIOD) -> None:
+    retry_delay = SEEDING_RETRY_DELAY
+    while True:
+        try:
+            # if there's any catalog already, it's good enough to serve
+            # commands while the dump is being checked, seeding never takes
+            # the live collections down
+            if (
+                not is_catalog_ready()
+                and await backends.store.get_version() is not None
+            ):
+                mark_catalog_ready()
+
+            seeded = await seed_if_needed()
+            # whoever is seeding right now sets the version once it's done
+            waiting = (
+                not seeded
+                and not is_catalog_ready()
+                and await backends.store.get_version() is None
+            )
+        except Exception:
+            LOGGER.exception(f"Seeding failed, retrying in {retry_delay}s")
+            await sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, period)
+            continue
+
+        if waiting:
+            await sleep(SEEDING_RETRY_DELAY)
+            continue
+
+        if not is_catalog_ready():
+            LOGGER.info("Item catalog is ready")
+            mark_catalog_ready()
 
-    LOGGER.info("Seeding the database")
-    await seed()
-    await update_hash(current_hash)
+        retry_delay = SEEDING_RETRY_DELAY
+        await sleep(period)
 
 
 def seed_if_needed_sync(forced: bool = False) -> None:
@@ -0,0 +1,3 @@
+from .base import Store
+
+__all__ = ("Store",)
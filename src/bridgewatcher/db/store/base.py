@@ -0,0 +1,121 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+from bridgewatcher.db.seed.diff import CatalogChangeSet
+
+
+# Every backend speaks in the same documents the schemas produce with to_mongo
+# and consume with from_mongo, so nothing above this layer has to care whether
+# the data lives in MongoDB or in a local SQLite file
+class Store(ABC):
+    @abstractmethod
+    async def start(self) -> None:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def find_item(self, name: str) -> dict[str, Any] | None:
+        pass
+
+    # The items out of names that exist, in a single query
+    @abstractmethod
+    async def find_items_named(self, names: list[str]) -> list[dict[str, Any]]:
+        pass
+
+    # The whole catalog when no category is given
+    @abstractmethod
+    async def find_items(self, category: str | None = None) -> list[dict[str, Any]]:
+        pass
+
+    # Every recipe with at least one of the materials in its requirements,
+    # looked up through an index of the requirements
+    @abstractmethod
+    async def find_items_using(self, materials: list[str]) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def find_item_name(self, id: str) -> dict[str, Any] | None:
+        pass
+
+    @abstractmethod
+    async def search_item_names(self, query: str, limit: int) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def find_server(self, id: int) -> dict[str, Any] | None:
+        pass
+
+    @abstractmethod
+    async def insert_server(self, doc: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def update_server(self, id: int, fields: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_server(self, id: int) -> None:
+        pass
+
+    # Only the servers subscribed to at least one digest
+    @abstractmethod
+    async def get_digest_servers(self) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def find_watches(self, guild_id: int) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def get_all_watches(self) -> list[dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def insert_watch(self, doc: dict[str, Any]) -> None:
+        pass
+
+    # Returns whether there was such a watch in the guild
+    @abstractmethod
+    async def delete_watch(self, guild_id: int, id: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def update_watches(self, guild_id: int, fields: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_watches(self, guild_id: int) -> None:
+        pass
+
+    @abstractmethod
+    async def get_version(self) -> dict[str, Any] | None:
+        pass
+
+    @abstractmethod
+    async def set_version(self, doc: dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def add_needed_constraints(self) -> None:
+        pass
+
+    @abstractmethod
+    async def get_content_hashes(
+        self, collection: str, key: str
+    ) -> dict[str, str | None]:
+        pass
+
+    @abstractmethod
+    async def apply_catalog_changes(self, changes: CatalogChangeSet) -> None:
+        pass
+
+    # Swaps the whole catalog at once, readers must keep seeing the old one
+    # until the new one is complete
+    @abstractmethod
+    async def replace_catalog(
+        self, items: list[dict[str, Any]], names: list[dict[str, Any]], hash: str
+    ) -> None:
+        pass
@@ -0,0 +1,257 @@
+from asyncio import gather
+from itertools import batched
+from re import IGNORECASE, compile, escape
+from typing import Any, override
+
+from pymongo import DeleteMany, InsertOne, ReplaceOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.collation import Collation
+
+from bridgewatcher.db.seed.diff import CONTENT_HASH_FIELD, CatalogChangeSet
+from bridgewatcher.db.store.base import Store
+from bridgewatcher.metrics import instrument_query
+from bridgewatcher.loggers import LOGGER
+
+LIVE_CATALOG_COLLECTIONS = ("items", "item_names")
+SHADOW_COLLECTION_SEPARATOR = "__"
+INSERT_BATCH_SIZE = 1000
+
+
+def get_shadow_collection_name(live_name: str, hash: str) -> str:
+    return f"{live_name}{SHADOW_COLLECTION_SEPARATOR}{hash[:12]}"
+
+
+def get_bulk_operations(
+    changes: CatalogChangeSet,
+) -> list[InsertOne | ReplaceOne | DeleteMany]:
+    operations: list[InsertOne | ReplaceOne | DeleteMany] = [
+        InsertOne(doc) for doc in changes.inserted
+    ]
+    operations.extend(
+        ReplaceOne({changes.key: doc[changes.key]}, doc) for doc in changes.updated
+    )
+    if changes.deleted:
+        operations.append(DeleteMany({changes.key: {"$in": changes.deleted}}))
+    return operations
+
+
+class MongoStore(Store):
+    def __init__(self, db: AsyncDatabase) -> None:
+        self.db = db
+
+    @override
+    async def start(self) -> None:
+        await self.db.client.admin.command("ping")
+
+    @override
+    async def close(self) -> None:
+        await self.db.client.close()
+
+    @override
+    @instrument_query("items")
+    async def find_item(self, name: str) -> dict[str, Any] | None:
+        return await self.db.get_collection("items").find_one({"name": name})
+
+    @override
+    @instrument_query("items")
+    async def find_items_named(self, names: list[str]) -> list[dict[str, Any]]:
+        items = self.db.get_collection("items")
+        return await items.find({"name": {"$in": names}}).to_list()
+
+    @override
+    @instrument_query("items")
+    async def find_items(self, category: str | None = None) -> list[dict[str, Any]]:
+        filter = {"shop_category": category} if category is not None else {}
+        return await self.db.get_collection("items").find(filter).to_list()
+
+    @override
+    @instrument_query("items")
+    async def find_items_using(self, materials: list[str]) -> list[dict[str, Any]]:
+        items = self.db.get_collection("items")
+        return await items.find(
+            {"crafting_requirements.name": {"$in": materials}}
+        ).to_list()
+
+    @override
+    @instrument_query("item_names")
+    async def find_item_name(self, id: str) -> dict[str, Any] | None:
+        return await self.db.get_collection("item_names").find_one({"id": id})
+
+    @override
+    @instrument_query("item_names")
+    async def search_item_names(self, query: str, limit: int) -> list[dict[str, Any]]:
+        names = self.db.get_collection("item_names")
+        regex = compile(f"^.*{escape(query)}.*$", IGNORECASE)
+        return await names.find({"name": regex}, limit=limit).to_list()
+
+    @override
+    @instrument_query("discord_servers")
+    async def find_server(self, id: int) -> dict[str, Any] | None:
+        return await self.db.get_collection("discord_servers").find_one({"id": id})
+
+    @override
+    @instrument_query("discord_servers")
+    async def insert_server(self, doc: dict[str, Any]) -> None:
+        await self.db.get_collection("discord_servers").insert_one(doc)
+
+    @override
+    @instrument_query("discord_servers")
+    async def update_server(self, id: int, fields: dict[str, Any]) -> None:
+        servers = self.db.get_collection("discord_servers")
+        await servers.update_one(filter={"id": id}, update={"$set": fields})
+
+    @override
+    @instrument_query("discord_servers")
+    async def delete_server(self, id: int) -> None:
+        await self.db.get_collection("discord_servers").delete_one({"id": id})
+
+    @override
+    @instrument_query("discord_servers")
+    async def get_digest_servers(self) -> list[dict[str, Any]]:
+        servers = self.db.get_collection("discord_servers")
+        return await servers.find({"digests.0": {"$exists": True}}).to_list()
+
+    @override
+    @instrument_query("watches")
+    async def find_watches(self, guild_id: int) -> list[dict[str, Any]]:
+        watches = self.db.get_collection("watches")
+        return await watches.find({"guild_id": guild_id}).to_list()
+
+    @override
+    @instrument_query("watches")
+    async def get_all_watches(self) -> list[dict[str, Any]]:
+        return await self.db.get_collection("watches").find().to_list()
+
+    @override
+    @instrument_query("watches")
+    async def insert_watch(self, doc: dict[str, Any]) -> None:
+        await self.db.get_collection("watches").insert_one(doc)
+
+    @override
+    @instrument_query("watches")
+    async def delete_watch(self, guild_id: int, id: str) -> bool:
+        watches = self.db.get_collection("watches")
+        result = await watches.delete_one({"guild_id": guild_id, "id": id})
+        return result.deleted_count > 0
+
+    @override
+    @instrument_query("watches")
+    async def update_watches(self, guild_id: int, fields: dict[str, Any]) -> None:
+        watches = self.db.get_collection("watches")
+        await watches.update_many({"guild_id": guild_id}, {"$set": fields})
+
+    @override
+    @instrument_query("watches")
+    async def delete_watches(self, guild_id: int) -> None:
+        await self.db.get_collection("watches").delete_many({"guild_id": guild_id})
+
+    @override
+    @instrument_query("version")
+    async def get_version(self) -> dict[str, Any] | None:
+        return await self.db.get_collection("version").find_one()
+
+    @override
+    @instrument_query("version")
+    async def set_version(self, doc: dict[str, Any]) -> None:
+        await self.db.get_collection("version").replace_one({}, doc, upsert=True)
+
+    @override
+    async def add_needed_constraints(self) -> None:
+        servers = self.db.get_collection("discord_servers")
+        await servers.create_index("id", unique=True)
+        watches = self.db.get_collection("watches")
+        await watches.create_index("id", unique=True)
+        await watches.create_index("guild_id")
+        # a reseed builds these on the new collection, a catalog that hasn't
+        # changed since before they existed never gets reseeded
+        items = self.db.get_collection("items")
+        await items.create_index("name")
+        await items.create_index("crafting_requirements.name")
+
+    @override
+    async def get_content_hashes(
+        self, collection: str, key: str
+    ) -> dict[str, str | None]:
+        cursor = self.db.get_collection(collection).find(
+            {}, projection={key: 1, CONTENT_HASH_FIELD: 1, "_id": 0}
+        )
+        return {doc[key]: doc.get(CONTENT_HASH_FIELD) async for doc in cursor}
+
+    @override
+    async def apply_catalog_changes(self, changes: CatalogChangeSet) -> None:
+        collection = self.db.get_collection(changes.collection)
+        await collection.bulk_write(get_bulk_operations(changes), ordered=False)
+
+    async def _insert_in_parallel(
+        self, collection: AsyncCollection, docs: list[dict[str, Any]]
+    ) -> None:
+        # the shadow collection isn't visible to anybody yet, so there's no point
+        # in keeping the insertion order, mongo is way faster with unordered batches
+        await gather(
+            *(
+                collection.insert_many(batch, ordered=False)
+                for batch in batched(docs, INSERT_BATCH_SIZE)
+            )
+        )
+
+    async def _seed_items_collection(
+        self, items: list[dict[str, Any]], hash: str
+    ) -> AsyncCollection:
+        shadow_name = get_shadow_collection_name("items", hash)
+        await self.db.drop_collection(shadow_name)
+        shadow = self.db.get_collection(shadow_name)
+
+        await self._insert_in_parallel(shadow, items)
+        await shadow.create_index("name")
+        # the reverse of the crafting requirements, which recipes a material
+        # goes into
+        await shadow.create_index("crafting_requirements.name")
+        return shadow
+
+    async def _seed_item_names_collection(
+        self, names: list[dict[str, Any]], hash: str
+    ) -> AsyncCollection:
+        shadow_name = get_shadow_collection_name("item_names", hash)
+        await self.db.drop_collection(shadow_name)
+        shadow = await self.db.create_collection(
+            shadow_name, collation=Collation(locale="en_US", strength=2)
+        )
+
+        await self._insert_in_parallel(shadow, names)
+        await shadow.create_index("id")
+        await shadow.create_index("name")
+        return shadow
+
+    # Leftovers of seedings that crashed midway before the switch happened
+    async def _collect_garbage(self) -> None:
+        for name in await self.db.list_collection_names():
+            if any(
+                name.startswith(f"{live_name}{SHADOW_COLLECTION_SEPARATOR}")
+                for live_name in LIVE_CATALOG_COLLECTIONS
+            ):
+                LOGGER.info(f"Dropping stale shadow collection {name}")
+                await self.db.drop_collection(name)
+
+    # Everything is written into shadow collections first, so the bot keeps serving
+    # the old catalog while the new one is being built. Renaming with dropTarget
+    # swaps a live collection atomically and gets rid of its old version at once,
+    # but the two collections are swapped one after the other. The names go
+    # first: new names next to the old items only name items that aren't there
+    # yet, while new items without their names couldn't be found at all. If the
+    # items fail to switch, the version isn't advanced, so the next check seeds
+    # again and the garbage collection drops the leftover shadow
+    @override
+    @instrument_query("catalog")
+    async def replace_catalog(
+        self, items: list[dict[str, Any]], names: list[dict[str, Any]], hash: str
+    ) -> None:
+        await self._collect_garbage()
+
+        items_shadow, names_shadow = await gather(
+            self._seed_items_collection(items, hash),
+            self._seed_item_names_collection(names, hash),
+        )
+
+        await names_shadow.rename("item_names", dropTarget=True)
+        await items_shadow.rename("items", dropTarget=True)
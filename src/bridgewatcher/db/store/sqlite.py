@@ -0,0 +1,412 @@
+from asyncio import Lock
+from datetime import datetime
+from json import dumps, loads
+from typing import Any, override
+
+from aiosqlite import Connection, connect
+
+from bridgewatcher.db.seed.diff import CONTENT_HASH_FIELD, CatalogChangeSet
+from bridgewatcher.db.store.base import Store
+from bridgewatcher.metrics import instrument_query
+
+# FTS5 with the trigram tokenizer gives the same case insensitive substring
+# search the mongo regex does, but through an index instead of a full scan
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    name TEXT PRIMARY KEY,
+    doc TEXT NOT NULL,
+    content_hash TEXT
+);
+
+-- the reverse of the crafting requirements, which recipes a material goes into.
+-- INSERT OR REPLACE doesn't fire the delete trigger, so inserting clears the
+-- rows of the item first
+CREATE TABLE IF NOT EXISTS item_requirements (
+    material TEXT NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS item_requirements_material ON item_requirements (material);
+CREATE INDEX IF NOT EXISTS item_requirements_item ON item_requirements (item);
+CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+    DELETE FROM item_requirements WHERE item = new.name;
+    INSERT INTO item_requirements (material, item)
+    SELECT json_extract(value, '$.name'), new.name
+    FROM json_each(new.doc, '$.crafting_requirements')
+    WHERE json_type(new.doc, '$.crafting_requirements') = 'array';
+END;
+CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+    DELETE FROM item_requirements WHERE item = old.name;
+END;
+-- catalogs seeded before the table existed
+INSERT INTO item_requirements (material, item)
+SELECT json_extract(requirement.value, '$.name'), items.name
+FROM items, json_each(items.doc, '$.crafting_requirements') AS requirement
+WHERE json_type(items.doc, '$.crafting_requirements') = 'array'
+AND NOT EXISTS (SELECT 1 FROM item_requirements);
+
+CREATE TABLE IF NOT EXISTS item_names (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL COLLATE NOCASE,
+    name TEXT NOT NULL COLLATE NOCASE,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS item_names_id ON item_names (id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS item_names_fts USING fts5(
+    name, content='item_names', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS item_names_ai AFTER INSERT ON item_names BEGIN
+    INSERT INTO item_names_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS item_names_ad AFTER DELETE ON item_names BEGIN
+    INSERT INTO item_names_fts (item_names_fts, rowid, name)
+    VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS item_names_au AFTER UPDATE ON item_names BEGIN
+    INSERT INTO item_names_fts (item_names_fts, rowid, name)
+    VALUES ('delete', old.rowid, old.name);
+    INSERT INTO item_names_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+
+CREATE TABLE IF NOT EXISTS discord_servers (
+    id INTEGER PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS watches (
+    id TEXT PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS watches_guild_id ON watches (guild_id);
+
+CREATE TABLE IF NOT EXISTS version (
+    singleton INTEGER PRIMARY KEY CHECK (singleton = 1),
+    hash TEXT NOT NULL,
+    last_time_updated TEXT NOT NULL
+);
+"""
+
+# trigrams need at least three characters, anything shorter falls back to LIKE
+MIN_FTS_QUERY_LENGTH = 3
+
+
+def _to_row(doc: dict[str, Any]) -> str:
+    return dumps({k: v for k, v in doc.items() if k != "_id"})
+
+
+def _escape_like(query: str) -> str:
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# All the statements below are constant strings with bound parameters, sqlite3
+# keeps them compiled in its per-connection statement cache, so every lookup
+# after the first one runs a prepared statement.
+#
+# Reads and writes go through separate connections: a reader never sees a
+# half-applied seeding and a write can't commit somebody else's transaction.
+# Because of that the path has to be a real file and not :memory:
+class SqliteStore(Store):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._reader: Connection | None = None
+        self._writer: Connection | None = None
+        self._connection_lock = Lock()
+        self._write_lock = Lock()
+
+    async def _connect(self) -> tuple[Connection, Connection]:
+        if self._reader is not None and self._writer is not None:
+            return self._reader, self._writer
+
+        async with self._connection_lock:
+            if self._reader is None or self._writer is None:
+                writer = await connect(self.path, cached_statements=256)
+                await writer.execute("PRAGMA journal_mode=WAL")
+                await writer.execute("PRAGMA synchronous=NORMAL")
+                await writer.executescript(SCHEMA)
+                await writer.commit()
+
+                self._reader = await connect(self.path, cached_statements=256)
+                self._writer = writer
+        return self._reader, self._writer  # type: ignore
+
+    async def _fetch_one(self, sql: str, parameters: tuple = ()) -> Any:
+        reader, _ = await self._connect()
+        async with reader.execute(sql, parameters) as cursor:
+            return await cursor.fetchone()
+
+    async def _fetch_all(self, sql: str, parameters: tuple = ()) -> list[Any]:
+        reader, _ = await self._connect()
+        async with reader.execute(sql, parameters) as cursor:
+            return list(await cursor.fetchall())
+
+    async def _write(self, sql: str, parameters: tuple = ()) -> None:
+        _, writer = await self._connect()
+        async with self._write_lock:
+            await writer.execute(sql, parameters)
+            await writer.commit()
+
+    @override
+    async def start(self) -> None:
+        await self._connect()
+
+    @override
+    async def close(self) -> None:
+        for connection in (self._reader, self._writer):
+            if connection is not None:
+                await connection.close()
+        self._reader = None
+        self._writer = None
+
+    @override
+    @instrument_query("items")
+    async def find_item(self, name: str) -> dict[str, Any] | None:
+        row = await self._fetch_one("SELECT doc FROM items WHERE name = ?", (name,))
+        return loads(row[0]) if row is not None else None
+
+    @override
+    @instrument_query("items")
+    async def find_items_named(self, names: list[str]) -> list[dict[str, Any]]:
+        if not names:
+            return []
+        placeholders = ", ".join("?" * len(names))
+        rows = await self._fetch_all(
+            f"SELECT doc FROM items WHERE name IN ({placeholders})", tuple(names)
+        )
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("items")
+    async def find_items(self, category: str | None = None) -> list[dict[str, Any]]:
+        if category is None:
+            rows = await self._fetch_all("SELECT doc FROM items")
+        else:
+            rows = await self._fetch_all(
+                "SELECT doc FROM items WHERE json_extract(doc, '$.shop_category') = ?",
+                (category,),
+            )
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("items")
+    async def find_items_using(self, materials: list[str]) -> list[dict[str, Any]]:
+        if not materials:
+            return []
+        placeholders = ", ".join("?" * len(materials))
+        rows = await self._fetch_all(
+            "SELECT doc FROM items WHERE name IN ("
+            "SELECT item FROM item_requirements "
+            f"WHERE material IN ({placeholders}))",
+            tuple(materials),
+        )
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("item_names")
+    async def find_item_name(self, id: str) -> dict[str, Any] | None:
+        row = await self._fetch_one(
+            "SELECT id, name FROM item_names WHERE id = ? ORDER BY rowid LIMIT 1",
+            (id,),
+        )
+        return {"id": row[0], "name": row[1]} if row is not None else None
+
+    @override
+    @instrument_query("item_names")
+    async def search_item_names(self, query: str, limit: int) -> list[dict[str, Any]]:
+        if len(query) >= MIN_FTS_QUERY_LENGTH:
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = await self._fetch_all(
+                "SELECT item_names.id, item_names.name FROM item_names_fts "
+                "JOIN item_names ON item_names.rowid = item_names_fts.rowid "
+                "WHERE item_names_fts MATCH ? ORDER BY item_names.rowid LIMIT ?",
+                (phrase, limit),
+            )
+        else:
+            rows = await self._fetch_all(
+                "SELECT id, name FROM item_names WHERE name LIKE ? ESCAPE '\\' "
+                "ORDER BY rowid LIMIT ?",
+                (f"%{_escape_like(query)}%", limit),
+            )
+        return [{"id": id, "name": name} for id, name in rows]
+
+    @override
+    @instrument_query("discord_servers")
+    async def find_server(self, id: int) -> dict[str, Any] | None:
+        row = await self._fetch_one(
+            "SELECT doc FROM discord_servers WHERE id = ?", (id,)
+        )
+        return loads(row[0]) if row is not None else None
+
+    @override
+    @instrument_query("discord_servers")
+    async def insert_server(self, doc: dict[str, Any]) -> None:
+        await self._write(
+            "INSERT INTO discord_servers (id, doc) VALUES (?, ?)",
+            (doc["id"], _to_row(doc)),
+        )
+
+    @override
+    @instrument_query("discord_servers")
+    async def update_server(self, id: int, fields: dict[str, Any]) -> None:
+        await self._write(
+            "UPDATE discord_servers SET doc = json_patch(doc, ?) WHERE id = ?",
+            (dumps(fields), id),
+        )
+
+    @override
+    @instrument_query("discord_servers")
+    async def delete_server(self, id: int) -> None:
+        await self._write("DELETE FROM discord_servers WHERE id = ?", (id,))
+
+    @override
+    @instrument_query("discord_servers")
+    async def get_digest_servers(self) -> list[dict[str, Any]]:
+        # servers without any digests stored give NULL, which isn't above 0
+        rows = await self._fetch_all(
+            "SELECT doc FROM discord_servers "
+            "WHERE json_array_length(doc, '$.digests') > 0"
+        )
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("watches")
+    async def find_watches(self, guild_id: int) -> list[dict[str, Any]]:
+        rows = await self._fetch_all(
+            "SELECT doc FROM watches WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+        )
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("watches")
+    async def get_all_watches(self) -> list[dict[str, Any]]:
+        rows = await self._fetch_all("SELECT doc FROM watches")
+        return [loads(row[0]) for row in rows]
+
+    @override
+    @instrument_query("watches")
+    async def insert_watch(self, doc: dict[str, Any]) -> None:
+        await self._write(
+            "INSERT INTO watches (id, guild_id, doc) VALUES (?, ?, ?)",
+            (doc["id"], doc["guild_id"], _to_row(doc)),
+        )
+
+    @override
+    @instrument_query("watches")
+    async def delete_watch(self, guild_id: int, id: str) -> bool:
+        _, writer = await self._connect()
+        async with self._write_lock:
+            cursor = await writer.execute(
+                "DELETE FROM watches WHERE guild_id = ? AND id = ?", (guild_id, id)
+            )
+            await writer.commit()
+        return cursor.rowcount > 0
+
+    @override
+    @instrument_query("watches")
+    async def update_watches(self, guild_id: int, fields: dict[str, Any]) -> None:
+        await self._write(
+            "UPDATE watches SET doc = json_patch(doc, ?) WHERE guild_id = ?",
+            (dumps(fields), guild_id),
+        )
+
+    @override
+    @instrument_query("watches")
+    async def delete_watches(self, guild_id: int) -> None:
+        await self._write("DELETE FROM watches WHERE guild_id = ?", (guild_id,))
+
+    @override
+    @instrument_query("version")
+    async def get_version(self) -> dict[str, Any] | None:
+        row = await self._fetch_one("SELECT hash, last_time_updated FROM version")
+        if row is None:
+            return None
+        return {"hash": row[0], "last_time_updated": datetime.fromisoformat(row[1])}
+
+    @override
+    @instrument_query("version")
+    async def set_version(self, doc: dict[str, Any]) -> None:
+        await self._write(
+            "INSERT OR REPLACE INTO version (singleton, hash, last_time_updated) "
+            "VALUES (1, ?, ?)",
+            (doc["hash"], doc["last_time_updated"].isoformat()),
+        )
+
+    @override
+    async def add_needed_constraints(self) -> None:
+        # the primary keys in the schema already are the constraints
+        await self._connect()
+
+    @override
+    async def get_content_hashes(
+        self, collection: str, key: str
+    ) -> dict[str, str | None]:
+        if collection == "items":
+            rows = await self._fetch_all("SELECT name, content_hash FROM items")
+        else:
+            rows = await self._fetch_all("SELECT id, content_hash FROM item_names")
+        return {row[0]: row[1] for row in rows}
+
+    async def _insert_items(
+        self, connection: Connection, items: list[dict[str, Any]]
+    ) -> None:
+        await connection.executemany(
+            "INSERT OR REPLACE INTO items (name, doc, content_hash) VALUES (?, ?, ?)",
+            (
+                (item["name"], _to_row(item), item.get(CONTENT_HASH_FIELD))
+                for item in items
+            ),
+        )
+
+    async def _insert_names(
+        self, connection: Connection, names: list[dict[str, Any]]
+    ) -> None:
+        await connection.executemany(
+            "INSERT INTO item_names (id, name, content_hash) VALUES (?, ?, ?)",
+            (
+                (name["id"], name["name"], name.get(CONTENT_HASH_FIELD))
+                for name in names
+            ),
+        )
+
+    # A single transaction is all the blue/green this needs: WAL readers keep
+    # seeing the previous snapshot until the commit
+    @override
+    async def apply_catalog_changes(self, changes: CatalogChangeSet) -> None:
+        _, writer = await self._connect()
+        table, column = (
+            ("items", "name") if changes.collection == "items" else ("item_names", "id")
+        )
+        removed = changes.deleted + [doc[changes.key] for doc in changes.updated]
+        upserted = changes.inserted + changes.updated
+
+        async with self._write_lock:
+            try:
+                await writer.executemany(
+                    f"DELETE FROM {table} WHERE {column} = ?",
+                    ((key,) for key in removed),
+                )
+                if table == "items":
+                    await self._insert_items(writer, upserted)
+                else:
+                    await self._insert_names(writer, upserted)
+                await writer.commit()
+            except BaseException:
+                await writer.rollback()
+                raise
+
+    @override
+    @instrument_query("catalog")
+    async def replace_catalog(
+        self, items: list[dict[str, Any]], names: list[dict[str, Any]], hash: str
+    ) -> None:
+        _, writer = await self._connect()
+        async with self._write_lock:
+            try:
+                await writer.execute("DELETE FROM items")
+                await writer.execute("DELETE FROM item_names")
+                await self._insert_items(writer, items)
+                await self._insert_names(writer, names)
+                await writer.commit()
+            except BaseException:
+                await writer.rollback()
+                raise
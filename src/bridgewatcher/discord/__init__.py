@@ -1,44 +1,369 @@
-from os import listdir
-from typing import override
+from asyncio import Task, create_task, get_running_loop, sleep
+from collections import Counter
+from functools import wraps
+from hashlib import sha256
+from json import dumps
+from os import getenv, getpid
+from pkgutil import iter_modules
+from resource import RUSAGE_SELF, getrusage
+from time import perf_counter, process_time
+from typing import Any, Callable, override
 
+from aiohttp.web import AppRunner
 from discord import Intents
-from discord.ext.commands import Bot
+from discord.ext.commands import AutoShardedBot, Bot
+from discord.gateway import DiscordWebSocket
+from discord.http import Route
+from discord.webhook.async_ import async_context
+from yarl import URL
 
-from bridgewatcher.db.seed.run import seed_if_needed
+from bridgewatcher.cluster import (
+    CLUSTER_STATUS_INTERVAL,
+    ClusterInfo,
+    ClusterStatus,
+    publish_cluster_status,
+    wait_for_identify_slot,
+)
+from bridgewatcher.compute import COMPUTE
+from bridgewatcher.db import backends
+from bridgewatcher.db.coordination import lease
+from bridgewatcher.discord import cogs
 from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import (
+    SHARD_GUILDS,
+    SHARD_LATENCY,
+    SHARD_READY,
+    enable_metrics,
+    start_metrics_server,
+)
+from bridgewatcher.tracing import (
+    DEFAULT_SLOW_COMMAND_THRESHOLD,
+    TRACER,
+    OtlpExporter,
+    span,
+)
+from bridgewatcher.watchdog import DEFAULT_STALL_THRESHOLD, LoopWatchdog
+
+
+# Every REST call discord.py makes goes through one of these two request
+# methods, the route path is the template so it doesn't explode into a span
+# name per channel or interaction
+def _trace_requests(request: Callable) -> Callable:
+    @wraps(request)
+    async def wrapper(route: Any, *args, **kwargs) -> Any:
+        with span(f"{route.method} {route.path}", "discord"):
+            return await request(route, *args, **kwargs)
+
+    return wrapper
+
+
+# Points discord.py at a local stand-in of the REST api and the gateway, only
+# for benchmarks and testing. It patches discord.py for the whole process, so
+# only the launchers call it and never the bot itself
+def use_discord_stand_in() -> None:
+    api_url = getenv("DISCORD_API_BASE_URL")
+    if api_url:
+        Route.BASE = api_url
+    gateway_url = getenv("DISCORD_GATEWAY_URL")
+    if gateway_url:
+        DiscordWebSocket.DEFAULT_GATEWAY = URL(gateway_url)
+
+
+def get_intents() -> Intents:
+    intents = Intents.default()
+    intents.message_content = True
+    return intents
 
 
 class Bridgewatcher(Bot):
-    def __init__(self, intents: Intents) -> None:
-        super().__init__("?", intents=intents)
+    # how long it should take from creating the bot to receiving the gateway
+    # ready event, anything above that gets reported as a warning
+    STARTUP_READY_TARGET = 10.0
+    # only one process syncs the commands when a whole cluster starts at once
+    COMMANDS_SYNC_LEASE = 60
+
+    def __init__(
+        self, intents: Intents, cluster: ClusterInfo | None = None, **options: Any
+    ) -> None:
+        super().__init__("?", intents=intents, **options)
+        self.cluster = cluster
+        self._ready_shards: set[int] = set()
+        self._status_task: Task | None = None
+        self._seeding_task: Task | None = None
+        self._watch_task: Task | None = None
+        self._liquidity_task: Task | None = None
+        self._digest_task: Task | None = None
+        self._watchdog: LoopWatchdog | None = None
+        self._metrics_runner: AppRunner | None = None
+        self._otlp_exporter: OtlpExporter | None = None
+        self._created_at = perf_counter()
+        self._reached_ready = False
 
     async def _load_cogs(self) -> None:
-        for filename in listdir("src/bridgewatcher/discord/cogs"):
-            if filename == "__init__.py" or not filename.endswith(".py"):
-                continue
-            await self.load_extension(f"bridgewatcher.discord.cogs.{filename[:-3]}")
+        for module in iter_modules(cogs.__path__, f"{cogs.__name__}."):
+            await self.load_extension(module.name)
+
+    def _get_commands_fingerprint(self) -> str:
+        commands = sorted(
+            (command.to_dict(self.tree) for command in self.tree.get_commands()),
+            key=lambda command: (command["type"], command["name"]),
+        )
+        content = dumps(commands, sort_keys=True, separators=(",", ":"))
+        return sha256(content.encode("utf-8")).hexdigest()
+
+    # Syncing is heavily rate limited by Discord, so it only happens when the
+    # registered commands actually differ from what was synced the last time
+    async def _sync_commands_if_needed(self) -> None:
+        forced = getenv("FORCE_COMMAND_SYNC", "false").lower() in ("true", "1")
+        fingerprint = self._get_commands_fingerprint()
+        # the main and the debug bots may share the same redis
+        key = f"commands:fingerprint:{self.application_id}"
+
+        if not forced and (await backends.redis.get(key)) == fingerprint.encode(
+            "utf-8"
+        ):
+            LOGGER.info("Commands haven't changed since the last sync. Skipping")
+            return
+
+        async with lease(key, self.COMMANDS_SYNC_LEASE) as acquired:
+            if not acquired:
+                LOGGER.info("Commands are being synchronized by another cluster")
+                return
+
+            LOGGER.info("Synchronizing commands with Discord...")
+            commands = len(await self.tree.sync())
+            await backends.redis.set(key, fingerprint)
+            LOGGER.info(f"Successfully synchronized {commands} commands with Discord")
+
+    async def _start_metrics(self) -> None:
+        port = getenv("METRICS_PORT")
+        if not port:
+            return
+
+        enable_metrics()
+        # every cluster serves its own metrics on the port after the previous one
+        self._metrics_runner = await start_metrics_server(
+            getenv("METRICS_HOST", "127.0.0.1"),
+            int(port) + (self.cluster.id if self.cluster is not None else 0),
+        )
+
+    def _start_tracing(self) -> None:
+        TRACER.slow_command_threshold = float(
+            getenv("SLOW_COMMAND_THRESHOLD", DEFAULT_SLOW_COMMAND_THRESHOLD)
+        )
+        # interaction responses and followups are sent through the webhook
+        # adapter and not the bot's http client
+        self.http.request = _trace_requests(self.http.request)  # type: ignore
+        adapter = async_context.get()
+        adapter.request = _trace_requests(adapter.request)  # type: ignore
+
+        endpoint = getenv("OTLP_ENDPOINT")
+        if endpoint:
+            self._otlp_exporter = OtlpExporter(endpoint)
+            self._otlp_exporter.start()
+            TRACER.exporter = self._otlp_exporter
+
+    def _start_watchdog(self) -> None:
+        threshold = float(getenv("LOOP_STALL_THRESHOLD", DEFAULT_STALL_THRESHOLD))
+        if threshold <= 0:
+            return
+
+        self._watchdog = LoopWatchdog(threshold)
+        self._watchdog.start(get_running_loop())
+
+    def _start_watches(self) -> None:
+        from bridgewatcher.discord.watches import DEFAULT_WATCH_INTERVAL, WatchScheduler
+
+        interval = float(getenv("WATCH_INTERVAL") or DEFAULT_WATCH_INTERVAL)
+        if interval <= 0:
+            return
+
+        self._watch_task = create_task(WatchScheduler(self, interval).run())
+
+    def _start_liquidity(self) -> None:
+        from bridgewatcher.market.liquidity import (
+            DEFAULT_LIQUIDITY_INTERVAL,
+            LiquidityRefresher,
+        )
+
+        interval = float(getenv("LIQUIDITY_INTERVAL") or DEFAULT_LIQUIDITY_INTERVAL)
+        if interval <= 0:
+            return
+
+        self._liquidity_task = create_task(LiquidityRefresher(interval).run())
+
+    def _start_digests(self) -> None:
+        from bridgewatcher.discord.digests import (
+            DEFAULT_DIGEST_INTERVAL,
+            DigestScheduler,
+        )
+
+        interval = float(getenv("DIGEST_INTERVAL") or DEFAULT_DIGEST_INTERVAL)
+        if interval <= 0:
+            return
+
+        self._digest_task = create_task(DigestScheduler(self, interval).run())
+
+    def _get_cluster_status(self) -> ClusterStatus:
+        assert self.cluster is not None
+        return ClusterStatus(
+            cluster=self.cluster.id,
+            pid=getpid(),
+            shards=list(self.cluster.shard_ids),
+            ready_shards=sorted(self._ready_shards),
+            guilds=len(self.guilds),
+            latency=self.latency,
+            max_rss_kib=getrusage(RUSAGE_SELF).ru_maxrss,
+            cpu_seconds=process_time(),
+        )
+
+    def _update_shard_metrics(self) -> None:
+        assert self.cluster is not None
+        guilds = Counter(guild.shard_id for guild in self.guilds)
+        latencies = dict(getattr(self, "latencies", []))
+        for shard_id in self.cluster.shard_ids:
+            labels = {"cluster": self.cluster.id, "shard": shard_id}
+            SHARD_READY.set(int(shard_id in self._ready_shards), **labels)
+            SHARD_GUILDS.set(guilds[shard_id], **labels)
+            # a shard that never received a heartbeat ack reports inf
+            latency = latencies.get(shard_id)
+            if latency is not None and latency != float("inf"):
+                SHARD_LATENCY.set(latency, **labels)
+
+    async def _report_cluster_status(self) -> None:
+        while True:
+            try:
+                self._update_shard_metrics()
+                await publish_cluster_status(self._get_cluster_status())
+            except Exception:
+                LOGGER.exception("Couldn't publish the cluster status")
+            await sleep(CLUSTER_STATUS_INTERVAL)
 
     @override
     async def setup_hook(self) -> None:
-        LOGGER.info("Running seeding checks...")
-        await seed_if_needed()
+        self._start_watchdog()
+        await self._start_metrics()
+        self._start_tracing()
+
+        LOGGER.info("Connecting to the databases...")
+        started = perf_counter()
+        await backends.start()
+        LOGGER.info(
+            f"Startup phase: connecting to the databases took {perf_counter() - started:.2f}s"
+        )
+
+        started = perf_counter()
+        await COMPUTE.start()
+        LOGGER.info(
+            f"Startup phase: starting compute workers took {perf_counter() - started:.2f}s"
+        )
+
+        # seeding may take minutes, commands that need the catalog wait for
+        # it on their own while everything else is served right away
+        LOGGER.info("Starting seeding checks in the background...")
+        # the seeder drags pymongo in, which is only worth it once the bot runs
+        from bridgewatcher.db.seed.diff import add_catalog_listener
+        from bridgewatcher.db.seed.run import supervise_seeding
+        from bridgewatcher.market.derived import invalidate_derived_results
+
+        # results computed from items of the catalog go out of date with them
+        add_catalog_listener(invalidate_derived_results)
+        self._seeding_task = create_task(supervise_seeding())
+        if self.cluster is not None:
+            self._status_task = create_task(self._report_cluster_status())
+        self._start_watches()
+        self._start_liquidity()
+        self._start_digests()
 
         LOGGER.info("Loading commands from cogs...")
+        started = perf_counter()
         await self._load_cogs()
-
         self.remove_command("help")
+        LOGGER.info(f"Startup phase: loading cogs took {perf_counter() - started:.2f}s")
+
+        started = perf_counter()
+        await self._sync_commands_if_needed()
+        LOGGER.info(f"Startup phase: syncing took {perf_counter() - started:.2f}s")
+
+    async def on_ready(self) -> None:
+        # on_ready is dispatched again after every reconnect
+        if self._reached_ready:
+            return
+        self._reached_ready = True
+
+        elapsed = perf_counter() - self._created_at
+        LOGGER.info(f"Ready for {len(self.guilds)} servers in {elapsed:.2f}s")
+        if self.cluster is not None:
+            await publish_cluster_status(self._get_cluster_status())
+        if elapsed > self.STARTUP_READY_TARGET:
+            LOGGER.warning(
+                f"Startup took {elapsed:.2f}s, the target is {self.STARTUP_READY_TARGET}s"
+            )
+
+    @override
+    async def close(self) -> None:
+        if self._seeding_task is not None:
+            self._seeding_task.cancel()
+        if self._status_task is not None:
+            self._status_task.cancel()
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        if self._liquidity_task is not None:
+            self._liquidity_task.cancel()
+        if self._digest_task is not None:
+            self._digest_task.cancel()
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        await super().close()
+        COMPUTE.shutdown()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        if self._otlp_exporter is not None:
+            await self._otlp_exporter.close()
+        await backends.close()
+
+
+# Runs a range of shards within a single process, as one of the clusters
+# started by the launcher in bridgewatcher.cluster
+class ShardedBridgewatcher(Bridgewatcher, AutoShardedBot):
+    def __init__(self, intents: Intents, cluster: ClusterInfo) -> None:
+        super().__init__(
+            intents,
+            cluster,
+            shard_ids=list(cluster.shard_ids),
+            shard_count=cluster.shard_count,
+        )
+
+    # The default waits 5 seconds between the shards of this process only,
+    # the IDENTIFY budget is shared by every cluster though
+    @override
+    async def before_identify_hook(
+        self, shard_id: int | None, *, initial: bool = False
+    ) -> None:
+        assert self.cluster is not None
+        await wait_for_identify_slot(shard_id or 0, self.cluster.max_concurrency)
+
+    async def on_shard_ready(self, shard_id: int) -> None:
+        self._ready_shards.add(shard_id)
+        LOGGER.info(f"Shard {shard_id} is ready")
 
-        LOGGER.info("Synchronizing commands with Discord...")
-        commands = len(await self.tree.sync())
-        LOGGER.info(f"Successfully synchronized {commands} commands with Discord")
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        self._ready_shards.add(shard_id)
 
-        LOGGER.info(f"Ready for {len(self.guilds)} servers")
+    async def on_shard_disconnect(self, shard_id: int) -> None:
+        self._ready_shards.discard(shard_id)
+        LOGGER.warning(f"Shard {shard_id} has disconnected")
 
 
-intents = Intents.default()
-intents.message_content = True
-bot = Bridgewatcher(intents)
+bot = Bridgewatcher(get_intents())
 
 DETECTIVEKAKTUS_ID = 692305905123065918
 
-__all__ = ("bot", "DETECTIVEKAKTUS_ID")
+__all__ = (
+    "bot",
+    "Bridgewatcher",
+    "ShardedBridgewatcher",
+    "get_intents",
+    "use_discord_stand_in",
+    "DETECTIVEKAKTUS_ID",
+)
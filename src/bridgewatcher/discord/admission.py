@@ -0,0 +1,171 @@
+from asyncio import Semaphore, wait_for
+from dataclasses import dataclass
+from functools import wraps
+from time import monotonic
+from typing import Callable
+
+from discord import Interaction
+
+from bridgewatcher.discord.embed import BusyEmbed
+from bridgewatcher.discord.reply import reply
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_SHED
+from bridgewatcher.tracing import span
+
+# idle buckets are refilled anyway, so forgetting them changes nothing
+BUCKET_EXPIRATION_PERIOD = 60 * 10
+
+
+@dataclass(frozen=True)
+class AdmissionLimits:
+    # commands running at the same time
+    concurrency: int = 16
+    # commands allowed to wait for a slot, everything above is turned away
+    queue_size: int = 32
+    # how long a queued command may wait before it's turned away
+    queue_timeout: float = 5.0
+    # commands per second and how many of them may be fired at once
+    guild_rate: float = 1.0
+    guild_burst: int = 10
+    user_rate: float = 0.2
+    user_burst: int = 3
+    # what to tell when the queue is full, there's no better estimate
+    retry_after: float = 5.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = monotonic()
+
+    # Returns 0 when a token was taken, otherwise how long it takes until
+    # the next one is there
+    def take(self) -> float:
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    # gives back a token taken for something that didn't happen after all
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[int, TokenBucket] = {}
+        self._collected_at = monotonic()
+
+    def take(self, key: int) -> float:
+        self._collect_garbage()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.take()
+
+    def refund(self, key: int) -> None:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.refund()
+
+    def _collect_garbage(self) -> None:
+        now = monotonic()
+        if now - self._collected_at < BUCKET_EXPIRATION_PERIOD:
+            return
+
+        self._collected_at = now
+        self._buckets = {
+            key: bucket
+            for key, bucket in self._buckets.items()
+            if now - bucket.updated_at < BUCKET_EXPIRATION_PERIOD
+        }
+
+
+class Admission:
+    def __init__(self, command: str, limits: AdmissionLimits) -> None:
+        self.command = command
+        self.limits = limits
+        self.guilds = RateLimiter(limits.guild_rate, limits.guild_burst)
+        self.users = RateLimiter(limits.user_rate, limits.user_burst)
+        self._slots = Semaphore(limits.concurrency)
+        self._waiting = 0
+
+    async def _shed(
+        self, interaction: Interaction, reason: str, retry_after: float
+    ) -> None:
+        ADMISSION_SHED.inc(command=self.command, reason=reason)
+        LOGGER.debug(f"Turned away /{self.command}: {reason}")
+        await reply(interaction, embed=BusyEmbed(retry_after), ephemeral=True)
+
+    # Returns whether the command got a slot, when it didn't the interaction
+    # has already been answered
+    async def acquire(self, interaction: Interaction) -> bool:
+        if interaction.guild_id is not None:
+            retry_after = self.guilds.take(interaction.guild_id)
+            if retry_after:
+                await self._shed(interaction, "guild_rate", retry_after)
+                return False
+
+        retry_after = self.users.take(interaction.user.id)
+        if retry_after:
+            # a single user over the limit shouldn't use up what the rest of
+            # the guild is allowed to
+            if interaction.guild_id is not None:
+                self.guilds.refund(interaction.guild_id)
+            await self._shed(interaction, "user_rate", retry_after)
+            return False
+
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return True
+
+        if self._waiting >= self.limits.queue_size:
+            await self._shed(interaction, "queue_full", self.limits.retry_after)
+            return False
+
+        # Discord wants an answer within 3 seconds, waiting in the queue
+        # may take longer than that
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True)
+
+        self._waiting += 1
+        ADMISSION_QUEUE_DEPTH.set(self._waiting, command=self.command)
+        try:
+            with span("queue", "admission", waiting=self._waiting):
+                await wait_for(self._slots.acquire(), self.limits.queue_timeout)
+        except TimeoutError:
+            await self._shed(interaction, "queue_timeout", self.limits.retry_after)
+            return False
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting, command=self.command)
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+def admission_control(command: str, limits: AdmissionLimits) -> Callable:
+    admission = Admission(command, limits)
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(self, interaction: Interaction, *args, **kwargs) -> None:
+            if not await admission.acquire(interaction):
+                return
+            try:
+                return await func(self, interaction, *args, **kwargs)
+            finally:
+                admission.release()
+
+        return wrapper
+
+    return decorator
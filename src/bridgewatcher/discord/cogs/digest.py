@@ -0,0 +1,151 @@
+from discord import Color, Guild, Interaction
+from discord.app_commands import Choice, check, choices, command, describe, guild_only
+from discord.ext.commands import Bot, GroupCog
+
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import wait_for_catalog
+from bridgewatcher.db.schema import DigestFrequencies, DigestSubscription
+from bridgewatcher.discord.embed import BridgewatcherEmbed
+from bridgewatcher.discord.items import guard_item_errors
+from bridgewatcher.discord.server import ServerManager
+from bridgewatcher.metrics import instrument_command
+
+
+def describe_digest(digest: DigestSubscription) -> str:
+    category = digest.category or "every category"
+    return f"{digest.frequency.value} digest of {category}"
+
+
+@guild_only()
+class DigestCog(GroupCog, group_name="digest", group_description="Market digests"):
+    # every subscription is a message in every period, the digests themselves
+    # are shared with every other guild
+    MAX_DIGESTS_PER_GUILD = 5
+
+    async def _is_manager(self, interaction: Interaction) -> bool:
+        if interaction.permissions.manage_guild:
+            return True
+        await interaction.response.send_message(
+            "You need the Manage Server permission to change the digests",
+            ephemeral=True,
+        )
+        return False
+
+    @command(
+        name="subscribe", description="Posts the best flips and crafts in this channel"
+    )
+    @describe(
+        frequency="How often the digest is posted",
+        category="Shop category of the items, e.g. resources. Every item if not given",
+    )
+    @choices(
+        frequency=[
+            Choice(name=frequency.value, value=frequency.value)
+            for frequency in DigestFrequencies
+        ]
+    )
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("digest subscribe")
+    @guard_item_errors
+    async def subscribe(
+        self,
+        interaction: Interaction,
+        frequency: Choice[str],
+        category: str | None = None,
+    ) -> None:
+        if not await self._is_manager(interaction):
+            return
+
+        category = category.lower() if category is not None else None
+        # a category nothing is in would make an empty digest every time
+        if category is not None:
+            # not worth keeping the interaction waiting for the seeding
+            await wait_for_catalog(timeout=0)
+            if not await backends.store.find_items(category):
+                await interaction.response.send_message(
+                    f"There's no {category} category, try e.g. resources or weapons",
+                    ephemeral=True,
+                )
+                return
+
+        guild: Guild = interaction.guild  # type: ignore
+        conf = await ServerManager.get_or_create_conf(guild)
+        digest = DigestSubscription(
+            interaction.channel_id,  # type: ignore
+            DigestFrequencies(frequency.value),
+            category,
+        )
+        # a channel gets a single digest of each frequency, subscribing again
+        # replaces it
+        digests = [
+            existing
+            for existing in conf.digests
+            if (existing.channel_id, existing.frequency)
+            != (digest.channel_id, digest.frequency)
+        ]
+        if len(digests) >= self.MAX_DIGESTS_PER_GUILD:
+            await interaction.response.send_message(
+                "There are too many digests already, unsubscribe some channels first",
+                ephemeral=True,
+            )
+            return
+
+        await ServerManager.update_digests(guild, [*digests, digest])
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title="📰 Subscribed",
+            color=Color.dark_gold(),
+            description=(
+                f"This channel gets the {describe_digest(digest)}. "
+                f"Stop it with `/digest unsubscribe`"
+            ),
+        )
+        await interaction.response.send_message(embed=embed)
+
+    @command(name="unsubscribe", description="Stops posting digests in this channel")
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("digest unsubscribe")
+    async def unsubscribe(self, interaction: Interaction) -> None:
+        if not await self._is_manager(interaction):
+            return
+
+        guild: Guild = interaction.guild  # type: ignore
+        conf = await ServerManager.get_or_create_conf(guild)
+        digests = [
+            digest
+            for digest in conf.digests
+            if digest.channel_id != interaction.channel_id
+        ]
+        if len(digests) == len(conf.digests):
+            await interaction.response.send_message(
+                "This channel doesn't get any digests", ephemeral=True
+            )
+            return
+
+        await ServerManager.update_digests(guild, digests)
+        await interaction.response.send_message(
+            "This channel won't get any digests anymore", ephemeral=True
+        )
+
+    @command(name="list", description="Shows the digests on this server")
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("digest list")
+    async def list_digests(self, interaction: Interaction) -> None:
+        guild: Guild = interaction.guild  # type: ignore
+        conf = await ServerManager.get_or_create_conf(guild)
+        entries = [
+            f"{describe_digest(digest).capitalize()} in <#{digest.channel_id}>"
+            for digest in conf.digests
+        ]
+
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title="📰 Digests",
+            color=Color.dark_gold(),
+            description="\n".join(entries) if entries else "Nobody gets any digests",
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot: Bot) -> None:
+    await bot.add_cog(DigestCog())
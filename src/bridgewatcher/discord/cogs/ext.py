@@ -11,6 +11,7 @@ from bridgewatcher.discord.embed import BridgewatcherEmbed
 from bridgewatcher.discord.formatting import md
 from bridgewatcher.discord.server import ServerManager
 from bridgewatcher.discord.views import HelpView
+from bridgewatcher.metrics import instrument_command
 
 
 class ExtCog(Cog):
@@ -18,6 +19,7 @@ class ExtCog(Cog):
         super().__init__()
 
     @command(name="help")
+    @instrument_command("help")
     async def show_help(self, interaction: Interaction) -> None:
         embed = await BridgewatcherEmbed.from_interaction(
             interaction,
@@ -34,7 +36,12 @@ class ExtCog(Cog):
                 "👑 `/premium`: get any premium status price\n"
                 "🏷️ `/price`: get any item price\n"
                 "🛠️ `/craft`: get profit from crafting an item\n"
+                "📐 `/craft_sweep`: compare every tier and enchantment of a craft\n"
+                "🧰 `/craftable`: find the best crafts out of your materials\n"
                 "💹 `/flip`: get profit from market flipping\n"
+                "🐂 `/transport`: plan what to haul between two cities\n"
+                "🔔 `/watch`: get notified when an item hits your price\n"
+                "📰 `/digest`: get the best flips and crafts posted regularly\n"
                 "⏰ `/utc`: get UTC time\n"
             ),
         )
@@ -50,6 +57,7 @@ class ExtCog(Cog):
         await interaction.response.send_message(embed=embed, view=HelpView())
 
     @command(name="utc", description="Shows current UTC time")
+    @instrument_command("utc")
     async def show_utc(self, interaction: Interaction) -> None:
         now = datetime.now(timezone.utc)
         await interaction.response.send_message(
@@ -59,6 +67,7 @@ class ExtCog(Cog):
     @command(name="conf", description="Shows Bridgewatcher configuration")
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("conf")
     async def show_conf(self, interaction: Interaction) -> None:
         guild: Guild = interaction.guild  # type: ignore
         conf = await ServerManager.get_or_create_conf(guild)
@@ -73,6 +82,7 @@ class ExtCog(Cog):
     )
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("server")
     async def set_server(self, interaction: Interaction, server: Choice[str]) -> None:
         guild: Guild = interaction.guild  # type: ignore
         fetch_server = AlbionOnlineServers.from_str(server.value)
@@ -1,21 +1,69 @@
 from datetime import datetime, timezone
 
 from discord import Color, Guild, Interaction
-from discord.app_commands import Choice, check, choices, command, describe, guild_only
+from discord.app_commands import (
+    Choice,
+    Range,
+    check,
+    choices,
+    command,
+    describe,
+    guild_only,
+)
 from discord.ext.commands import Bot, Cog
 
-from bridgewatcher.api.model import Qualities
+from bridgewatcher.api.model import Cities, Qualities
+from bridgewatcher.discord.admission import AdmissionLimits, admission_control
 from bridgewatcher.discord.embed import BridgewatcherEmbed
 from bridgewatcher.discord.formatting import (
     md,
     format_number,
+    format_compact_number,
     readable_timestamp,
     get_datetime_from_timestamp,
     get_item_name_by_id,
 )
 from bridgewatcher.discord.items import ItemGuesser, get_item_icon, guard_item_errors
+from bridgewatcher.discord.reply import get_time_left, reply
 from bridgewatcher.discord.server import ServerManager
-from bridgewatcher.market import Crafter, MarketFlipper, MarketQuery
+from bridgewatcher.metrics import instrument_command
+from bridgewatcher.market import (
+    Crafter,
+    CraftSweeper,
+    InventoryPlanner,
+    MarketFlipper,
+    MarketQuery,
+    TransportPlanner,
+)
+from bridgewatcher.market.model import CraftSweep
+from bridgewatcher.market.sweep import SWEPT_ENCHANTMENTS, SWEPT_TIERS
+
+
+# Materials as "T4_METALBAR 120, T5_PLANKS@1 40", None when it can't be read
+def parse_inventory(materials: str) -> dict[str, int] | None:
+    inventory: dict[str, int] = {}
+    for entry in materials.split(","):
+        parts = entry.replace(":", " ").split()
+        if not parts:
+            continue
+        if len(parts) != 2 or not parts[1].isdigit():
+            return None
+        inventory[parts[0]] = inventory.get(parts[0], 0) + int(parts[1])
+    return inventory or None
+
+
+# Profit of every tier and enchantment as a table, a dash where it couldn't
+# be worked out
+def format_sweep_grid(sweep: CraftSweep) -> str:
+    rows = ["   " + "".join(f"{f".{e}":>8}" for e in SWEPT_ENCHANTMENTS)]
+    for tier in SWEPT_TIERS:
+        row = f"T{tier} "
+        for enchantment in SWEPT_ENCHANTMENTS:
+            craft = sweep.crafts.get((tier, enchantment))
+            profit = format_compact_number(craft.profit) if craft else "-"
+            row += f"{profit:>8}"
+        rows.append(row)
+    return "\n".join(rows)
 
 
 class MarketCog(Cog):
@@ -24,9 +72,27 @@ class MarketCog(Cog):
     SEMIANNUAL_PREMIUM = 19500
     ANNUAL_PREMIUM = 36000
 
+    # gold prices are a single cached request for everybody, the item
+    # commands search the catalog and fetch prices for every item involved
+    GOLD_LIMITS = AdmissionLimits(concurrency=64, queue_size=128)
+    PRICE_LIMITS = AdmissionLimits(concurrency=32, queue_size=64)
+    FLIP_LIMITS = AdmissionLimits(concurrency=32, queue_size=64)
+    CRAFT_LIMITS = AdmissionLimits(concurrency=16, queue_size=32)
+    # a whole family of crafts, but priced in a single batch like one craft
+    CRAFT_SWEEP_LIMITS = AdmissionLimits(concurrency=16, queue_size=32)
+    # the recipes of the materials come from an index, their prices in a
+    # single batch
+    CRAFTABLE_LIMITS = AdmissionLimits(concurrency=16, queue_size=32)
+    # a plan goes over the prices of a whole category or the whole catalog
+    TRANSPORT_LIMITS = AdmissionLimits(concurrency=4, queue_size=8)
+    # an embed holds up to 25 fields, some of them are the totals
+    MAX_CARGO_ENTRIES = 20
+
     @command(name="gold", description="Shows gold prices up to 12 hours prior")
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("gold")
+    @admission_control("gold", GOLD_LIMITS)
     async def show_gold_prices(self, interaction: Interaction) -> None:
         guild: Guild = interaction.guild  # type: ignore
         albion = await ServerManager.get_albion(guild)
@@ -43,11 +109,13 @@ class MarketCog(Cog):
             description="\n".join(entries),
         )
 
-        await interaction.response.send_message(embed=embed)
+        await reply(interaction, embed=embed)
 
     @command(name="premium", description="Shows current premium prices")
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("premium")
+    @admission_control("premium", GOLD_LIMITS)
     async def show_premium_prices(self, interaction: Interaction) -> None:
         guild: Guild = interaction.guild  # type: ignore
         albion = await ServerManager.get_albion(guild)
@@ -68,7 +136,7 @@ class MarketCog(Cog):
             description="\n".join(entries),
         )
 
-        await interaction.response.send_message(embed=embed)
+        await reply(interaction, embed=embed)
 
     @command(name="price", description="Get latest prices for an item")
     @describe(
@@ -83,6 +151,8 @@ class MarketCog(Cog):
     )
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("price")
+    @admission_control("price", PRICE_LIMITS)
     @guard_item_errors
     async def get_item_prices(
         self, interaction: Interaction, item_name: str, quality: Choice[int]
@@ -120,13 +190,15 @@ class MarketCog(Cog):
             url=get_item_icon(item.name, Qualities.from_int(quality.value))
         )
 
-        await interaction.followup.send(embed=embed)
+        await reply(interaction, embed=embed)
 
     @command(name="flip", description="Calculate the profit from flipping an item")
     @describe(
         item_name="Name of the item you want to flip",
         quality="Quality of the item you want to flip",
         has_premium="Your premium subscription status",
+        min_volume="Skip cities trading fewer of the item a day",
+        rank_by_fill="Pick the city by what it's expected to sell within a day",
     )
     @choices(
         quality=[
@@ -136,6 +208,8 @@ class MarketCog(Cog):
     )
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("flip")
+    @admission_control("flip", FLIP_LIMITS)
     @guard_item_errors
     async def flip_item(
         self,
@@ -143,6 +217,8 @@ class MarketCog(Cog):
         item_name: str,
         quality: Choice[int],
         has_premium: bool,
+        min_volume: Range[int, 0] = 0,
+        rank_by_fill: bool = False,
     ) -> None:
         item, name = await ItemGuesser.guess_item_by_name(interaction, item_name)
 
@@ -154,6 +230,8 @@ class MarketCog(Cog):
                 item, Qualities.from_int(quality.value)
             ),
             has_premium,
+            min_volume,
+            rank_by_fill,
         )
 
         embed = await BridgewatcherEmbed.from_interaction(
@@ -179,8 +257,16 @@ class MarketCog(Cog):
         embed.add_field(
             name="💲Sell price", value=md.bold(format_number(flip.sell_price))
         )
+        if flip.sell_liquidity is not None:
+            embed.add_field(
+                name="📊Traded a day",
+                value=(
+                    f"{md.bold(format_number(round(flip.sell_liquidity.volume)))} "
+                    f"for {format_number(flip.sell_liquidity.average_price)} on average"
+                ),
+            )
 
-        await interaction.followup.send(embed=embed)
+        await reply(interaction, embed=embed)
 
     @command(name="craft", description="Calculate the profit from crafting an item")
     @describe(
@@ -188,9 +274,13 @@ class MarketCog(Cog):
         has_premium="Your premium subscription status",
         count="Number of items you want to craft",
         using_focus="Use of focus during crafting",
+        min_volume="Skip cities trading fewer of the item a day",
+        rank_by_fill="Pick the city by what it's expected to sell within a day",
     )
     @guild_only()
     @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("craft")
+    @admission_control("craft", CRAFT_LIMITS)
     @guard_item_errors
     async def craft_item(
         self,
@@ -199,6 +289,8 @@ class MarketCog(Cog):
         has_premium: bool,
         count: int = 1,
         using_focus: bool = True,
+        min_volume: Range[int, 0] = 0,
+        rank_by_fill: bool = False,
     ) -> None:
         item, purchase_name = await ItemGuesser.guess_item_by_name(
             interaction, item_name
@@ -207,7 +299,9 @@ class MarketCog(Cog):
         guild: Guild = interaction.guild  # type: ignore
         albion = await ServerManager.get_albion(guild)
         crafter = Crafter(albion)
-        craft = await crafter.craft(item, count, has_premium, using_focus)
+        craft = await crafter.craft(
+            item, count, has_premium, using_focus, min_volume, rank_by_fill
+        )
 
         embed = await BridgewatcherEmbed.from_interaction(
             interaction,
@@ -237,6 +331,11 @@ class MarketCog(Cog):
         embed.add_field(name="📦Items crafted", value=md.bold(craft.count))
         embed.add_field(name="🔍Focus", value=md.bold("Yes" if using_focus else "No"))
         embed.add_field(name="👑Premium", value=md.bold("Yes" if has_premium else "No"))
+        if craft.fill_rate is not None:
+            embed.add_field(
+                name="📊Sold within a day",
+                value=f"{md.bold(round(craft.fill_rate * 100))}%",
+            )
 
         for purchase in craft.purchases:
             if len(embed.fields) >= 25:
@@ -248,7 +347,259 @@ class MarketCog(Cog):
                 value=f"Bought in {md.bold(purchase.buy_city.title())} for {format_number(purchase.cost)} silver",
             )
 
-        await interaction.followup.send(embed=embed)
+        await reply(interaction, embed=embed)
+
+    @command(
+        name="craft_sweep",
+        description="Compare crafting every tier and enchantment of an item",
+    )
+    @describe(
+        item_name="Name of the item you want to craft, any tier of it",
+        has_premium="Your premium subscription status",
+        count="Number of items you want to craft",
+        using_focus="Use of focus during crafting",
+        min_volume="Skip cities trading fewer of the item a day",
+        rank_by_fill="Pick the city by what it's expected to sell within a day",
+    )
+    @guild_only()
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("craft_sweep")
+    @admission_control("craft_sweep", CRAFT_SWEEP_LIMITS)
+    @guard_item_errors
+    async def sweep_crafts(
+        self,
+        interaction: Interaction,
+        item_name: str,
+        has_premium: bool,
+        count: int = 1,
+        using_focus: bool = True,
+        min_volume: Range[int, 0] = 0,
+        rank_by_fill: bool = False,
+    ) -> None:
+        item, name = await ItemGuesser.guess_item_by_name(interaction, item_name)
+
+        guild: Guild = interaction.guild  # type: ignore
+        albion = await ServerManager.get_albion(guild)
+        sweeper = CraftSweeper(albion)
+        sweep = await sweeper.sweep(
+            item, count, has_premium, using_focus, min_volume, rank_by_fill
+        )
+
+        best = sweep.best
+        if best is None:
+            embed = await BridgewatcherEmbed.from_interaction(
+                interaction,
+                title=f"📐 Sweeping {name.name}",
+                color=Color.blurple(),
+                description="There are no fresh prices on any tier of this item",
+            )
+            await reply(interaction, embed=embed)
+            return
+
+        best_name = await get_item_name_by_id(best.item.name)
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title=f"📐 Sweeping {name.name}",
+            color=Color.blurple(),
+            description=(
+                f"Profit from crafting {count} of every tier and enchantment:\n"
+                f"```\n{format_sweep_grid(sweep)}\n```\n"
+                f"The best is {md.bold(best_name.name)}, crafted in "
+                f"{best.crafting_city.title()} and sold in "
+                f"{md.bold(best.income.sell_city.title())} for "
+                f"{md.bold(format_number(best.profit))} silver"
+            ),
+        )
+        embed.set_thumbnail(url=get_item_icon(best.item.name))
+        await reply(interaction, embed=embed)
+
+    @command(
+        name="craftable",
+        description="Find the best crafts out of the materials you have",
+    )
+    @describe(
+        materials="Material ids with their counts, e.g. T4_METALBAR 120, T5_PLANKS@1 40",
+        has_premium="Your premium subscription status",
+        using_focus="Use of focus during crafting",
+    )
+    @guild_only()
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("craftable")
+    @admission_control("craftable", CRAFTABLE_LIMITS)
+    @guard_item_errors
+    async def find_craftable(
+        self,
+        interaction: Interaction,
+        materials: str,
+        has_premium: bool,
+        using_focus: bool = True,
+    ) -> None:
+        inventory = parse_inventory(materials)
+        if inventory is None:
+            await reply(
+                interaction,
+                content=(
+                    "List the materials as ids with their counts, "
+                    "e.g. `T4_METALBAR 120, T5_PLANKS@1 40`"
+                ),
+                ephemeral=True,
+            )
+            return
+        # nothing guesses an item here to defer it, and a cold batch of prices
+        # may well take longer than Discord waits for an answer
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True)
+
+        guild: Guild = interaction.guild  # type: ignore
+        albion = await ServerManager.get_albion(guild)
+        planner = InventoryPlanner(albion)
+        crafts = await planner.plan(inventory, has_premium, using_focus)
+
+        if not crafts:
+            embed = await BridgewatcherEmbed.from_interaction(
+                interaction,
+                title="⚒️ Nothing to craft",
+                color=Color.blurple(),
+                description=(
+                    "None of the recipes using these materials can be crafted out "
+                    "of them alone, or there are no fresh prices on them"
+                ),
+            )
+            await reply(interaction, embed=embed)
+            return
+
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title="⚒️ What you can craft",
+            color=Color.blurple(),
+            description=(
+                f"The most profitable use of your materials is expected to make "
+                f"{md.bold(format_number(crafts[0].profit))} silver. Each craft "
+                "uses as much of them as it can on its own"
+            ),
+        )
+        for craft in crafts:
+            craft_name = await get_item_name_by_id(craft.item.name)
+            embed.add_field(
+                name=f"{craft.count} × {craft_name.name}",
+                value=(
+                    f"Craft in {craft.crafting_city.title()}, sell in "
+                    f"{craft.income.sell_city.title()}, "
+                    f"{format_number(craft.profit)} silver profit"
+                ),
+            )
+
+        await reply(interaction, embed=embed)
+
+    @command(name="transport", description="Plan what to haul between two cities")
+    @describe(
+        source="City you buy the goods in",
+        destination="City you sell the goods in",
+        silver="Silver you can spend",
+        capacity="Weight in kg your mount can carry",
+        slots="Free inventory slots",
+        has_premium="Your premium subscription status",
+        category=(
+            "Shop category of the items, e.g. resources. The most traded items "
+            "if not given"
+        ),
+        stacks_per_item="Stacks of a single item you expect the market to hold",
+    )
+    @choices(
+        source=[
+            Choice(name=city.title(), value=city.value)
+            for city in Cities
+            if city != Cities.BLACK_MARKET
+        ],
+        destination=[Choice(name=city.title(), value=city.value) for city in Cities],
+    )
+    @guild_only()
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("transport")
+    @admission_control("transport", TRANSPORT_LIMITS)
+    @guard_item_errors
+    async def plan_transport(
+        self,
+        interaction: Interaction,
+        source: Choice[str],
+        destination: Choice[str],
+        silver: Range[int, 1],
+        capacity: Range[float, 0.1],
+        has_premium: bool,
+        slots: Range[int, 1, 64] = 48,
+        category: str | None = None,
+        stacks_per_item: Range[int, 1, 10] = 1,
+    ) -> None:
+        # whatever waited in the admission queue was deferred there already
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True)
+
+        guild: Guild = interaction.guild  # type: ignore
+        albion = await ServerManager.get_albion(guild)
+        planner = TransportPlanner(albion)
+        haul = await planner.plan(
+            Cities.from_str(source.value),
+            Cities.from_str(destination.value),
+            silver,
+            capacity,
+            slots,
+            has_premium,
+            category.lower() if category is not None else None,
+            stacks_per_item,
+            timeout=get_time_left(interaction),
+        )
+
+        title = f"🐂 Hauling from {haul.source.title()} to {haul.destination.title()}"
+        # a plan over some of the items shouldn't pass for one over all of them
+        coverage = ""
+        if haul.skipped:
+            coverage += (
+                f"\nOnly the most traded items were looked at, {haul.skipped} "
+                "others were left out. A category narrows them down"
+            )
+        if haul.unpriced:
+            coverage += (
+                f"\nThe prices of {haul.unpriced} items couldn't be fetched, "
+                "they're missing from the plan"
+            )
+        if not haul.cargo:
+            embed = await BridgewatcherEmbed.from_interaction(
+                interaction,
+                title=title,
+                color=Color.dark_gold(),
+                description=(
+                    f"Nothing is worth carrying there right now, {haul.candidates} items "
+                    f"had fresh prices with a profit in both cities{coverage}"
+                ),
+            )
+            await reply(interaction, embed=embed)
+            return
+
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title=title,
+            color=Color.dark_gold(),
+            description=(
+                f"The best cargo out of {haul.candidates} profitable items is expected "
+                f"to make {md.bold(format_number(haul.profit))} silver{coverage}"
+            ),
+        )
+        embed.add_field(name="💰Cost", value=md.bold(format_number(haul.cost)))
+        embed.add_field(name="⚖️Weight", value=md.bold(f"{haul.weight:,.1f} kg"))
+        embed.add_field(name="🎒Slots", value=md.bold(haul.slots))
+
+        for cargo in haul.cargo[: self.MAX_CARGO_ENTRIES]:
+            cargo_name = await get_item_name_by_id(cargo.item.name)
+            embed.add_field(
+                name=f"{cargo.count} × {cargo_name.name}",
+                value=(
+                    f"Buy for {format_number(cargo.flip.buy_price)}, sell for "
+                    f"{format_number(cargo.flip.sell_price)}, "
+                    f"+{format_number(cargo.profit)} silver"
+                ),
+            )
+
+        await reply(interaction, embed=embed)
 
 
 async def setup(bot: Bot) -> None:
@@ -0,0 +1,138 @@
+import tracemalloc
+from asyncio import Lock, to_thread
+from datetime import datetime, timezone
+from io import BytesIO
+from threading import get_ident
+
+from discord import File, Interaction, Permissions
+from discord.app_commands import Group, Range, describe
+from discord.ext.commands import Bot, Cog
+
+from bridgewatcher.discord.formatting import md
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.profiling import (
+    StackSampler,
+    format_collapsed_stacks,
+    format_memory_report,
+    format_profile_report,
+)
+
+TRACEMALLOC_FRAMES = 1
+
+
+def _make_file(name: str, content: str) -> File:
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return File(BytesIO(content.encode("utf-8")), filename=f"{name}-{timestamp}.txt")
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+
+
+# Nothing in here is hooked into the bot until one of the commands is run, so
+# while idle the profilers cost nothing
+class OwnerCog(Cog):
+    # hidden from everyone but administrators, the owner check does the rest
+    profile = Group(
+        name="profile",
+        description="Profile the running bot",
+        default_permissions=Permissions(),
+    )
+    memory = Group(
+        name="memory", description="Trace memory allocations", parent=profile
+    )
+
+    def __init__(self, bot: Bot) -> None:
+        super().__init__()
+        self.bot = bot
+        self._cpu_lock = Lock()
+        self._snapshot: tracemalloc.Snapshot | None = None
+
+    async def interaction_check(self, interaction: Interaction) -> bool:  # type: ignore
+        if await self.bot.is_owner(interaction.user):  # type: ignore
+            return True
+        await interaction.response.send_message(
+            "Only the owner of the bot can do this", ephemeral=True
+        )
+        return False
+
+    @profile.command(name="cpu", description="Samples what the bot is busy with")
+    @describe(seconds="For how long to sample")
+    async def profile_cpu(
+        self, interaction: Interaction, seconds: Range[int, 1, 120]
+    ) -> None:
+        if self._cpu_lock.locked():
+            await interaction.response.send_message(
+                "A CPU profile is already running", ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        async with self._cpu_lock:
+            LOGGER.info(f"Profiling the event loop for {seconds}s")
+            # the sampler runs in another thread and watches this one
+            sampler = StackSampler(get_ident())
+            samples = await to_thread(sampler.run, seconds)
+
+        await interaction.followup.send(
+            f"Sampled the event loop for {md.bold(f"{seconds}s")}",
+            files=[
+                _make_file("profile", format_profile_report(samples)),
+                _make_file("stacks", format_collapsed_stacks(samples)),
+            ],
+            ephemeral=True,
+        )
+
+    @memory.command(name="start", description="Starts tracing memory allocations")
+    async def start_memory_tracing(self, interaction: Interaction) -> None:
+        if tracemalloc.is_tracing():
+            await interaction.response.send_message(
+                "Memory allocations are already being traced", ephemeral=True
+            )
+            return
+
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._snapshot = None
+        LOGGER.info("Started tracing memory allocations")
+        await interaction.response.send_message(
+            "Started tracing memory allocations", ephemeral=True
+        )
+
+    @memory.command(
+        name="snapshot",
+        description="Shows top allocators and what changed since the last snapshot",
+    )
+    async def take_memory_snapshot(self, interaction: Interaction) -> None:
+        if not tracemalloc.is_tracing():
+            await interaction.response.send_message(
+                f"Memory allocations aren't being traced, run {md.inline_code("/profile memory start")} first",
+                ephemeral=True,
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        snapshot = await to_thread(_take_snapshot)
+        report = await to_thread(format_memory_report, snapshot, self._snapshot)
+        self._snapshot = snapshot
+
+        await interaction.followup.send(
+            files=[_make_file("memory", report)], ephemeral=True
+        )
+
+    @memory.command(name="stop", description="Stops tracing memory allocations")
+    async def stop_memory_tracing(self, interaction: Interaction) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
+        LOGGER.info("Stopped tracing memory allocations")
+        await interaction.response.send_message(
+            "Stopped tracing memory allocations", ephemeral=True
+        )
+
+
+async def setup(bot: Bot) -> None:
+    await bot.add_cog(OwnerCog(bot))
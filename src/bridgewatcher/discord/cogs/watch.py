@@ -0,0 +1,178 @@
+from uuid import uuid4
+
+from discord import Color, Guild, Interaction
+from discord.app_commands import (
+    Choice,
+    Range,
+    check,
+    choices,
+    command,
+    describe,
+    guild_only,
+)
+from discord.ext.commands import Bot, GroupCog
+
+from bridgewatcher.api.model import Cities, Qualities
+from bridgewatcher.db import backends
+from bridgewatcher.db.schema import Watch, WatchKinds
+from bridgewatcher.discord.embed import BridgewatcherEmbed
+from bridgewatcher.discord.formatting import get_item_name_by_id, md
+from bridgewatcher.discord.items import ItemGuesser, guard_item_errors
+from bridgewatcher.discord.reply import reply
+from bridgewatcher.discord.server import ServerManager
+from bridgewatcher.discord.watches import describe_watch
+from bridgewatcher.metrics import instrument_command
+from bridgewatcher.util.exc import NoItemFoundError
+
+
+@guild_only()
+class WatchCog(GroupCog, group_name="watch", group_description="Price alerts"):
+    MAX_WATCHES_PER_GUILD = 100
+    MAX_WATCHES_PER_USER = 10
+
+    @command(name="add", description="Get notified when an item hits your price")
+    @describe(
+        item_name="Name of the item you want to watch",
+        quality="Quality of the item",
+        kind="What should happen to the price",
+        threshold="Price in silver, or the margin in percent for flips",
+        city="City to watch, every city if not given",
+        for_server="Watch for the whole server without mentioning you",
+    )
+    @choices(
+        quality=[
+            Choice(name=quality.name.lower(), value=quality.value)
+            for quality in Qualities
+        ],
+        kind=[
+            Choice(name="price drops below", value=WatchKinds.BELOW.value),
+            Choice(name="price rises above", value=WatchKinds.ABOVE.value),
+            Choice(name="flip margin over", value=WatchKinds.MARGIN.value),
+        ],
+        city=[Choice(name=city.title(), value=city.value) for city in Cities],
+    )
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("watch add")
+    @guard_item_errors
+    async def add_watch(
+        self,
+        interaction: Interaction,
+        item_name: str,
+        quality: Choice[int],
+        kind: Choice[str],
+        threshold: Range[int, 1],
+        city: Choice[str] | None = None,
+        for_server: bool = False,
+    ) -> None:
+        if for_server and not interaction.permissions.manage_guild:
+            await interaction.response.send_message(
+                "You need the Manage Server permission to watch for the whole server",
+                ephemeral=True,
+            )
+            return
+
+        guild: Guild = interaction.guild  # type: ignore
+        watches = [
+            Watch.from_mongo(doc) for doc in await backends.store.find_watches(guild.id)
+        ]
+        user_id = None if for_server else interaction.user.id
+        if len(watches) >= self.MAX_WATCHES_PER_GUILD or (
+            user_id is not None
+            and sum(watch.user_id == user_id for watch in watches)
+            >= self.MAX_WATCHES_PER_USER
+        ):
+            await interaction.response.send_message(
+                "There are too many watches already, remove some with `/watch remove` first",
+                ephemeral=True,
+            )
+            return
+
+        item, name = await ItemGuesser.guess_item_by_name(interaction, item_name)
+        conf = await ServerManager.get_or_create_conf(guild)
+        watch = Watch(
+            id=uuid4().hex[:10],
+            guild_id=guild.id,
+            channel_id=interaction.channel_id,  # type: ignore
+            user_id=user_id,
+            server=conf.fetch_server,
+            item_id=item.name,
+            quality=Qualities.from_int(quality.value),
+            kind=WatchKinds(kind.value),
+            threshold=threshold,
+            city=Cities.from_str(city.value) if city is not None else None,
+        )
+        await backends.store.insert_watch(watch.to_mongo())
+
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title="🔔 Watching",
+            color=Color.gold(),
+            description=(
+                f"{describe_watch(watch, name.name)}\n"
+                f"Alerts go to this channel. Remove the watch with "
+                f"`/watch remove {watch.id}`"
+            ),
+        )
+        await reply(interaction, embed=embed)
+
+    @command(name="list", description="Shows the watches on this server")
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("watch list")
+    async def list_watches(self, interaction: Interaction) -> None:
+        guild: Guild = interaction.guild  # type: ignore
+        watches = [
+            Watch.from_mongo(doc)
+            for doc in await backends.store.find_watches(guild.id)
+            if doc["user_id"] in (None, interaction.user.id)
+        ]
+
+        entries = []
+        for watch in watches:
+            try:
+                item_name = (await get_item_name_by_id(watch.item_id)).name
+            except NoItemFoundError:
+                item_name = watch.item_id
+            owner = "server" if watch.user_id is None else "you"
+            entries.append(
+                f"{md.inline_code(watch.id)} {describe_watch(watch, item_name)} ({owner})"
+            )
+
+        embed = await BridgewatcherEmbed.from_interaction(
+            interaction,
+            title="🔔 Watches",
+            color=Color.gold(),
+            description="\n".join(entries) if entries else "Nothing is being watched",
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @command(name="remove", description="Stops watching an item")
+    @describe(id="Id of the watch, see /watch list")
+    @check(lambda ctx: ctx.guild is not None)
+    @instrument_command("watch remove")
+    async def remove_watch(self, interaction: Interaction, id: str) -> None:
+        guild: Guild = interaction.guild  # type: ignore
+        watch = next(
+            (
+                Watch.from_mongo(doc)
+                for doc in await backends.store.find_watches(guild.id)
+                if doc["id"] == id
+            ),
+            None,
+        )
+        allowed = watch is not None and (
+            watch.user_id == interaction.user.id or interaction.permissions.manage_guild
+        )
+        if not allowed:
+            await interaction.response.send_message(
+                f"There's no watch {md.inline_code(id)} you can remove", ephemeral=True
+            )
+            return
+
+        await backends.store.delete_watch(guild.id, id)
+        await interaction.response.send_message(
+            f"Stopped watching {md.inline_code(id)}", ephemeral=True
+        )
+
+
+async def setup(bot: Bot) -> None:
+    await bot.add_cog(WatchCog())
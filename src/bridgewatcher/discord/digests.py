@@ -0,0 +1,243 @@
+from asyncio import gather, sleep
+from collections import defaultdict
+from itertools import batched
+from time import perf_counter, time
+
+from discord import Client, Color, Embed, HTTPException
+
+from bridgewatcher.api import AlbionOnline, AlbionOnlineServers
+from bridgewatcher.db import backends
+from bridgewatcher.db.coordination import claim, release
+from bridgewatcher.db.schema import DigestFrequencies, DiscordServer
+from bridgewatcher.discord.admission import TokenBucket
+from bridgewatcher.discord.formatting import format_number, get_item_name_by_id, md
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market import DigestBuilder
+from bridgewatcher.market.model import MarketDigest
+from bridgewatcher.metrics import (
+    DIGEST_CYCLE_DURATION,
+    DIGEST_DELIVERIES,
+    DIGESTS_BUILT,
+)
+from bridgewatcher.util.exc import NoItemFoundError
+
+# how often the scheduler looks for due digests, an hourly digest goes out
+# within this many seconds of the hour
+DEFAULT_DIGEST_INTERVAL = 60
+
+# albion server and category
+DigestProfile = tuple[str, str | None]
+
+
+async def get_item_names(ids: set[str]) -> dict[str, str]:
+    names = {}
+    for item_id in ids:
+        try:
+            names[item_id] = (await get_item_name_by_id(item_id)).name
+        except NoItemFoundError:
+            names[item_id] = item_id
+    return names
+
+
+def make_digest_embed(digest: MarketDigest, names: dict[str, str]) -> Embed:
+    embed = Embed(
+        title="📰 Market digest",
+        color=Color.dark_gold(),
+        description=(
+            f"{(digest.category or "every category").title()} "
+            f"on the {digest.server} server"
+        ),
+    )
+
+    flips = [
+        f"{md.bold(names[id])}: buy in {flip.buy_city.title()} for "
+        f"{format_number(flip.buy_price)}, sell in {flip.sell_city.title()} for "
+        f"{format_number(flip.sell_price)}, {md.bold(format_number(flip.profit))} profit"
+        for id, flip in digest.flips
+    ]
+    embed.add_field(
+        name="💹Top flips",
+        value="\n".join(flips) or "Nothing worth flipping right now",
+        inline=False,
+    )
+
+    crafts = [
+        f"{md.bold(names[craft.item.name])}: craft in {craft.crafting_city.title()}, "
+        f"sell in {craft.income.sell_city.title()}, "
+        f"{md.bold(format_number(craft.profit))} profit"
+        for craft in digest.crafts
+    ]
+    embed.add_field(
+        name="🛠️Top crafts",
+        value="\n".join(crafts) or "Nothing worth crafting right now",
+        inline=False,
+    )
+
+    if digest.gold:
+        change = digest.gold_change
+        trend = (
+            f", {"📈" if change >= 0 else "📉"} {change:+.1f}% over the last "
+            f"{len(digest.gold)} hours"
+            if change is not None
+            else ""
+        )
+        gold = f"{md.bold(format_number(digest.gold[-1].price))} silver{trend}"
+    else:
+        gold = "No gold prices right now"
+    embed.add_field(name="🪙Gold", value=gold, inline=False)
+    return embed
+
+
+# Guilds subscribe channels to hourly or daily digests of a category. However
+# many guilds do, every digest is built and rendered once per albion server
+# and category and the same embed is sent to all of its channels. Like the
+# watches, only one process delivers a period's digests: whoever claims it
+class DigestScheduler:
+    # well below the 50 requests a second Discord allows a bot in total, the
+    # commands and the watch alerts need their share of it too
+    DELIVERIES_PER_SECOND = 5.0
+    DELIVERIES_BURST = 5
+    # channels sent to at once, every one of them still waits for the bucket
+    DELIVERY_BATCH_SIZE = 10
+
+    def __init__(self, bot: Client, interval: float) -> None:
+        self.bot = bot
+        self.interval = interval
+        self._bucket = TokenBucket(self.DELIVERIES_PER_SECOND, self.DELIVERIES_BURST)
+
+    async def run(self) -> None:
+        while True:
+            started = perf_counter()
+            try:
+                await self._run_due()
+            except Exception:
+                LOGGER.exception("Couldn't deliver the digests")
+            await sleep(max(0.0, self.interval - (perf_counter() - started)))
+
+    # A cycle that didn't get every digest out hands its claims back, the next
+    # check runs it again for the digests that are still missing
+    async def _run_due(self) -> None:
+        claims = await self._claim_due_frequencies()
+        if not claims:
+            return
+
+        complete = False
+        try:
+            with DIGEST_CYCLE_DURATION.time():
+                complete = await self.run_cycle(claims)
+        finally:
+            if not complete:
+                await release(*claims.values())
+
+    # A frequency is due once in every one of its periods, the claim keeps it
+    # from being delivered twice in one however many processes check
+    async def _claim_due_frequencies(self) -> dict[DigestFrequencies, str]:
+        now = time()
+        claims = {}
+        for frequency in DigestFrequencies:
+            name = f"digests:{frequency.value}:{int(now // frequency.period)}"
+            if await claim(name, frequency.period):
+                claims[frequency] = name
+        return claims
+
+    async def _get_subscribers(
+        self, frequencies: list[DigestFrequencies]
+    ) -> dict[DigestProfile, list[int]]:
+        servers = [
+            DiscordServer.from_mongo(doc)
+            for doc in await backends.store.get_digest_servers()
+        ]
+        subscribers: dict[DigestProfile, list[int]] = defaultdict(list)
+        for server in servers:
+            for digest in server.digests:
+                if digest.frequency in frequencies:
+                    subscribers[(server.fetch_server, digest.category)].append(
+                        digest.channel_id
+                    )
+        # at midnight the hourly and the daily digests are due together, a
+        # channel getting both of the same kind only needs it once
+        return {
+            profile: list(dict.fromkeys(channels))
+            for profile, channels in subscribers.items()
+        }
+
+    # Returns whether every digest due went out. Every digest is claimed on
+    # its own as well, so a cycle run again only builds and sends the ones
+    # that are still missing
+    async def run_cycle(self, claims: dict[DigestFrequencies, str]) -> bool:
+        frequencies = list(claims)
+        subscribers = await self._get_subscribers(frequencies)
+        period = min(frequency.period for frequency in frequencies)
+        # everything gets built before anything is sent, delivering a popular
+        # digest takes a while and would hold the others back
+        embeds: dict[DigestProfile, tuple[str, Embed]] = {}
+        complete = True
+        for server, category in subscribers:
+            name = f"{"|".join(claims.values())}:{server}:{category}"
+            if not await claim(name, period):
+                continue
+            try:
+                embeds[(server, category)] = name, await self._build(server, category)
+            except Exception:
+                LOGGER.exception(
+                    f"Couldn't build the digest of {category or "every category"} "
+                    f"on {server}"
+                )
+                complete = False
+                await release(name)
+
+        delivered = 0
+        for (server, category), (name, embed) in embeds.items():
+            try:
+                delivered += await self._deliver(subscribers[(server, category)], embed)
+            except Exception:
+                # sending it again to the channels that got it beats losing it
+                LOGGER.exception(
+                    f"Couldn't deliver the digest of {category or "every category"} "
+                    f"on {server}"
+                )
+                complete = False
+                await release(name)
+        LOGGER.info(
+            f"Delivered {delivered} {"/".join(frequencies)} digests, "
+            f"{len(embeds)} of {len(subscribers)} kinds were built"
+        )
+        return complete
+
+    async def _build(self, server: str, category: str | None) -> Embed:
+        # nobody waits on a digest, it can wait for the budget instead of
+        # failing and leaves the commands their share of it
+        builder = DigestBuilder(
+            AlbionOnline(AlbionOnlineServers.from_str(server), paced=True)
+        )
+        digest = await builder.build(category)
+        DIGESTS_BUILT.inc(server=server)
+        names = await get_item_names(
+            {id for id, _ in digest.flips}
+            | {craft.item.name for craft in digest.crafts}
+        )
+        return make_digest_embed(digest, names)
+
+    async def _send(self, channel_id: int, embed: Embed) -> bool:
+        while (delay := self._bucket.take()) > 0:
+            await sleep(delay)
+
+        channel = self.bot.get_partial_messageable(channel_id)
+        try:
+            await channel.send(embed=embed)
+            DIGEST_DELIVERIES.inc(result="sent")
+            return True
+        except HTTPException as e:
+            # the channel is gone or the bot can't write there anymore
+            DIGEST_DELIVERIES.inc(result="failed")
+            LOGGER.warning(f"Couldn't send the digest to channel {channel_id}: {e}")
+            return False
+
+    # Channels are sent to in small batches, the bucket staggers the sends
+    # within them so a popular digest doesn't eat the whole rate limit at once
+    async def _deliver(self, channels: list[int], embed: Embed) -> int:
+        delivered = 0
+        for batch in batched(channels, self.DELIVERY_BATCH_SIZE):
+            results = await gather(*(self._send(channel, embed) for channel in batch))
+            delivered += sum(results)
+        return delivered
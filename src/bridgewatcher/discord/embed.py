@@ -1,3 +1,5 @@
+from math import ceil
+
 from discord import Color, Embed, Interaction
 
 from bridgewatcher.discord.formatting import md
@@ -65,3 +67,21 @@ class InsufficientDataEmbed(Embed):
             title=f"No fresh data on your item",
             description=f"Tired of these incidents? Download and install the {md.link("Albion Online Data Project client", "https://www.albion-online-data.com/client")} and feed the bot fresh prices for the items you browse in-game!",
         )
+
+
+class CatalogNotReadyEmbed(Embed):
+    def __init__(self):
+        super().__init__(
+            color=Color.red(),
+            title=f"Bridgewatcher is still warming up",
+            description="The item catalog is being loaded, try again in a minute",
+        )
+
+
+class BusyEmbed(Embed):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            color=Color.red(),
+            title=f"Bridgewatcher is busy right now",
+            description=f"Too many requests at the moment, try again in {ceil(retry_after)} s",
+        )
@@ -0,0 +1,223 @@
+from asyncio import Event, Future, get_running_loop, wait_for
+from json import dumps, loads
+from os import getenv
+from signal import SIGINT, SIGTERM
+from typing import Any
+
+from aiohttp import ClientSession, web
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from discord import InteractionResponseType, InteractionType
+from discord.http import MultipartParameters, Route
+from discord.webhook.async_ import async_context
+
+from bridgewatcher.discord import Bridgewatcher, bot
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import ENDPOINT_INTERACTIONS
+from bridgewatcher.util.exc import EndpointConfigurationError
+
+DEFAULT_ENDPOINT_HOST = "0.0.0.0"
+DEFAULT_ENDPOINT_PORT = 8080
+# Discord waits 3 seconds for the initial response, the rest is left for the
+# network between us
+INITIAL_RESPONSE_DEADLINE = 2.5
+
+
+def load_public_key(value: str) -> Ed25519PublicKey:
+    try:
+        return Ed25519PublicKey.from_public_bytes(bytes.fromhex(value))
+    except ValueError as e:
+        raise EndpointConfigurationError(
+            "The public key of the application is not a valid Ed25519 key"
+        ) from e
+
+
+# https://discord.com/developers/docs/interactions/overview#setting-up-an-endpoint-validating-security-request-headers
+def verify_signature(
+    public_key: Ed25519PublicKey, signature: str, timestamp: str, body: bytes
+) -> bool:
+    try:
+        public_key.verify(bytes.fromhex(signature), timestamp.encode("utf-8") + body)
+    except (InvalidSignature, ValueError):
+        return False
+    return True
+
+
+# What the endpoint answers with on its own when the handler didn't respond
+# in time, the handler's response then edits the original message instead
+def get_deferral(interaction_type: int) -> dict[str, Any]:
+    if interaction_type == InteractionType.autocomplete.value:
+        return {
+            "type": InteractionResponseType.autocomplete_result.value,
+            "data": {"choices": []},
+        }
+    if interaction_type == InteractionType.application_command.value:
+        return {"type": InteractionResponseType.deferred_channel_message.value}
+    return {"type": InteractionResponseType.deferred_message_update.value}
+
+
+def _get_callback_payload(params: MultipartParameters) -> dict[str, Any]:
+    if params.payload is not None:
+        return params.payload
+    # with files the payload travels as the first part of the form
+    return loads(params.multipart[0]["value"])  # type: ignore
+
+
+# Serves application commands delivered by Discord as signed HTTP requests
+# instead of over the gateway. No state lives in here but what a single
+# request needs, so any number of these can run behind a load balancer. The
+# first response of a handler becomes the body of the HTTP response, which
+# saves the callback request to Discord. Anything slower gets deferred and
+# answered over REST once it's done
+class InteractionsEndpoint:
+    def __init__(self, bot: Bridgewatcher, public_key: Ed25519PublicKey) -> None:
+        self.bot = bot
+        self.public_key = public_key
+        # interaction id -> the initial response, None to defer it
+        self._responses: dict[int, Future[dict[str, Any] | None]] = {}
+        self._runner: web.AppRunner | None = None
+
+    # Every initial response discord.py sends goes through this method of the
+    # webhook adapter, no matter which command or view sends it
+    def install(self) -> None:
+        adapter = async_context.get()
+        adapter.create_interaction_response = self._create_interaction_response  # type: ignore
+
+    async def _create_interaction_response(
+        self,
+        interaction_id: int,
+        token: str,
+        *,
+        session: ClientSession,
+        params: MultipartParameters,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        response = self._responses.pop(interaction_id, None)
+        if response is not None and not response.done():
+            if not params.files:
+                response.set_result(_get_callback_payload(params))
+                return {"interaction": {"id": str(interaction_id)}}
+            # files go over REST, the endpoint only answers with JSON
+            response.set_result(None)
+
+        await self._send_late_response(token, params, session, **kwargs)
+        return {"interaction": {"id": str(interaction_id)}}
+
+    async def _send_late_response(
+        self,
+        token: str,
+        params: MultipartParameters,
+        session: ClientSession,
+        **kwargs: Any,
+    ) -> None:
+        payload = _get_callback_payload(params)
+        response_type = payload["type"]
+        if response_type in (
+            InteractionResponseType.deferred_channel_message.value,
+            InteractionResponseType.deferred_message_update.value,
+        ):
+            return
+        if response_type not in (
+            InteractionResponseType.channel_message.value,
+            InteractionResponseType.message_update.value,
+        ):
+            LOGGER.warning(
+                f"Dropped a {InteractionResponseType(response_type).name} response "
+                "sent after the interaction was deferred"
+            )
+            return
+
+        route = Route(
+            "PATCH",
+            "/webhooks/{webhook_id}/{webhook_token}/messages/@original",
+            webhook_id=self.bot.application_id,
+            webhook_token=token,
+        )
+        data = payload.get("data", {})
+        adapter = async_context.get()
+        if params.files:
+            multipart = [
+                {"name": "payload_json", "value": dumps(data)},
+                *params.multipart[1:],  # type: ignore
+            ]
+            await adapter.request(
+                route, session, multipart=multipart, files=params.files, **kwargs
+            )
+        else:
+            await adapter.request(route, session, payload=data, **kwargs)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not verify_signature(
+            self.public_key,
+            request.headers.get("X-Signature-Ed25519", ""),
+            request.headers.get("X-Signature-Timestamp", ""),
+            body,
+        ):
+            ENDPOINT_INTERACTIONS.inc(type="unknown", response="rejected")
+            return web.Response(status=401, text="invalid request signature")
+
+        data = loads(body)
+        interaction_type = data["type"]
+        type_name = InteractionType(interaction_type).name
+        if interaction_type == InteractionType.ping.value:
+            ENDPOINT_INTERACTIONS.inc(type=type_name, response="inline")
+            return web.json_response({"type": InteractionResponseType.pong.value})
+
+        interaction_id = int(data["id"])
+        response = get_running_loop().create_future()
+        self._responses[interaction_id] = response
+        # the same path interactions from the gateway take, commands and views
+        # run in tasks of their own
+        self.bot._connection.parse_interaction_create(data)
+        try:
+            payload = await wait_for(response, INITIAL_RESPONSE_DEADLINE)
+        except TimeoutError:
+            payload = None
+        finally:
+            self._responses.pop(interaction_id, None)
+
+        if payload is None:
+            ENDPOINT_INTERACTIONS.inc(type=type_name, response="deferred")
+            return web.json_response(get_deferral(interaction_type))
+        ENDPOINT_INTERACTIONS.inc(type=type_name, response="inline")
+        return web.json_response(payload)
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_post("/interactions", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        # workers on the same machine share the port, the kernel spreads the
+        # connections between them
+        await web.TCPSite(self._runner, host, port, reuse_port=True).start()
+        LOGGER.info(f"Serving interactions on http://{host}:{port}/interactions")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve_interactions(token: str) -> None:
+    host = getenv("ENDPOINT_HOST") or DEFAULT_ENDPOINT_HOST
+    port = int(getenv("ENDPOINT_PORT") or DEFAULT_ENDPOINT_PORT)
+
+    stopped = Event()
+    loop = get_running_loop()
+    for signum in (SIGINT, SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    async with bot:
+        # logging in runs the setup hook as well, there's just no gateway
+        # connection afterwards
+        await bot.login(token)
+        public_key = getenv("DISCORD_PUBLIC_KEY") or bot.application.verify_key  # type: ignore
+        endpoint = InteractionsEndpoint(bot, load_public_key(public_key))
+        endpoint.install()
+        await endpoint.start(host, port)
+        try:
+            await stopped.wait()
+        finally:
+            LOGGER.info("Stopping the interactions endpoint...")
+            await endpoint.close()
@@ -1,6 +1,7 @@
 from .text import (
     Markdown,
     format_number,
+    format_compact_number,
     readable_timestamp,
     get_datetime_from_timestamp,
     get_item_name_by_id,
@@ -11,6 +12,7 @@ md = Markdown()
 __all__ = (
     "md",
     "format_number",
+    "format_compact_number",
     "readable_timestamp",
     "get_datetime_from_timestamp",
     "get_item_name_by_id",
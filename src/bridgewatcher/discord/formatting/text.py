@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import Any
 
-from bridgewatcher.db import db
+from bridgewatcher.db import backends
 from bridgewatcher.db.schema import ItemName
 from bridgewatcher.util.exc import NoItemFoundError
 
@@ -47,9 +47,16 @@ def format_number(n: int) -> str:
     return f"{n:,}"
 
 
+# 1.2m or -350k, for tables where every column needs to stay narrow
+def format_compact_number(n: int) -> str:
+    for divisor, suffix in ((1_000_000_000, "b"), (1_000_000, "m"), (1_000, "k")):
+        if abs(n) >= divisor:
+            return f"{n / divisor:.1f}{suffix}"
+    return str(n)
+
+
 async def get_item_name_by_id(item_id: str) -> ItemName:
-    names = db.get_collection("item_names")
-    name = await names.find_one({"id": item_id})
+    name = await backends.store.find_item_name(item_id)
     if name is None:
         raise NoItemFoundError(f"{item_id} doesn't exist", item_id)
     return ItemName.from_mongo(name)
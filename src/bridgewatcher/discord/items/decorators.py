@@ -4,12 +4,15 @@ from typing import Callable
 from discord import Interaction
 
 from bridgewatcher.discord.embed import (
+    CatalogNotReadyEmbed,
     InsufficientDataEmbed,
     NoItemFoundEmbed,
     TimeoutEmbed,
     UntrackedItemEmbed,
 )
+from bridgewatcher.discord.reply import reply
 from bridgewatcher.util.exc import (
+    CatalogNotReadyError,
     InsufficientDataError,
     NoItemFoundError,
     UntrackedItemRequested,
@@ -22,16 +25,16 @@ def guard_item_errors(func: Callable) -> Callable:
         try:
             return await func(self, interaction, *args, **kwargs)
         except NoItemFoundError as e:
-            await interaction.followup.send(
-                embed=NoItemFoundEmbed(e.item_name), ephemeral=True
+            await reply(
+                interaction, embed=NoItemFoundEmbed(e.item_name), ephemeral=True
             )
         except UntrackedItemRequested:
-            await interaction.followup.send(embed=UntrackedItemEmbed(), ephemeral=True)
+            await reply(interaction, embed=UntrackedItemEmbed(), ephemeral=True)
         except TimeoutError:
-            await interaction.followup.send(embed=TimeoutEmbed(), ephemeral=True)
+            await reply(interaction, embed=TimeoutEmbed(), ephemeral=True)
         except InsufficientDataError:
-            await interaction.followup.send(
-                embed=InsufficientDataEmbed(), ephemeral=True
-            )
+            await reply(interaction, embed=InsufficientDataEmbed(), ephemeral=True)
+        except CatalogNotReadyError:
+            await reply(interaction, embed=CatalogNotReadyEmbed(), ephemeral=True)
 
     return wrapper
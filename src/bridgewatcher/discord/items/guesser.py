@@ -1,9 +1,8 @@
-from re import IGNORECASE, compile, escape
-
 from discord import Interaction
 
-from bridgewatcher.db import db
+from bridgewatcher.db import backends
 from bridgewatcher.db.schema import Item, ItemName
+from bridgewatcher.db.catalog import wait_for_catalog
 from bridgewatcher.discord.views import ItemPickerView
 from bridgewatcher.util.exc import NoItemFoundError, UntrackedItemRequested
 
@@ -13,21 +12,21 @@ class ItemGuesser:
     async def guess_item_by_name(
         interaction: Interaction, item_name: str
     ) -> tuple[Item, ItemName]:
-        await interaction.response.send_message("Searching...", ephemeral=True)
+        # the answer ends up in place of the "thinking" message, editing it
+        # costs a single call no matter whether the picker was shown or not
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True)
+        await wait_for_catalog()
 
-        names = db.get_collection("item_names")
-        regex = compile(f"^.*{escape(item_name)}.*$", IGNORECASE)
-        results = await names.find({"name": regex}, limit=5).to_list()
+        results = await backends.store.search_item_names(item_name, limit=5)
 
         if not results:
-            await interaction.delete_original_response()
             raise NoItemFoundError(f"{item_name} doesn't exist", item_name)
         elif len(results) == 1:
-            await interaction.delete_original_response()
             return await ItemGuesser._get_item_by_id_from_list(results, 0)
 
         names = [ItemName.from_mongo(result) for result in results]
-        view = ItemPickerView(names)
+        view = ItemPickerView(names, interaction.user.id)
         await interaction.edit_original_response(
             content="Please, select the item you're looking for from the options below",
             view=view,
@@ -35,9 +34,7 @@ class ItemGuesser:
 
         timed_out = await view.wait()
         if timed_out:
-            await interaction.delete_original_response()
             raise TimeoutError("User didn't select an item")
-        await interaction.delete_original_response()
 
         index: int = view.selected_index  # type: ignore
         return await ItemGuesser._get_item_by_id_from_list(results, index)
@@ -46,10 +43,8 @@ class ItemGuesser:
     async def _get_item_by_id_from_list(
         item_names: list[dict], index: int
     ) -> tuple[Item, ItemName]:
-        items = db.get_collection("items")
-
         item_name = ItemName.from_mongo(item_names[index])
-        item = await items.find_one({"name": item_name.id})
+        item = await backends.store.find_item(item_name.id)
         # interestingly enough this result may be null cause not all
         # items are stored in the db. if it's not stored it's unimportant
         if item is None:
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from typing import Any
+
+from discord import Interaction, InteractionResponseType
+
+# interaction tokens can't be used to answer after that
+INTERACTION_LIFETIME = 15 * 60
+
+
+# How long there's still a point in working on an answer, jobs that run longer
+# are cancelled since nobody would ever see their result
+def get_time_left(interaction: Interaction) -> float:
+    elapsed = datetime.now(timezone.utc) - interaction.created_at
+    return max(0.0, INTERACTION_LIFETIME - elapsed.total_seconds())
+
+
+# Picks the cheapest way to answer for how far the interaction already got:
+# the initial response if nothing was sent yet, an edit of the deferred or
+# picker message in place if there's one and a followup only when the
+# original response is a message of its own. An edit can't hide the public
+# "thinking" message from everybody else, so ephemeral answers to deferred
+# interactions replace it with an ephemeral followup instead
+async def reply(
+    interaction: Interaction, *, ephemeral: bool = False, **kwargs: Any
+) -> None:
+    if not interaction.response.is_done():
+        await interaction.response.send_message(ephemeral=ephemeral, **kwargs)
+    elif interaction.response.type in (
+        InteractionResponseType.deferred_channel_message,
+        InteractionResponseType.deferred_message_update,
+    ):
+        if not ephemeral:
+            # whatever the picker showed goes away unless it's replaced
+            await interaction.edit_original_response(
+                **{"content": None, "view": None, **kwargs}
+            )
+            return
+        # the first followup would take over the deferred message along with
+        # its visibility, it has to be gone before
+        await interaction.delete_original_response()
+        await interaction.followup.send(ephemeral=True, **kwargs)
+    else:
+        await interaction.followup.send(ephemeral=ephemeral, **kwargs)
@@ -1,8 +1,8 @@
 from discord import Guild
 
 from bridgewatcher.api import AlbionOnline, AlbionOnlineServers
-from bridgewatcher.db import db
-from bridgewatcher.db.schema import DiscordServer
+from bridgewatcher.db import backends
+from bridgewatcher.db.schema import DigestSubscription, DiscordServer
 
 
 class ServerManager:
@@ -15,14 +15,12 @@ class ServerManager:
     @classmethod
     async def create_conf(cls, guild: Guild) -> DiscordServer:
         server = DiscordServer(guild.id, AlbionOnlineServers.AMERICA.value)
-        servers = db.get_collection("discord_servers")
-        await servers.insert_one(server.to_mongo())
+        await backends.store.insert_server(server.to_mongo())
         return server
 
     @classmethod
     async def get_or_create_conf(cls, guild: Guild) -> DiscordServer:
-        servers = db.get_collection("discord_servers")
-        server = await servers.find_one({"id": guild.id})
+        server = await backends.store.find_server(guild.id)
         if server is not None:
             return DiscordServer.from_mongo(server)
 
@@ -34,14 +32,27 @@ class ServerManager:
     ) -> DiscordServer:
         server = await cls.get_or_create_conf(guild)
         server.fetch_server = fetch_server.value
-        servers = db.get_collection("discord_servers")
-        await servers.update_one(
-            filter={"id": guild.id},
-            update={"$set": {"fetch_server": server.fetch_server}},
+        await backends.store.update_server(
+            guild.id, {"fetch_server": server.fetch_server}
+        )
+        # the watches carry the server along, so the scheduler never has to
+        # look up the configuration of their guild
+        await backends.store.update_watches(guild.id, {"server": server.fetch_server})
+        return server
+
+    # The whole list is written at once, a guild has only a handful of them
+    @classmethod
+    async def update_digests(
+        cls, guild: Guild, digests: list[DigestSubscription]
+    ) -> DiscordServer:
+        server = await cls.get_or_create_conf(guild)
+        server.digests = digests
+        await backends.store.update_server(
+            guild.id, {"digests": [digest.to_mongo() for digest in digests]}
         )
         return server
 
     @classmethod
     async def delete_conf(cls, guild: Guild) -> None:
-        servers = db.get_collection("discord_servers")
-        await servers.delete_one({"id": guild.id})
+        await backends.store.delete_server(guild.id)
+        await backends.store.delete_watches(guild.id)
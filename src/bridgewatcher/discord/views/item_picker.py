@@ -5,9 +5,10 @@ from bridgewatcher.db.schema import ItemName
 
 
 class ItemPickerView(View):
-    def __init__(self, items: list[ItemName]):
+    def __init__(self, items: list[ItemName], user_id: int):
         super().__init__(timeout=180)
         self.items = items
+        self.user_id = user_id
         self.selected_index: int | None = None
 
         for i, item in enumerate(items):
@@ -22,6 +23,15 @@ class ItemPickerView(View):
             button.callback = self._make_callback(i)
             self.add_item(button)
 
+    # the picker is shown in the channel, only whoever asked gets to pick
+    async def interaction_check(self, interaction: Interaction) -> bool:
+        if interaction.user.id == self.user_id:
+            return True
+        await interaction.response.send_message(
+            "Only the person who used the command can pick the item", ephemeral=True
+        )
+        return False
+
     def _make_callback(self, index: int):
         async def callback(interaction: Interaction) -> None:
             self.selected_index = index
@@ -0,0 +1,199 @@
+from asyncio import gather, sleep
+from collections import defaultdict
+from itertools import batched
+from time import perf_counter
+
+from discord import AllowedMentions, Client, Color, Embed, HTTPException
+
+from bridgewatcher.api import AlbionOnline, AlbionOnlineServers
+from bridgewatcher.db import backends
+from bridgewatcher.db.coordination import claim
+from bridgewatcher.db.schema import Watch, WatchKinds
+from bridgewatcher.discord.admission import TokenBucket
+from bridgewatcher.discord.formatting import format_number, get_item_name_by_id, md
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market.model import WatchHit
+from bridgewatcher.market.watchlist import WatchEvaluator, index_watches
+from bridgewatcher.metrics import WATCH_ALERTS, WATCH_CYCLE_DURATION, WATCHED_ITEMS
+from bridgewatcher.util.exc import NoItemFoundError
+
+# the cached prices expire after that anyway, evaluating more often would
+# only see the same prices again
+DEFAULT_WATCH_INTERVAL = AlbionOnline.ITEM_CACHE_EXPIRATION_PERIOD
+# watches that already went off, they are only announced again after their
+# condition stopped holding at least once
+TRIGGERED_KEY = "watches:triggered"
+
+
+def describe_watch(watch: Watch, item_name: str) -> str:
+    where = f" in {watch.city.title()}" if watch.city is not None else ""
+    quality = watch.quality.name.lower()
+    if watch.kind == WatchKinds.MARGIN:
+        return f"{item_name} ({quality}) flip margin over {watch.threshold}%{where}"
+    return (
+        f"{item_name} ({quality}) {watch.kind.value} "
+        f"{format_number(watch.threshold)} silver{where}"
+    )
+
+
+def describe_hit(hit: WatchHit, item_name: str) -> str:
+    quality = hit.watch.quality.name.lower()
+    if hit.flip is not None:
+        return (
+            f"{md.bold(item_name)} ({quality}): {md.bold(f"{hit.value}%")} margin, "
+            f"buy in {hit.flip.buy_city.title()} for {format_number(hit.flip.buy_price)} "
+            f"and sell in {hit.flip.sell_city.title()} for {format_number(hit.flip.sell_price)}"
+        )
+    return (
+        f"{md.bold(item_name)} ({quality}): {md.bold(format_number(hit.value))} "
+        f"silver in {hit.city.title()}"
+    )
+
+
+# A single scheduler evaluates the watches of every guild each cycle, no
+# matter how many processes run the bot: whoever claims the cycle first does
+# it. The watches are indexed by server and item, so the cost of a cycle
+# grows with the distinct items being watched and not with the watches
+class WatchScheduler:
+    # a message holds up to 10 embeds, the lines are spread over them
+    LINES_PER_EMBED = 20
+    MAX_EMBEDS_PER_MESSAGE = 10
+    # well below the 50 requests a second Discord allows a bot in total, the
+    # commands keep most of it
+    ALERTS_PER_SECOND = 5.0
+    ALERTS_BURST = 5
+
+    def __init__(self, bot: Client, interval: float) -> None:
+        self.bot = bot
+        self.interval = interval
+        self._bucket = TokenBucket(self.ALERTS_PER_SECOND, self.ALERTS_BURST)
+
+    async def run(self) -> None:
+        while True:
+            started = perf_counter()
+            try:
+                if await claim("watches", self.interval):
+                    with WATCH_CYCLE_DURATION.time():
+                        await self.run_cycle()
+            except Exception:
+                LOGGER.exception("Couldn't evaluate the watches")
+            await sleep(max(0.0, self.interval - (perf_counter() - started)))
+
+    async def run_cycle(self) -> None:
+        watches = [
+            Watch.from_mongo(doc) for doc in await backends.store.get_all_watches()
+        ]
+        index = index_watches(watches)
+
+        results = await gather(
+            *(
+                WatchEvaluator(
+                    AlbionOnline(AlbionOnlineServers.from_str(server))
+                ).evaluate(items)
+                for server, items in index.items()
+            )
+        )
+        for server, items in index.items():
+            WATCHED_ITEMS.set(len(items), server=server)
+        hits = [hit for server_hits, _ in results for hit in server_hits]
+        evaluated = {
+            watch.id
+            for (server, items), (_, item_ids) in zip(index.items(), results)
+            for item_id in item_ids
+            for watch in items[item_id]
+        }
+
+        fresh = await self._get_new_hits(hits, watches, evaluated)
+        await self._notify(fresh)
+        LOGGER.info(
+            f"Evaluated {len(watches)} watches on "
+            f"{sum(len(items) for items in index.values())} items, "
+            f"{len(hits)} hold and {len(fresh)} are new"
+        )
+
+    # Only the watches that weren't triggered in the previous cycle are
+    # announced, the ones that stopped holding or were removed are re-armed.
+    # A watch whose prices couldn't be fetched this cycle keeps its state,
+    # otherwise every upstream hiccup would announce it once again
+    async def _get_new_hits(
+        self, hits: list[WatchHit], watches: list[Watch], evaluated: set[str]
+    ) -> list[WatchHit]:
+        triggered = {id.decode("utf-8") for id in await backends.redis.smembers(TRIGGERED_KEY)}  # type: ignore
+        holding = {hit.watch.id for hit in hits}
+        removed = triggered - {watch.id for watch in watches}
+        rearmed = (triggered - holding) & (evaluated | removed)
+        fresh = [hit for hit in hits if hit.watch.id not in triggered]
+
+        async with backends.redis.pipeline(transaction=False) as pipeline:
+            if rearmed:
+                pipeline.srem(TRIGGERED_KEY, *rearmed)
+            if holding - triggered:
+                pipeline.sadd(TRIGGERED_KEY, *(holding - triggered))
+            await pipeline.execute()
+        return fresh
+
+    async def _get_item_names(self, hits: list[WatchHit]) -> dict[str, str]:
+        names = {}
+        for item_id in {hit.watch.item_id for hit in hits}:
+            try:
+                names[item_id] = (await get_item_name_by_id(item_id)).name
+            except NoItemFoundError:
+                names[item_id] = item_id
+        return names
+
+    def _make_messages(
+        self, hits: list[WatchHit], names: dict[str, str]
+    ) -> list[tuple[str | None, list[Embed]]]:
+        lines = [describe_hit(hit, names[hit.watch.item_id]) for hit in hits]
+        embeds = [
+            Embed(
+                title="🔔 Your watches went off",
+                color=Color.gold(),
+                description="\n".join(chunk),
+            )
+            for chunk in batched(lines, self.LINES_PER_EMBED)
+        ]
+        users = dict.fromkeys(
+            hit.watch.user_id for hit in hits if hit.watch.user_id is not None
+        )
+        content = " ".join(f"<@{user}>" for user in users) or None
+        return [
+            (content, list(chunk))
+            for chunk in batched(embeds, self.MAX_EMBEDS_PER_MESSAGE)
+        ]
+
+    async def _send(
+        self, channel_id: int, content: str | None, embeds: list[Embed]
+    ) -> None:
+        while (delay := self._bucket.take()) > 0:
+            await sleep(delay)
+
+        channel = self.bot.get_partial_messageable(channel_id)
+        try:
+            await channel.send(
+                content,
+                embeds=embeds,
+                allowed_mentions=AllowedMentions(
+                    users=True, roles=False, everyone=False
+                ),
+            )
+            WATCH_ALERTS.inc(result="sent")
+        except HTTPException as e:
+            # the channel is gone or the bot can't write there anymore
+            WATCH_ALERTS.inc(result="failed")
+            LOGGER.warning(f"Couldn't send alerts to channel {channel_id}: {e}")
+
+    # Every channel gets one message for all of its alerts in a cycle, sent
+    # no faster than the bucket allows
+    async def _notify(self, hits: list[WatchHit]) -> None:
+        if not hits:
+            return
+
+        names = await self._get_item_names(hits)
+        channels: dict[int, list[WatchHit]] = defaultdict(list)
+        for hit in hits:
+            channels[hit.watch.channel_id].append(hit)
+
+        for channel_id, channel_hits in channels.items():
+            for content, embeds in self._make_messages(channel_hits, names):
+                await self._send(channel_id, content, embeds)
@@ -4,7 +4,9 @@ from logging.config import dictConfig
 from pathlib import Path
 
 
-def load_logging_config() -> None:
+# Processes running side by side log to files of their own, rotating a file
+# somebody else still writes to loses lines
+def load_logging_config(name: str | None = None) -> None:
     conf_path = Path(__file__).parent.parent.parent / "logging.conf.json"
     with conf_path.open("r") as f:
         content = f.read()
@@ -12,6 +14,9 @@ def load_logging_config() -> None:
     conf = loads(content)
     if "file" in conf.get("handlers", {}):
         filename = conf["handlers"]["file"].get("filename")
+        if filename and name:
+            filename = str(Path(filename).with_suffix(f".{name}.log"))
+            conf["handlers"]["file"]["filename"] = filename
         if filename:
             log_dir = conf_path.parent / Path(filename).parent
             log_dir.mkdir(parents=True, exist_ok=True)
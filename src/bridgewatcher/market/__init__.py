@@ -1,5 +1,18 @@
 from .market_helper import MarketHelper, MarketQuery
 from .market_flipper import MarketFlipper
 from .crafter import Crafter
+from .transport import TransportPlanner
+from .digest import DigestBuilder
+from .inventory import InventoryPlanner
+from .sweep import CraftSweeper
 
-__all__ = ("MarketHelper", "MarketQuery", "MarketFlipper", "Crafter")
+__all__ = (
+    "MarketHelper",
+    "MarketQuery",
+    "MarketFlipper",
+    "Crafter",
+    "TransportPlanner",
+    "DigestBuilder",
+    "InventoryPlanner",
+    "CraftSweeper",
+)
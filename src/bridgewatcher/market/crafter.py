@@ -1,13 +1,17 @@
+from asyncio import gather
 from math import ceil
 
-from bridgewatcher.api.model import Cities, Qualities
-from bridgewatcher.db import db
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.db import backends
 from bridgewatcher.db.schema import Item
-from bridgewatcher.market import MarketHelper, MarketQuery
+from bridgewatcher.market import MarketHelper
 from bridgewatcher.market.consts import ORDER_FEE, ORDINARY_TAX, PREMIUM_TAX
+from bridgewatcher.market.derived import DerivedResults, dump_craft, load_craft
+from bridgewatcher.market.liquidity import LiquidityIndex
 from bridgewatcher.market.model import (
     Craft,
     CraftingIncome,
+    Liquidity,
     MaterialLeftover,
     MaterialPurchase,
 )
@@ -38,66 +42,123 @@ class Crafter(MarketHelper):
         if isinstance(item_or_id, Item):
             return item_or_id
 
-        items_collection = db.get_collection("items")
-        mongo_item = await items_collection.find_one({"name": item_or_id})
+        mongo_item = await backends.store.find_item(item_or_id)
 
         if mongo_item is None:
             raise NoItemFoundError(f"No such item with id {item_or_id}", item_or_id)
 
         return Item.from_mongo(mongo_item)
 
-    async def _get_income(
-        self, item: Item, count: int, has_premium: bool
+    # Works the income out of prices and liquidity fetched beforehand, the
+    # sweep prices a whole family at once and shares this with single crafts
+    def _price_income(
+        self,
+        item: Item,
+        count: int,
+        has_premium: bool,
+        prices: list[CityPrice],
+        liquidity: dict[Cities, Liquidity],
+        min_volume: int = 0,
+        rank_by_fill: bool = False,
     ) -> CraftingIncome:
-        query = MarketQuery.with_black_market_included(item, Qualities.NORMAL)
-        sell_price = await self.get_expensive_item_sell_price(query)
+        sell_price = self._find_liquid_sell_price(
+            prices,
+            Qualities.NORMAL,
+            liquidity,
+            count,
+            min_volume,
+            rank_by_fill=rank_by_fill,
+        )
+        if sell_price is None:
+            raise InsufficientDataError(
+                f"No city trades {min_volume} of {item.name} a day"
+            )
         if sell_price.sell_price_min == 0:
             raise InsufficientDataError(f"No fresh data on {item.name}")
 
         income = sell_price.sell_price_min * count
         applied_tax = PREMIUM_TAX if has_premium else ORDINARY_TAX
         taxes = ceil(income * applied_tax)
+        sell_city = Cities.from_str(sell_price.city)
         return CraftingIncome(
-            Cities.from_str(sell_price.city),
+            sell_city,
             income,
             taxes,
+            liquidity.get(sell_city),
         )
 
-    async def _get_purchases(self, item: Item, count: int) -> list[MaterialPurchase]:
+    async def _get_income(
+        self,
+        item: Item,
+        count: int,
+        has_premium: bool,
+        min_volume: int = 0,
+        rank_by_fill: bool = False,
+    ) -> CraftingIncome:
+        prices, liquidity = await gather(
+            self.albion.get_item_prices(item),
+            LiquidityIndex(self.albion.server).get(item.name, Qualities.NORMAL),
+        )
+        return self._price_income(
+            item, count, has_premium, prices, liquidity, min_volume, rank_by_fill
+        )
+
+    def _price_purchases(
+        self,
+        item: Item,
+        count: int,
+        materials: dict[str, Item],
+        prices: dict[str, list[CityPrice]],
+    ) -> list[MaterialPurchase]:
         purchases = []
-        for requirement in item.crafting_requirements:  # type: ignore
-            query = MarketQuery.with_black_market_excluded(
-                requirement.name, Qualities.NORMAL
+        for requirement in item.crafting_requirements or []:
+            if not prices.get(requirement.name):
+                raise InsufficientDataError(f"No fresh data on {requirement.name}")
+            price = self._find_cheapest_buy_price(
+                prices[requirement.name], Qualities.NORMAL, include_black_market=False
             )
-            price = await self.get_cheapest_item_buy_price(query)
             if price.sell_price_min == 0:
                 raise InsufficientDataError(f"No fresh data on {requirement.name}")
 
-            requirement_item = await self._get_item_from_item_or_id(requirement.name)
-            requirement_count = requirement.amount * count
             purchases.append(
                 MaterialPurchase(
-                    requirement_item,
+                    materials[requirement.name],
                     Cities.from_str(price.city),
-                    requirement_count,
+                    requirement.amount * count,
                     price.sell_price_min,
                 )
             )
         return purchases
 
+    async def _get_purchases(self, item: Item, count: int) -> list[MaterialPurchase]:
+        ids = [requirement.name for requirement in item.crafting_requirements or []]
+        # one round trip for all the materials instead of one per material
+        prices, materials = await gather(
+            self.albion.get_items_prices(ids),
+            gather(*(self._get_item_from_item_or_id(id) for id in ids)),
+        )
+        return self._price_purchases(item, count, dict(zip(ids, materials)), prices)
+
+    # Crafting in the city with the bonus is taken for granted
+    def _get_return_rate(self, item: Item, using_focus: bool) -> float:
+        is_refining = item.shop_subcategory == "refinedresources"
+        base_rate, bonus_rate = self.RETURN_RATES[is_refining][using_focus]
+        return bonus_rate if item.city_with_bonus is not None else base_rate
+
+    def _is_returnable(self, material: Item) -> bool:
+        return (
+            material.shop_category not in self.NON_RETURNABLES
+            and material.shop_subcategory not in self.NON_RETURNABLES
+        )
+
     async def _get_leftovers(
         self, item: Item, purchases: list[MaterialPurchase], using_focus: bool
     ) -> tuple[list[MaterialLeftover], float]:
-        is_refining = item.shop_subcategory == "refinedresources"
-        base_rate, bonus_rate = self.RETURN_RATES[is_refining][using_focus]
-        return_rate = bonus_rate if item.city_with_bonus is not None else base_rate
+        return_rate = self._get_return_rate(item, using_focus)
 
         leftovers = []
         for purchase in purchases:
-            if (
-                purchase.item.shop_category in self.NON_RETURNABLES
-                or purchase.item.shop_subcategory in self.NON_RETURNABLES
-            ):
+            if not self._is_returnable(purchase.item):
                 continue
 
             returned = ceil(purchase.count * return_rate)
@@ -114,15 +175,44 @@ class Crafter(MarketHelper):
         count: int = 1,
         has_premium: bool = True,
         using_focus: bool = False,
+        min_volume: int = 0,
+        rank_by_fill: bool = False,
     ) -> Craft:
         if count <= 0:
             raise ValueError("Count cannot be negative")
 
+        item_id = item_or_id if isinstance(item_or_id, str) else item_or_id.name
+        results = DerivedResults(self.albion)
+        key = results.get_key(
+            "craft", item_id, count, has_premium, using_focus, min_volume, rank_by_fill
+        )
+        cached = await results.get(key)
+        if cached is not None:
+            return load_craft(cached)
+
+        with self.albion.record_versions() as versions:
+            craft = await self._craft(
+                item_or_id, count, has_premium, using_focus, min_volume, rank_by_fill
+            )
+        await results.set(key, dump_craft(craft), versions)
+        return craft
+
+    async def _craft(
+        self,
+        item_or_id: Item | str,
+        count: int,
+        has_premium: bool,
+        using_focus: bool,
+        min_volume: int,
+        rank_by_fill: bool,
+    ) -> Craft:
         item = await self._get_item_from_item_or_id(item_or_id)
         if item.crafting_requirements is None:
             raise UncraftableItemCraftedError(f"{item.name} is uncraftable")
 
-        income = await self._get_income(item, count, has_premium)
+        income = await self._get_income(
+            item, count, has_premium, min_volume, rank_by_fill
+        )
         purchases = await self._get_purchases(item, count)
         leftovers, return_rate = await self._get_leftovers(item, purchases, using_focus)
 
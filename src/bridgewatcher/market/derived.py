@@ -0,0 +1,202 @@
+from json import dumps, loads
+from math import inf
+from time import time
+from typing import Any
+
+from bridgewatcher.api import AlbionOnline
+from bridgewatcher.api.freshness import Freshness
+from bridgewatcher.api.model import Cities, Qualities
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import get_catalog_key
+from bridgewatcher.db.dependents import invalidate_dependents, set_dependent
+from bridgewatcher.db.schema import Item
+from bridgewatcher.db.seed.diff import CatalogChangeSet
+from bridgewatcher.market.liquidity import LiquidityIndex
+from bridgewatcher.market.model import (
+    Craft,
+    CraftingIncome,
+    Liquidity,
+    MarketFlip,
+    MaterialLeftover,
+    MaterialPurchase,
+)
+from bridgewatcher.metrics import CACHE_REQUESTS
+
+
+def dump_liquidity(liquidity: Liquidity | None) -> list[Any] | None:
+    if liquidity is None:
+        return None
+    return [liquidity.volume, liquidity.turnover, liquidity.day]
+
+
+def load_liquidity(raw: list[Any] | None) -> Liquidity | None:
+    return Liquidity(*raw) if raw is not None else None
+
+
+def dump_flip(flip: MarketFlip) -> dict[str, Any]:
+    return {
+        "quality": flip.quality.value,
+        "buy_price": flip.buy_price,
+        "buy_city": flip.buy_city.value,
+        "sell_price": flip.sell_price,
+        "sell_city": flip.sell_city.value,
+        "taxes": flip.taxes,
+        "fees": flip.fees,
+        "sell_liquidity": dump_liquidity(flip.sell_liquidity),
+    }
+
+
+def load_flip(raw: dict[str, Any]) -> MarketFlip:
+    return MarketFlip(
+        Qualities(raw["quality"]),
+        raw["buy_price"],
+        Cities(raw["buy_city"]),
+        raw["sell_price"],
+        Cities(raw["sell_city"]),
+        raw["taxes"],
+        raw["fees"],
+        load_liquidity(raw["sell_liquidity"]),
+    )
+
+
+def dump_craft(craft: Craft) -> dict[str, Any]:
+    return {
+        "item": craft.item.to_mongo(),
+        "count": craft.count,
+        "has_premium": craft.has_premium,
+        "crafting_city": (
+            craft._crafting_city.value if craft._crafting_city is not None else None
+        ),
+        "return_rate": craft.return_rate,
+        "income": {
+            "sell_city": craft.income.sell_city.value,
+            "income": craft.income.income,
+            "taxes": craft.income.taxes,
+            "liquidity": dump_liquidity(craft.income.liquidity),
+        },
+        "purchases": [
+            {
+                "item": purchase.item.to_mongo(),
+                "buy_city": purchase.buy_city.value,
+                "count": purchase.count,
+                "unit_price": purchase.unit_price,
+            }
+            for purchase in craft.purchases
+        ],
+        "leftovers": [
+            {
+                "item": leftover.item.to_mongo(),
+                "count": leftover.count,
+                "unit_price": leftover.unit_price,
+                "value": leftover.value,
+            }
+            for leftover in craft.leftovers
+        ],
+    }
+
+
+def load_craft(raw: dict[str, Any]) -> Craft:
+    income = raw["income"]
+    return Craft(
+        item=Item.from_mongo(raw["item"]),
+        count=raw["count"],
+        has_premium=raw["has_premium"],
+        _crafting_city=(
+            Cities(raw["crafting_city"]) if raw["crafting_city"] is not None else None
+        ),
+        return_rate=raw["return_rate"],
+        income=CraftingIncome(
+            Cities(income["sell_city"]),
+            income["income"],
+            income["taxes"],
+            load_liquidity(income["liquidity"]),
+        ),
+        purchases=[
+            MaterialPurchase(
+                Item.from_mongo(purchase["item"]),
+                Cities(purchase["buy_city"]),
+                purchase["count"],
+                purchase["unit_price"],
+            )
+            for purchase in raw["purchases"]
+        ],
+        leftovers=[
+            MaterialLeftover(
+                Item.from_mongo(leftover["item"]),
+                leftover["count"],
+                leftover["unit_price"],
+                leftover["value"],
+            )
+            for leftover in raw["leftovers"]
+        ],
+    )
+
+
+# Results computed from cached prices, kept for as long as every price list
+# they were computed from. Refreshing any of those, the liquidity of their
+# items or the items themselves in the catalog deletes them right away
+# through the dependents of its key, so a hit never needs more than the GET
+class DerivedResults:
+    def __init__(self, albion: AlbionOnline) -> None:
+        self.albion = albion
+
+    def get_key(self, kind: str, *args: Any) -> str:
+        return f"derived:{self.albion.server.value}:{kind}:{":".join(map(str, args))}"
+
+    async def get(self, key: str) -> dict[str, Any] | None:
+        raw = await backends.redis.get(key)
+        CACHE_REQUESTS.inc(family="derived", result="miss" if raw is None else "hit")
+        return loads(raw)["result"] if raw is not None else None
+
+    # versions are the ones of the price lists the result was computed from.
+    # A price list refreshed in the meantime already tried to delete the
+    # result before it was stored, so nothing gets stored then
+    async def set(
+        self, key: str, result: dict[str, Any], versions: dict[str, int]
+    ) -> None:
+        ids = list(versions)
+        if not ids:
+            return
+
+        raws = await backends.redis.hmget(self.albion.expiration.key, ids)
+        expires_at = inf
+        for id, raw in zip(ids, raws):
+            if raw is None:
+                return
+            freshness = Freshness.unpack(raw)
+            if freshness.version != versions[id]:
+                return
+            expires_at = min(expires_at, freshness.fetched_at + freshness.ttl)
+
+        ttl = int(expires_at - time())
+        if ttl <= 0:
+            return
+
+        liquidity = LiquidityIndex(self.albion.server)
+        await set_dependent(
+            key,
+            dumps({"versions": versions, "result": result}),
+            ttl,
+            [
+                input
+                for id in ids
+                for input in (
+                    self.albion.get_item_key(id),
+                    liquidity.get_item_key(id),
+                    get_catalog_key(id),
+                )
+            ],
+            self.albion.expiration.ceiling,
+        )
+
+
+# Registered as a catalog listener, a reseed goes over every item
+async def invalidate_derived_results(changes: CatalogChangeSet) -> None:
+    if changes.collection != "items":
+        return
+    ids = [
+        *(doc[changes.key] for doc in changes.inserted),
+        *(doc[changes.key] for doc in changes.updated),
+        *changes.deleted,
+    ]
+    await invalidate_dependents([get_catalog_key(id) for id in ids])
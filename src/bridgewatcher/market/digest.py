@@ -0,0 +1,137 @@
+from asyncio import gather
+from datetime import datetime, timedelta, timezone
+
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.compute import COMPUTE
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import wait_for_catalog
+from bridgewatcher.db.schema import Item
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market import Crafter, MarketHelper
+from bridgewatcher.market.matrix import SharedPriceMatrix, scan_flips
+from bridgewatcher.market.model import Craft, MarketDigest, MarketFlip
+from bridgewatcher.util.exc import BridgewatcherError
+
+
+# The best flips and crafts of a category and where gold is heading, built
+# from a single batched fetch of every price involved. A digest is the same
+# for every channel subscribed to it, so it's built once per albion server
+# and category however many guilds get it
+class DigestBuilder(MarketHelper):
+    FLIPS = 5
+    CRAFTS = 5
+    # crafts are ranked by a rough estimate from the fetched prices first,
+    # only these many get worked out in full by the crafter
+    CRAFT_CANDIDATES = 15
+    MAX_PRICE_AGE = timedelta(hours=2)
+
+    # The dates are all in the same format, so comparing them as strings
+    # spares parsing the date of every single price
+    def _get_fresh_prices(
+        self, prices: list[CityPrice], cutoff: str
+    ) -> list[CityPrice]:
+        return [
+            price
+            for price in prices
+            if price.quality == Qualities.NORMAL.value
+            and price.sell_price_min > 0
+            and price.sell_price_min_date >= cutoff
+        ]
+
+    async def _get_top_flips(
+        self, fresh: dict[str, list[CityPrice]]
+    ) -> list[tuple[str, MarketFlip]]:
+        with SharedPriceMatrix.create(fresh) as matrix:
+            flips = await COMPUTE.run_cancellable(
+                scan_flips, matrix.handle, Qualities.NORMAL, True, self.FLIPS
+            )
+        return [(id, flip) for id, flip in flips if flip.profit > 0]
+
+    def _estimate_craft(
+        self, item: Item, fresh: dict[str, list[CityPrice]]
+    ) -> int | None:
+        product = fresh.get(item.name)
+        if not product:
+            return None
+
+        cost = 0
+        for requirement in item.crafting_requirements or []:
+            material = [
+                price
+                for price in fresh.get(requirement.name, [])
+                if price.city.lower() != Cities.BLACK_MARKET
+            ]
+            if not material:
+                return None
+            cost += requirement.amount * min(price.sell_price_min for price in material)
+        return max(price.sell_price_min for price in product) - cost
+
+    async def _get_top_crafts(
+        self, items: list[Item], fresh: dict[str, list[CityPrice]]
+    ) -> list[Craft]:
+        estimates = [
+            (estimate, item)
+            for item in items
+            if item.crafting_requirements is not None
+            and (estimate := self._estimate_craft(item, fresh)) is not None
+        ]
+        estimates.sort(key=lambda estimate: estimate[0], reverse=True)
+
+        # the prices are all cached by now, working a craft out costs no
+        # upstream requests
+        crafter = Crafter(self.albion)
+        results = await gather(
+            *(crafter.craft(item) for _, item in estimates[: self.CRAFT_CANDIDATES]),
+            return_exceptions=True,
+        )
+
+        crafts = []
+        for result in results:
+            if isinstance(result, BridgewatcherError):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            if result.profit > 0:
+                crafts.append(result)
+        crafts.sort(key=lambda craft: craft.profit, reverse=True)
+        return crafts[: self.CRAFTS]
+
+    async def build(self, category: str | None = None) -> MarketDigest:
+        await wait_for_catalog()
+        items = [
+            Item.from_mongo(doc) for doc in await backends.store.find_items(category)
+        ]
+        # materials of a category are usually in another one
+        ids = dict.fromkeys(item.name for item in items)
+        for item in items:
+            for requirement in item.crafting_requirements or []:
+                ids[requirement.name] = None
+
+        prices, gold = await gather(
+            self.get_available_prices(list(ids)), self.albion.get_gold_prices()
+        )
+        cutoff = (datetime.now(timezone.utc) - self.MAX_PRICE_AGE).strftime(
+            "%Y-%m-%dT%H:%M:%S"
+        )
+        fresh = {
+            id: fresh_prices
+            for id, item_prices in prices.items()
+            if (fresh_prices := self._get_fresh_prices(item_prices, cutoff))
+        }
+
+        products = {item.name for item in items}
+        flips = await self._get_top_flips(
+            {id: fresh_prices for id, fresh_prices in fresh.items() if id in products}
+        )
+        crafts = await self._get_top_crafts(items, fresh)
+        LOGGER.info(
+            f"Built the digest of {category or "every category"} on "
+            f"{self.albion.server.value} from {len(fresh)} of {len(ids)} items"
+        )
+        return MarketDigest(
+            self.albion.server.value,
+            category,
+            flips,
+            crafts,
+            sorted(gold, key=lambda price: price.timestamp),
+        )
@@ -0,0 +1,142 @@
+from asyncio import gather
+from math import floor
+
+from bridgewatcher.api.model import CityPrice
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import wait_for_catalog
+from bridgewatcher.db.schema import Item
+from bridgewatcher.market.crafter import Crafter
+from bridgewatcher.market.model import Craft
+from bridgewatcher.util.exc import InsufficientDataError
+
+
+# The catalog names enchanted materials T4_METALBAR_LEVEL1 while the game and
+# the api add @1 to it, both are taken
+def get_material_id(id: str) -> str:
+    name, _, level = id.strip().upper().partition("@")
+    if level not in ("", "0") and not name.endswith(f"_LEVEL{level}"):
+        name = f"{name}_LEVEL{level}"
+    return name
+
+
+# Works out what's most profitable to craft out of the materials somebody
+# already has. The recipes come from the reverse index of the crafting
+# requirements instead of the whole catalog, and the prices of every product
+# and material are fetched at once
+class InventoryPlanner(Crafter):
+    DEFAULT_LIMIT = 10
+
+    # The returned materials go right back into crafting, so a stack stretches
+    # further than its count over the amount. Materials that aren't returned,
+    # like artefacts, don't
+    def _get_count(
+        self,
+        item: Item,
+        inventory: dict[str, int],
+        materials: dict[str, Item],
+        return_rate: float,
+    ) -> int:
+        counts = []
+        for requirement in item.crafting_requirements or []:
+            kept = (
+                1 - return_rate
+                if self._is_returnable(materials[requirement.name])
+                else 1
+            )
+            counts.append(
+                floor(inventory[requirement.name] / (requirement.amount * kept))
+            )
+        return min(counts, default=0)
+
+    async def _plan_craft(
+        self,
+        item: Item,
+        inventory: dict[str, int],
+        materials: dict[str, Item],
+        prices: dict[str, list[CityPrice]],
+        has_premium: bool,
+        using_focus: bool,
+    ) -> Craft | None:
+        return_rate = self._get_return_rate(item, using_focus)
+        count = self._get_count(item, inventory, materials, return_rate)
+        if count <= 0 or not prices.get(item.name):
+            return None
+
+        # the materials are priced at what buying them would cost, that's what
+        # using them up instead of selling them is worth
+        try:
+            income = self._price_income(item, count, has_premium, prices[item.name], {})
+            purchases = self._price_purchases(item, count, materials, prices)
+        except InsufficientDataError:
+            return None
+
+        leftovers, _ = await self._get_leftovers(item, purchases, using_focus)
+        return Craft(
+            item=item,
+            count=count,
+            has_premium=has_premium,
+            _crafting_city=item.city_with_bonus,
+            return_rate=return_rate,
+            income=income,
+            purchases=purchases,
+            leftovers=leftovers,
+        )
+
+    # Returns the crafts the inventory is enough for, the most profitable
+    # first. Every craft uses as much of the inventory as it can on its own,
+    # they are alternatives and not meant to be done all together
+    async def plan(
+        self,
+        inventory: dict[str, int],
+        has_premium: bool = True,
+        using_focus: bool = False,
+        limit: int = DEFAULT_LIMIT,
+    ) -> list[Craft]:
+        materials_held: dict[str, int] = {}
+        for id, count in inventory.items():
+            if count > 0:
+                id = get_material_id(id)
+                materials_held[id] = materials_held.get(id, 0) + count
+        inventory = materials_held
+        if not inventory:
+            return []
+
+        await wait_for_catalog()
+        recipes = [
+            item
+            for item in map(
+                Item.from_mongo, await backends.store.find_items_using(list(inventory))
+            )
+            if all(
+                requirement.name in inventory
+                for requirement in item.crafting_requirements or []
+            )
+        ]
+        if not recipes:
+            return []
+
+        used = list(
+            dict.fromkeys(
+                requirement.name
+                for item in recipes
+                for requirement in item.crafting_requirements or []
+            )
+        )
+        found, prices = await gather(
+            gather(*(self._get_item_from_item_or_id(id) for id in used)),
+            self.get_available_prices([*(item.name for item in recipes), *used]),
+        )
+        materials = dict(zip(used, found))
+
+        crafts = [
+            craft
+            for item in recipes
+            if (
+                craft := await self._plan_craft(
+                    item, inventory, materials, prices, has_premium, using_focus
+                )
+            )
+            is not None
+        ]
+        crafts.sort(key=lambda craft: craft.profit, reverse=True)
+        return crafts[:limit]
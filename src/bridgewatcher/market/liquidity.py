@@ -0,0 +1,206 @@
+from asyncio import sleep
+from datetime import datetime, timezone
+from struct import Struct
+from time import perf_counter, time
+
+from bridgewatcher.api import AlbionOnline, AlbionOnlineServers
+from bridgewatcher.api.model import Cities, HistoryPoint, Qualities
+from bridgewatcher.db import backends
+from bridgewatcher.db.dependents import invalidate_dependents
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market.model import Liquidity
+from bridgewatcher.metrics import CACHE_REQUESTS, LIQUIDITY_REFRESHED
+
+DAY = 24 * 60 * 60
+DEFAULT_LIQUIDITY_INTERVAL = 60
+# the weight of a day halves after this many days
+HALF_LIFE_DAYS = 7
+DECAY = 0.5 ** (1 / HALF_LIFE_DAYS)
+
+# volume, turnover and the last day folded in, 12 bytes per item, quality and
+# city instead of the whole history
+_ENTRY = Struct("<ffI")
+# the day an item was last refreshed on
+_CHECKED = Struct("<I")
+
+
+def get_day(timestamp: float | None = None) -> int:
+    return int((time() if timestamp is None else timestamp) // DAY)
+
+
+def parse_day(timestamp: str) -> int:
+    parsed = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S")
+    return get_day(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+
+# The history has locations other than the markets, e.g. the portal towns
+def parse_city(location: str) -> Cities | None:
+    try:
+        return Cities(location.lower())
+    except ValueError:
+        return None
+
+
+def pack_liquidity(liquidity: Liquidity) -> bytes:
+    return _ENTRY.pack(liquidity.volume, liquidity.turnover, liquidity.day)
+
+
+def unpack_liquidity(raw: bytes) -> Liquidity:
+    return Liquidity(*_ENTRY.unpack(raw))
+
+
+# Days without a single trade never show up in the history, every one of them
+# counts as a day with nothing traded
+def decay_liquidity(liquidity: Liquidity, day: int) -> Liquidity:
+    days = day - liquidity.day
+    if days <= 0:
+        return liquidity
+    weight = DECAY**days
+    return Liquidity(liquidity.volume * weight, liquidity.turnover * weight, day)
+
+
+# Folds the days after the last one in the entry into it, so refreshing only
+# ever costs the new points. The current day is still being traded on and is
+# left for the next refresh
+def fold_history(
+    liquidity: Liquidity | None, points: list[HistoryPoint], today: int
+) -> Liquidity | None:
+    days = sorted(
+        (parse_day(point.timestamp), point.item_count, point.avg_price)
+        for point in points
+    )
+    for day, count, price in days:
+        if day >= today or (liquidity is not None and day <= liquidity.day):
+            continue
+        if liquidity is None:
+            liquidity = Liquidity(float(count), float(count * price), day)
+            continue
+
+        liquidity = decay_liquidity(liquidity, day - 1)
+        liquidity = Liquidity(
+            liquidity.volume * DECAY + count * (1 - DECAY),
+            liquidity.turnover * DECAY + count * price * (1 - DECAY),
+            day,
+        )
+    return liquidity
+
+
+# Daily traded volume and the volume weighted price of every item, quality and
+# city in a single hash per server. Commands only ever read a handful of
+# fields from it, items missing or refreshed before today are queued for the
+# refresher instead of being fetched on the spot
+class LiquidityIndex:
+    def __init__(self, server: AlbionOnlineServers) -> None:
+        self.server = server
+        self.key = f"liquidity:{server.value}"
+        self.pending_key = f"liquidity:pending:{server.value}"
+
+    # Results ranked by the liquidity of an item depend on this key, every
+    # refresh of the item invalidates its dependents
+    def get_item_key(self, item_id: str) -> str:
+        return f"{self.key}:{item_id}"
+
+    def _get_field(self, item_id: str, quality: int, city: Cities) -> str:
+        return f"{item_id}|{quality}|{city.value}"
+
+    async def get(self, item_id: str, quality: Qualities) -> dict[Cities, Liquidity]:
+        cities = list(Cities)
+        # the item id alone holds the day it was last refreshed on
+        fields = [
+            item_id,
+            *(self._get_field(item_id, quality.value, city) for city in cities),
+        ]
+        checked, *entries = await backends.redis.hmget(self.key, fields)
+        CACHE_REQUESTS.inc(
+            family="liquidity", result="miss" if checked is None else "hit"
+        )
+
+        today = get_day()
+        if checked is None or _CHECKED.unpack(checked)[0] < today:
+            await backends.redis.sadd(self.pending_key, item_id)
+
+        return {
+            city: decay_liquidity(unpack_liquidity(raw), today - 1)
+            for city, raw in zip(cities, entries)
+            if raw is not None
+        }
+
+    # The volume traded in a city of every item at once in a single HMGET, for
+    # ranking many items. Items nobody refreshed yet aren't queued, a whole
+    # category would flood the refresher
+    async def get_volumes(
+        self, item_ids: list[str], quality: Qualities, city: Cities
+    ) -> dict[str, float]:
+        if not item_ids:
+            return {}
+        fields = [self._get_field(id, quality.value, city) for id in item_ids]
+        entries = await backends.redis.hmget(self.key, fields)
+
+        today = get_day()
+        return {
+            id: decay_liquidity(unpack_liquidity(raw), today - 1).volume
+            for id, raw in zip(item_ids, entries)
+            if raw is not None
+        }
+
+    # Returns how many items were refreshed. SPOP hands every queued item to
+    # a single process, however many of them refresh at once
+    async def refresh(self, albion: AlbionOnline, limit: int) -> int:
+        popped = await backends.redis.spop(self.pending_key, limit)
+        ids = [id.decode("utf-8") for id in popped or []]
+        if not ids:
+            return 0
+
+        try:
+            histories = await albion.get_items_history(ids)
+        except Exception:
+            await backends.redis.sadd(self.pending_key, *ids)
+            raise
+
+        points: dict[str, list[HistoryPoint]] = {}
+        for history in histories:
+            city = parse_city(history.location)
+            if city is not None:
+                field = self._get_field(history.item_id, history.quality, city)
+                points.setdefault(field, []).extend(history.data)
+
+        today = get_day()
+        fields = list(points)
+        existing = await backends.redis.hmget(self.key, fields) if fields else []
+        mapping = {id: _CHECKED.pack(today) for id in ids}
+        for field, raw in zip(fields, existing):
+            liquidity = fold_history(
+                unpack_liquidity(raw) if raw is not None else None,
+                points[field],
+                today,
+            )
+            if liquidity is not None:
+                mapping[field] = pack_liquidity(liquidity)
+
+        await backends.redis.hset(self.key, mapping=mapping)  # type: ignore
+        await invalidate_dependents([self.get_item_key(id) for id in ids])
+        return len(ids)
+
+
+class LiquidityRefresher:
+    # items refreshed per server and cycle, two weeks of the history of a
+    # hundred items is already a sizable response
+    BATCH_SIZE = AlbionOnline.MAX_ITEMS_PER_REQUEST
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+
+    async def run(self) -> None:
+        while True:
+            started = perf_counter()
+            for server in AlbionOnlineServers:
+                try:
+                    refreshed = await LiquidityIndex(server).refresh(
+                        AlbionOnline(server, paced=True), self.BATCH_SIZE
+                    )
+                    LIQUIDITY_REFRESHED.inc(refreshed, server=server.value)
+                except Exception:
+                    LOGGER.exception(
+                        f"Couldn't refresh the liquidity index on {server.value}"
+                    )
+            await sleep(max(0.0, self.interval - (perf_counter() - started)))
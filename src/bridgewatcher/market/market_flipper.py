@@ -1,41 +1,104 @@
+from asyncio import gather
 from math import ceil
 
-from bridgewatcher.api.model import Cities
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
 from bridgewatcher.market import MarketHelper, MarketQuery
 from bridgewatcher.market.consts import ORDER_FEE, ORDINARY_TAX, PREMIUM_TAX
+from bridgewatcher.market.derived import DerivedResults, dump_flip, load_flip
+from bridgewatcher.market.liquidity import LiquidityIndex
 from bridgewatcher.market.model import MarketFlip
 from bridgewatcher.util.exc import InsufficientDataError
 
 
+def make_flip(
+    buy_price: CityPrice, sell_price: CityPrice, quality: Qualities, has_premium: bool
+) -> MarketFlip:
+    applied_tax = PREMIUM_TAX if has_premium else ORDINARY_TAX
+    taxes = ceil(sell_price.sell_price_min * applied_tax)
+
+    buy_fee = ceil(buy_price.sell_price_min * ORDER_FEE)
+    sell_fee = ceil(sell_price.sell_price_min * ORDER_FEE)
+    fees = buy_fee + sell_fee
+
+    return MarketFlip(
+        buy_price=buy_price.sell_price_min,
+        buy_city=Cities.from_str(buy_price.city),
+        sell_price=sell_price.sell_price_min,
+        sell_city=Cities.from_str(sell_price.city),
+        quality=quality,
+        taxes=taxes,
+        fees=fees,
+    )
+
+
 class MarketFlipper(MarketHelper):
-    async def flip(self, query: MarketQuery, has_premium: bool = True) -> MarketFlip:
-        buy_query = (
-            query
-            if not query.include_black_market
-            else MarketQuery.with_black_market_excluded(query.item_or_id, query.quality)
+    async def flip(
+        self,
+        query: MarketQuery,
+        has_premium: bool = True,
+        min_volume: int = 0,
+        rank_by_fill: bool = False,
+    ) -> MarketFlip:
+        item_id = (
+            query.item_or_id
+            if isinstance(query.item_or_id, str)
+            else query.item_or_id.name
+        )
+        results = DerivedResults(self.albion)
+        key = results.get_key(
+            "flip",
+            item_id,
+            query.quality.value,
+            query.include_black_market,
+            has_premium,
+            min_volume,
+            rank_by_fill,
         )
+        cached = await results.get(key)
+        if cached is not None:
+            return load_flip(cached)
+
+        with self.albion.record_versions() as versions:
+            flip = await self._flip(
+                item_id, query, has_premium, min_volume, rank_by_fill
+            )
+        await results.set(key, dump_flip(flip), versions)
+        return flip
 
-        buy_price = await self.get_cheapest_item_buy_price(buy_query)
+    async def _flip(
+        self,
+        item_id: str,
+        query: MarketQuery,
+        has_premium: bool,
+        min_volume: int,
+        rank_by_fill: bool,
+    ) -> MarketFlip:
+        prices, liquidity = await gather(
+            self.albion.get_item_prices(query.item_or_id),
+            LiquidityIndex(self.albion.server).get(item_id, query.quality),
+        )
+
+        buy_price = self._find_cheapest_buy_price(
+            prices, query.quality, include_black_market=False
+        )
         if buy_price.sell_price_min == 0:
             raise InsufficientDataError(f"No fresh prices on {query.item_or_id}")
 
-        sell_price = await self.get_expensive_item_sell_price(query)
+        sell_price = self._find_liquid_sell_price(
+            prices,
+            query.quality,
+            liquidity,
+            min_volume=min_volume,
+            include_black_market=query.include_black_market,
+            rank_by_fill=rank_by_fill,
+        )
+        if sell_price is None:
+            raise InsufficientDataError(
+                f"No city trades {min_volume} of {item_id} a day"
+            )
         if sell_price.sell_price_min == 0:
             raise InsufficientDataError(f"No fresh prices on {query.item_or_id}")
 
-        applied_tax = PREMIUM_TAX if has_premium else ORDINARY_TAX
-        taxes = ceil(sell_price.sell_price_min * applied_tax)
-
-        buy_fee = ceil(buy_price.sell_price_min * ORDER_FEE)
-        sell_fee = ceil(sell_price.sell_price_min * ORDER_FEE)
-        fees = buy_fee + sell_fee
-
-        return MarketFlip(
-            buy_price=buy_price.sell_price_min,
-            buy_city=Cities.from_str(buy_price.city),
-            sell_price=sell_price.sell_price_min,
-            sell_city=Cities.from_str(sell_price.city),
-            quality=query.quality,
-            taxes=taxes,
-            fees=fees,
-        )
+        flip = make_flip(buy_price, sell_price, query.quality, has_premium)
+        flip.sell_liquidity = liquidity.get(flip.sell_city)
+        return flip
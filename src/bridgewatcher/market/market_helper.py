@@ -1,8 +1,12 @@
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import batched
 
 from bridgewatcher.api import AlbionOnline
 from bridgewatcher.api.model import Cities, CityPrice, Qualities
 from bridgewatcher.db.schema import Item
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market.model import Liquidity
 
 
 @dataclass
@@ -28,9 +32,35 @@ class MarketQuery:
 # may seem off but I believe they are the right ones for the job.
 # See the definition of CityPrice for more detailed information
 class MarketHelper:
+    # the prices for these many items are fetched at once, every batch is a
+    # handful of upstream requests and a failing one only skips its own items
+    FETCH_BATCH_SIZE = AlbionOnline.MAX_ITEMS_PER_REQUEST * 5
+
     def __init__(self, albion: AlbionOnline) -> None:
         self.albion = albion
 
+    # For scans over many items where a partial answer beats none, the items
+    # of a request that couldn't be fetched are left out. Whoever shows the
+    # result should say so, the ids missing from it are the ones left out
+    async def get_available_prices(self, ids: list[str]) -> dict[str, list[CityPrice]]:
+        prices = {}
+        for batch in batched(ids, self.FETCH_BATCH_SIZE):
+            prices.update(await self.albion.get_items_prices(list(batch), partial=True))
+        if len(prices) < len(set(ids)):
+            LOGGER.warning(
+                f"Skipped prices of {len(set(ids)) - len(prices)} items "
+                f"on {self.albion.server.value}"
+            )
+        return prices
+
+    def _is_fresh(self, price: CityPrice, max_age: timedelta, now: datetime) -> bool:
+        if price.sell_price_min == 0:
+            return False
+        updated_at = datetime.strptime(
+            price.sell_price_min_date, "%Y-%m-%dT%H:%M:%S"
+        ).replace(tzinfo=timezone.utc)
+        return now - updated_at <= max_age
+
     def _get_prices_for_quality(
         self,
         prices: list[CityPrice],
@@ -75,3 +105,42 @@ class MarketHelper:
         filtered = self._get_prices_for_quality(prices, quality, include_black_market)
         non_zero = [price for price in filtered if price.sell_price_min > 0]
         return max(non_zero if non_zero else filtered, key=lambda p: p.sell_price_min)
+
+    # The highest sell price, or with rank_by_fill the one expected to bring in
+    # the most silver for count items within a day: the price weighed by how
+    # much of them the city's market takes in. A city missing from the
+    # liquidity index isn't known to trade little, it goes by its price alone.
+    # Cities trading fewer than min_volume a day are left out, which may leave
+    # nothing at all
+    def _find_liquid_sell_price(
+        self,
+        prices: list[CityPrice],
+        quality: Qualities,
+        liquidity: dict[Cities, Liquidity],
+        count: int = 1,
+        min_volume: int = 0,
+        include_black_market: bool = True,
+        rank_by_fill: bool = False,
+    ) -> CityPrice | None:
+        filtered = self._get_prices_for_quality(prices, quality, include_black_market)
+        non_zero = [price for price in filtered if price.sell_price_min > 0]
+        if min_volume > 0:
+            non_zero = [
+                price
+                for price in non_zero
+                if (city := liquidity.get(Cities.from_str(price.city))) is not None
+                and city.volume >= min_volume
+            ]
+            if not non_zero:
+                return None
+        if not non_zero or not rank_by_fill:
+            return max(
+                non_zero if non_zero else filtered, key=lambda p: p.sell_price_min
+            )
+
+        def get_expected_income(price: CityPrice) -> tuple[float, int]:
+            city = liquidity.get(Cities.from_str(price.city))
+            fill_rate = city.get_fill_rate(count) if city is not None else 1.0
+            return price.sell_price_min * fill_rate, price.sell_price_min
+
+        return max(non_zero, key=get_expected_income)
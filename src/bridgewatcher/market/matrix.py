@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from math import ceil
+from multiprocessing.shared_memory import SharedMemory
+
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.compute import CancellationToken
+from bridgewatcher.market.consts import ORDER_FEE, ORDINARY_TAX, PREMIUM_TAX
+from bridgewatcher.market.model import MarketFlip
+
+# in the order they are stored in
+PRICE_FIELDS = ("sell_price_min", "buy_price_max")
+CITIES = tuple(Cities)
+QUALITIES = tuple(Qualities)
+CITY_INDEXES = {city.value: i for i, city in enumerate(CITIES)}
+# int64 per value, every item takes one row of cities x qualities x fields
+ROW_SIZE = len(CITIES) * len(QUALITIES) * len(PRICE_FIELDS)
+# how many items a job scans between looking at its cancellation token
+CANCELLATION_CHECK_PERIOD = 256
+
+
+@dataclass(frozen=True)
+class PriceMatrixHandle:
+    name: str
+    ids: tuple[str, ...]
+
+
+# Prices of many items laid out as a flat int64 array in shared memory, so
+# the process pool gets them by the name of the block instead of pickling
+# thousands of CityPrice objects on every job. Only the handle is pickled
+class SharedPriceMatrix:
+    def __init__(self, shm: SharedMemory, ids: tuple[str, ...], owner: bool) -> None:
+        self.ids = ids
+        self._shm = shm
+        self._owner = owner
+        self._values = shm.buf.cast("q")
+
+    @staticmethod
+    def create(prices: dict[str, list[CityPrice]]) -> "SharedPriceMatrix":
+        ids = tuple(prices)
+        # a block can't be empty, a freshly created one is zeroed
+        shm = SharedMemory(create=True, size=max(len(ids) * ROW_SIZE * 8, 8))
+        matrix = SharedPriceMatrix(shm, ids, True)
+
+        for i, id in enumerate(ids):
+            for price in prices[id]:
+                city = CITY_INDEXES.get(price.city.lower())
+                if city is None or not 1 <= price.quality <= len(QUALITIES):
+                    continue
+
+                offset = matrix._get_offset(i, city, price.quality - 1)
+                matrix._values[offset] = price.sell_price_min
+                matrix._values[offset + 1] = price.buy_price_max
+        return matrix
+
+    @staticmethod
+    def attach(handle: PriceMatrixHandle) -> "SharedPriceMatrix":
+        # the block belongs to whoever created it, the resource tracker of a
+        # worker would otherwise unlink it as soon as the worker exits
+        return SharedPriceMatrix(
+            SharedMemory(handle.name, track=False), handle.ids, False
+        )
+
+    @property
+    def handle(self) -> PriceMatrixHandle:
+        return PriceMatrixHandle(self._shm.name, self.ids)
+
+    def _get_offset(self, item: int, city: int, quality: int) -> int:
+        return ((item * len(CITIES) + city) * len(QUALITIES) + quality) * len(
+            PRICE_FIELDS
+        )
+
+    def get(self, item: int, city: Cities, quality: Qualities, field: str) -> int:
+        offset = self._get_offset(item, CITIES.index(city), QUALITIES.index(quality))
+        return self._values[offset + PRICE_FIELDS.index(field)]
+
+    def close(self) -> None:
+        # the view has to go first, a block with exported views can't close
+        self._values.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> "SharedPriceMatrix":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+# The same thing MarketFlipper.flip does for a single item, done for every
+# item in the matrix at once: buy at the cheapest sell order outside of the
+# black market, sell at the most expensive sell order anywhere
+def scan_flips(
+    handle: PriceMatrixHandle,
+    quality: Qualities,
+    has_premium: bool,
+    limit: int,
+    token: CancellationToken,
+) -> list[tuple[str, MarketFlip]]:
+    applied_tax = PREMIUM_TAX if has_premium else ORDINARY_TAX
+    black_market = CITIES.index(Cities.BLACK_MARKET)
+    quality_index = QUALITIES.index(quality)
+    flips = []
+
+    with SharedPriceMatrix.attach(handle) as matrix:
+        for i, id in enumerate(matrix.ids):
+            if i % CANCELLATION_CHECK_PERIOD == 0:
+                token.raise_if_cancelled()
+
+            buy_price = sell_price = 0
+            buy_city = sell_city = black_market
+            for city in range(len(CITIES)):
+                offset = matrix._get_offset(i, city, quality_index)
+                price = matrix._values[offset]
+                if price == 0:
+                    continue
+                if city != black_market and (buy_price == 0 or price < buy_price):
+                    buy_price, buy_city = price, city
+                if price > sell_price:
+                    sell_price, sell_city = price, city
+
+            if buy_price == 0 or sell_price == 0:
+                continue
+
+            flip = MarketFlip(
+                quality=quality,
+                buy_price=buy_price,
+                buy_city=CITIES[buy_city],
+                sell_price=sell_price,
+                sell_city=CITIES[sell_city],
+                taxes=ceil(sell_price * applied_tax),
+                fees=ceil(buy_price * ORDER_FEE) + ceil(sell_price * ORDER_FEE),
+            )
+            flips.append((id, flip))
+
+    flips.sort(key=lambda flip: flip[1].profit, reverse=True)
+    return flips[:limit]
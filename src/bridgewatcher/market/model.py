@@ -1,11 +1,31 @@
 from dataclasses import dataclass
 from math import ceil
 
-from bridgewatcher.api.model import Cities, Qualities
-from bridgewatcher.db.schema import Item
+from bridgewatcher.api.model import Cities, GoldPrice, Qualities
+from bridgewatcher.db.schema import Item, Watch
 from bridgewatcher.market.consts import ORDER_FEE
 
 
+# What a city's market takes in of an item, built from the daily history
+@dataclass
+class Liquidity:
+    # items and silver traded a day, both smoothed over the past days
+    volume: float
+    turnover: float
+    # the last day folded in, counted in days since the epoch
+    day: int
+
+    @property
+    def average_price(self) -> int:
+        return round(self.turnover / self.volume) if self.volume > 0 else 0
+
+    # how much of count items is expected to sell within the given days
+    def get_fill_rate(self, count: int, days: float = 1.0) -> float:
+        if count <= 0:
+            return 1.0
+        return min(1.0, self.volume * days / count)
+
+
 @dataclass
 class MarketFlip:
     quality: Qualities
@@ -15,6 +35,8 @@ class MarketFlip:
     sell_city: Cities
     taxes: int
     fees: int
+    # None when the index has nothing on the sell city yet
+    sell_liquidity: Liquidity | None = None
 
     @property
     def profit(self) -> int:
@@ -26,6 +48,7 @@ class CraftingIncome:
     sell_city: Cities
     income: int
     taxes: int
+    liquidity: Liquidity | None = None
 
     @property
     def fees(self) -> int:
@@ -96,3 +119,109 @@ class Craft:
     @property
     def profit(self) -> int:
         return self.income.net + self.leftovers_value - self.total_cost
+
+    # share of the crafted items the sell city is expected to take in a day
+    @property
+    def fill_rate(self) -> float | None:
+        if self.income.liquidity is None:
+            return None
+        return self.income.liquidity.get_fill_rate(self.count)
+
+
+@dataclass
+class WatchHit:
+    watch: Watch
+    city: Cities
+    # the price that crossed the threshold or the margin in percent
+    value: int
+    flip: MarketFlip | None = None
+
+
+@dataclass
+class Cargo:
+    item: Item
+    count: int
+    # a single unit bought in the source city and sold in the destination
+    flip: MarketFlip
+
+    @property
+    def unit_cost(self) -> int:
+        return self.flip.buy_price + ceil(self.flip.buy_price * ORDER_FEE)
+
+    @property
+    def cost(self) -> int:
+        return self.unit_cost * self.count
+
+    @property
+    def profit(self) -> int:
+        return self.flip.profit * self.count
+
+    @property
+    def weight(self) -> float:
+        return self.item.weight * self.count
+
+    @property
+    def slots(self) -> int:
+        return ceil(self.count / self.item.max_stack_size)
+
+
+@dataclass
+class Haul:
+    source: Cities
+    destination: Cities
+    # ranked by profit
+    cargo: list[Cargo]
+    # items with a fresh positive spread between the two cities
+    candidates: int
+    # items left out to keep within the request budget, the least traded ones
+    skipped: int = 0
+    # items whose prices couldn't be fetched
+    unpriced: int = 0
+
+    @property
+    def cost(self) -> int:
+        return sum(cargo.cost for cargo in self.cargo)
+
+    @property
+    def profit(self) -> int:
+        return sum(cargo.profit for cargo in self.cargo)
+
+    @property
+    def weight(self) -> float:
+        return sum(cargo.weight for cargo in self.cargo)
+
+    @property
+    def slots(self) -> int:
+        return sum(cargo.slots for cargo in self.cargo)
+
+
+@dataclass
+class MarketDigest:
+    server: str
+    # None for the whole catalog
+    category: str | None
+    # ids of the items with their flips, ranked by profit
+    flips: list[tuple[str, MarketFlip]]
+    # ranked by profit
+    crafts: list[Craft]
+    # oldest first
+    gold: list[GoldPrice]
+
+    # in percent from the oldest price known to the newest one
+    @property
+    def gold_change(self) -> float | None:
+        if len(self.gold) < 2 or self.gold[0].price == 0:
+            return None
+        return (self.gold[-1].price - self.gold[0].price) * 100 / self.gold[0].price
+
+
+@dataclass
+class CraftSweep:
+    # the id of the item without its tier and enchantment, e.g. MAIN_SWORD
+    family: str
+    # by tier and enchantment, the ones missing couldn't be worked out
+    crafts: dict[tuple[int, int], Craft]
+
+    @property
+    def best(self) -> Craft | None:
+        return max(self.crafts.values(), key=lambda craft: craft.profit, default=None)
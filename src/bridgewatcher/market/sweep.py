@@ -0,0 +1,134 @@
+from asyncio import gather
+from re import compile
+
+from bridgewatcher.api.model import Qualities
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import wait_for_catalog
+from bridgewatcher.db.schema import Item
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.market.crafter import Crafter
+from bridgewatcher.market.liquidity import LiquidityIndex
+from bridgewatcher.market.model import Craft, CraftSweep
+from bridgewatcher.util.exc import (
+    InsufficientDataError,
+    NoItemFoundError,
+    UncraftableItemCraftedError,
+)
+
+TIER_PREFIX = compile(r"^T\d_")
+SWEPT_TIERS = range(4, 9)
+SWEPT_ENCHANTMENTS = range(0, 5)
+
+
+# T6_MAIN_SWORD@2 is MAIN_SWORD. The tiers prefix the name and the
+# enchantments follow an @ the same way get_enchanted_versions_of_item names
+# them in the catalog
+def get_family(id: str) -> str:
+    name, _, _ = id.strip().upper().partition("@")
+    return TIER_PREFIX.sub("", name)
+
+
+def get_family_ids(family: str) -> dict[tuple[int, int], str]:
+    return {
+        (tier, enchantment): (
+            f"T{tier}_{family}@{enchantment}" if enchantment else f"T{tier}_{family}"
+        )
+        for tier in SWEPT_TIERS
+        for enchantment in SWEPT_ENCHANTMENTS
+    }
+
+
+# Crafts every tier and enchantment of an item at once. The whole family and
+# its materials come out of the catalog in two queries and every price in a
+# single batch, so the sweep takes about as long as a single craft does
+class CraftSweeper(Crafter):
+    async def sweep(
+        self,
+        item_or_id: Item | str,
+        count: int = 1,
+        has_premium: bool = True,
+        using_focus: bool = False,
+        min_volume: int = 0,
+        rank_by_fill: bool = False,
+    ) -> CraftSweep:
+        if count <= 0:
+            raise ValueError("Count cannot be negative")
+
+        item_id = item_or_id if isinstance(item_or_id, str) else item_or_id.name
+        family = get_family(item_id)
+        ids = get_family_ids(family)
+
+        await wait_for_catalog()
+        found = {
+            doc["name"]: Item.from_mongo(doc)
+            for doc in await backends.store.find_items_named(list(ids.values()))
+        }
+        if not found:
+            raise NoItemFoundError(f"No such item with id {item_id}", item_id)
+        products = {
+            key: found[id]
+            for key, id in ids.items()
+            if id in found and found[id].crafting_requirements is not None
+        }
+        if not products:
+            raise UncraftableItemCraftedError(f"{family} is uncraftable")
+
+        used = list(
+            dict.fromkeys(
+                requirement.name
+                for item in products.values()
+                for requirement in item.crafting_requirements or []
+            )
+        )
+        liquidity = LiquidityIndex(self.albion.server)
+        material_docs, prices, liquidities = await gather(
+            backends.store.find_items_named(used),
+            self.get_available_prices(
+                [*(item.name for item in products.values()), *used]
+            ),
+            gather(
+                *(
+                    liquidity.get(item.name, Qualities.NORMAL)
+                    for item in products.values()
+                )
+            ),
+        )
+        materials = {doc["name"]: Item.from_mongo(doc) for doc in material_docs}
+
+        crafts = {}
+        for (key, item), item_liquidity in zip(products.items(), liquidities):
+            # a tier nobody trades is a hole in the grid, not a failed sweep
+            try:
+                if not prices.get(item.name):
+                    raise InsufficientDataError(f"No fresh data on {item.name}")
+                for requirement in item.crafting_requirements or []:
+                    if requirement.name not in materials:
+                        raise InsufficientDataError(f"No {requirement.name} in catalog")
+                income = self._price_income(
+                    item,
+                    count,
+                    has_premium,
+                    prices[item.name],
+                    item_liquidity,
+                    min_volume,
+                    rank_by_fill,
+                )
+                purchases = self._price_purchases(item, count, materials, prices)
+            except InsufficientDataError as e:
+                LOGGER.debug(f"Skipped {item.name} in the sweep of {family}: {e}")
+                continue
+
+            leftovers, return_rate = await self._get_leftovers(
+                item, purchases, using_focus
+            )
+            crafts[key] = Craft(
+                item=item,
+                count=count,
+                has_premium=has_premium,
+                _crafting_city=item.city_with_bonus,
+                return_rate=return_rate,
+                income=income,
+                purchases=purchases,
+                leftovers=leftovers,
+            )
+        return CraftSweep(family, crafts)
@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Iterable
+
+from bridgewatcher.api import AlbionOnline
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.compute import COMPUTE, CancellationToken
+from bridgewatcher.db import backends
+from bridgewatcher.db.catalog import wait_for_catalog
+from bridgewatcher.db.schema import Item
+from bridgewatcher.market import MarketHelper
+from bridgewatcher.market.liquidity import LiquidityIndex
+from bridgewatcher.market.market_flipper import make_flip
+from bridgewatcher.market.model import Cargo, Haul
+
+# Relative prices of silver, weight and slots the greedy passes of the solver
+# try, every pass favours items that are cheap in a different mix of them
+RESOURCE_WEIGHTINGS = (
+    (1, 0, 0),
+    (0, 1, 0),
+    (0, 0, 1),
+    (1, 1, 0),
+    (1, 0, 1),
+    (0, 1, 1),
+    (1, 1, 1),
+    (2, 1, 1),
+    (1, 2, 1),
+    (1, 1, 2),
+)
+
+
+# One slot worth of a single item, the unit the solver picks. Every stack of
+# an item is a chunk of its own, the last one may be partial. Plain tuples
+# with the per unit numbers worked out once, the fills go over them a lot:
+# candidate, units, profit, cost, weight, unit profit, unit cost, unit weight
+type Chunk = tuple[int, int, int, int, float, int, int, float]
+
+
+def _split_into_chunks(candidates: list[Cargo], slots: int) -> list[list[Chunk]]:
+    items = []
+    for i, candidate in enumerate(candidates):
+        chunks = []
+        unit_profit = candidate.flip.profit
+        unit_cost = candidate.unit_cost
+        unit_weight = candidate.item.weight
+        units = candidate.count
+        # nothing takes more stacks of an item than there are slots
+        for _ in range(slots):
+            if units <= 0:
+                break
+            count = min(units, candidate.item.max_stack_size)
+            chunks.append(
+                (
+                    i,
+                    count,
+                    unit_profit * count,
+                    unit_cost * count,
+                    unit_weight * count,
+                    unit_profit,
+                    unit_cost,
+                    unit_weight,
+                )
+            )
+            units -= count
+        items.append(chunks)
+    return items
+
+
+def _fill(
+    chunks: Iterable[Chunk],
+    silver: int,
+    capacity: float,
+    slots: int,
+    cheapest: int,
+    lightest: float,
+) -> tuple[int, dict[int, int]]:
+    profit = 0
+    counts: dict[int, int] = {}
+    for i, units, _, cost, weight, unit_profit, unit_cost, unit_weight in chunks:
+        if slots == 0 or silver < cheapest or capacity < lightest:
+            break
+        if unit_cost > silver or unit_weight > capacity:
+            continue
+
+        # whatever still fits of the chunk, it takes up the slot either way
+        if cost > silver or weight > capacity:
+            units = min(
+                units,
+                silver // unit_cost,
+                int(capacity / unit_weight) if unit_weight > 0 else units,
+            )
+            cost = unit_cost * units
+            weight = unit_weight * units
+
+        silver -= cost
+        capacity -= weight
+        slots -= 1
+        profit += unit_profit * units
+        counts[i] = counts.get(i, 0) + units
+    return profit, counts
+
+
+# Bounded knapsack over silver, weight and slots at once. An exact dynamic
+# program over three capacities is way out of reach for thousands of items in
+# pure python, so this is the usual greedy for multidimensional knapsacks:
+# items are taken by profit per normalized resource, once for every mix in
+# RESOURCE_WEIGHTINGS, and the best fill wins. Every pass is a single sort of
+# the items, which keeps the whole catalog well under a second
+def solve_haul(
+    candidates: list[Cargo],
+    silver: int,
+    capacity: float,
+    slots: int,
+    token: CancellationToken | None = None,
+) -> list[Cargo]:
+    if not candidates or silver <= 0 or capacity <= 0 or slots <= 0:
+        return []
+    items = _split_into_chunks(candidates, slots)
+    cheapest = min(candidate.unit_cost for candidate in candidates)
+    lightest = min(candidate.item.weight for candidate in candidates)
+
+    best_profit, best_counts = 0, {}
+    for silver_weight, capacity_weight, slot_weight in RESOURCE_WEIGHTINGS:
+        if token is not None:
+            token.raise_if_cancelled()
+        silver_price = silver_weight / silver
+        capacity_price = capacity_weight / capacity
+        slot_price = slot_weight / slots
+        # the chunks of an item go in one go, ranked by its first and full
+        # one. A chunk of zero weight is free when only the weight counts
+        densities = [
+            chunks[0][2]
+            / (
+                silver_price * chunks[0][3] + capacity_price * chunks[0][4] + slot_price
+                or 1e-12
+            )
+            for chunks in items
+        ]
+        ordered = chain.from_iterable(
+            items[i]
+            for i in sorted(range(len(items)), key=densities.__getitem__, reverse=True)
+        )
+        profit, counts = _fill(ordered, silver, capacity, slots, cheapest, lightest)
+        if profit > best_profit:
+            best_profit, best_counts = profit, counts
+
+    cargo = [
+        Cargo(candidates[i].item, count, candidates[i].flip)
+        for i, count in best_counts.items()
+    ]
+    cargo.sort(key=lambda cargo: cargo.profit, reverse=True)
+    return cargo
+
+
+# Plans what to carry from one city to another: every item that can be bought
+# in the source and sold in the destination for more than the fees and taxes,
+# going by prices fresh enough to still be there
+class TransportPlanner(MarketHelper):
+    DEFAULT_MAX_PRICE_AGE = timedelta(hours=2)
+    # the api has no idea how deep the orders are, so nobody should count on
+    # more than a few stacks of an item at that price
+    DEFAULT_STACKS_PER_ITEM = 1
+    # ten upstream requests at most, a third of what the whole bot may send in
+    # a window of the budget. Beyond that only the items traded the most in
+    # the destination are priced
+    MAX_ITEMS = AlbionOnline.MAX_ITEMS_PER_REQUEST * 10
+
+    def _get_city_price(
+        self,
+        prices: list[CityPrice],
+        city: Cities,
+        max_age: timedelta,
+        now: datetime,
+    ) -> CityPrice | None:
+        for price in self._get_prices_for_quality(prices, Qualities.NORMAL):
+            if Cities.from_str(price.city) == city and self._is_fresh(
+                price, max_age, now
+            ):
+                return price
+        return None
+
+    def _get_candidates(
+        self,
+        items: list[Item],
+        prices: dict[str, list[CityPrice]],
+        source: Cities,
+        destination: Cities,
+        has_premium: bool,
+        stacks_per_item: int,
+        max_age: timedelta,
+    ) -> list[Cargo]:
+        now = datetime.now(timezone.utc)
+        candidates = []
+        for item in items:
+            item_prices = prices.get(item.name)
+            if not item_prices:
+                continue
+
+            buy_price = self._get_city_price(item_prices, source, max_age, now)
+            sell_price = self._get_city_price(item_prices, destination, max_age, now)
+            if buy_price is None or sell_price is None:
+                continue
+
+            flip = make_flip(buy_price, sell_price, Qualities.NORMAL, has_premium)
+            if flip.profit > 0:
+                candidates.append(
+                    Cargo(item, item.max_stack_size * stacks_per_item, flip)
+                )
+        return candidates
+
+    async def plan(
+        self,
+        source: Cities,
+        destination: Cities,
+        silver: int,
+        capacity: float,
+        slots: int,
+        has_premium: bool = True,
+        category: str | None = None,
+        stacks_per_item: int = DEFAULT_STACKS_PER_ITEM,
+        max_age: timedelta = DEFAULT_MAX_PRICE_AGE,
+        timeout: float | None = None,
+    ) -> Haul:
+        await wait_for_catalog()
+        ranked = await self._get_most_traded(
+            [Item.from_mongo(doc) for doc in await backends.store.find_items(category)],
+            destination,
+        )
+        items = ranked[: self.MAX_ITEMS]
+        prices = await self.get_available_prices([item.name for item in items])
+
+        candidates = self._get_candidates(
+            items, prices, source, destination, has_premium, stacks_per_item, max_age
+        )
+        # a plan nobody can be answered with anymore isn't worth finishing
+        cargo = await COMPUTE.run_cancellable(
+            solve_haul, candidates, silver, capacity, slots, timeout=timeout
+        )
+        return Haul(
+            source,
+            destination,
+            cargo,
+            len(candidates),
+            len(ranked) - len(items),
+            len(items) - len(prices),
+        )
+
+    # Items nobody indexed yet go last in the order of the catalog, so a new
+    # index still gets the same items every time
+    async def _get_most_traded(self, items: list[Item], city: Cities) -> list[Item]:
+        if len(items) <= self.MAX_ITEMS:
+            return items
+        volumes = await LiquidityIndex(self.albion.server).get_volumes(
+            [item.name for item in items], Qualities.NORMAL, city
+        )
+        return sorted(items, key=lambda item: volumes.get(item.name, 0.0), reverse=True)
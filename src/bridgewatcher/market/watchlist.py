@@ -0,0 +1,116 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from bridgewatcher.api.model import Cities, CityPrice, Qualities
+from bridgewatcher.db.schema import Watch, WatchKinds
+from bridgewatcher.market import MarketHelper
+from bridgewatcher.market.market_flipper import make_flip
+from bridgewatcher.market.model import MarketFlip, WatchHit
+
+# server -> item id -> every watch on it, whatever the quality, kind or city
+type WatchIndex = dict[str, dict[str, list[Watch]]]
+# where the best price is, the price or the margin in percent and the flip
+# behind the margin
+type Observation = tuple[Cities, int, MarketFlip | None]
+
+
+def index_watches(watches: list[Watch]) -> WatchIndex:
+    index: WatchIndex = defaultdict(lambda: defaultdict(list))
+    for watch in watches:
+        index[watch.server][watch.item_id].append(watch)
+    return index
+
+
+# Evaluates the watches of a single albion server. Prices of every watched
+# item are fetched once per evaluation, and what the watches compare against
+# their thresholds is worked out once per item, quality, kind and city, so
+# a thousand people watching the same bag cost as much as one
+class WatchEvaluator(MarketHelper):
+    # nobody wants to hear about a price that was gone hours ago
+    MAX_PRICE_AGE = timedelta(hours=2)
+    # the flip margins assume the seller has premium, like /flip does by default
+    HAS_PREMIUM = True
+
+    def _get_fresh_prices(
+        self, prices: list[CityPrice], quality: Qualities, now: datetime
+    ) -> list[CityPrice]:
+        return [
+            price
+            for price in self._get_prices_for_quality(prices, quality)
+            if self._is_fresh(price, self.MAX_PRICE_AGE, now)
+        ]
+
+    def _observe(
+        self,
+        prices: list[CityPrice],
+        quality: Qualities,
+        kind: WatchKinds,
+        city: Cities | None,
+    ) -> Observation | None:
+        in_city = [
+            price
+            for price in prices
+            if city is None or Cities.from_str(price.city) == city
+        ]
+        # nobody can buy from the black market, so it never counts as a buy price
+        buy_candidates = [
+            price for price in in_city if price.city.lower() != Cities.BLACK_MARKET
+        ]
+        if kind == WatchKinds.BELOW:
+            if not buy_candidates:
+                return None
+            price = self._find_cheapest_buy_price(buy_candidates, quality)
+            return Cities.from_str(price.city), price.sell_price_min, None
+        if kind == WatchKinds.ABOVE:
+            if not in_city:
+                return None
+            price = self._find_expensive_sell_price(in_city, quality)
+            return Cities.from_str(price.city), price.sell_price_min, None
+
+        # the city of a margin watch is where the item gets bought, it can be
+        # sold anywhere
+        if not buy_candidates:
+            return None
+        buy_price = self._find_cheapest_buy_price(buy_candidates, quality)
+        sell_price = self._find_expensive_sell_price(prices, quality)
+        flip = make_flip(buy_price, sell_price, quality, self.HAS_PREMIUM)
+        return flip.buy_city, flip.profit * 100 // flip.buy_price, flip
+
+    def _is_hit(self, watch: Watch, value: int) -> bool:
+        if watch.kind == WatchKinds.BELOW:
+            return value <= watch.threshold
+        return value >= watch.threshold
+
+    def _evaluate_item(
+        self, watches: list[Watch], prices: list[CityPrice], now: datetime
+    ) -> list[WatchHit]:
+        fresh: dict[Qualities, list[CityPrice]] = {}
+        observations: dict[
+            tuple[Qualities, WatchKinds, Cities | None], Observation | None
+        ] = {}
+        hits = []
+        for watch in watches:
+            if watch.quality not in fresh:
+                fresh[watch.quality] = self._get_fresh_prices(
+                    prices, watch.quality, now
+                )
+            key = (watch.quality, watch.kind, watch.city)
+            if key not in observations:
+                observations[key] = self._observe(fresh[watch.quality], *key)
+
+            observation = observations[key]
+            if observation is not None and self._is_hit(watch, observation[1]):
+                hits.append(WatchHit(watch, *observation))
+        return hits
+
+    # Returns the hits along with the items that were actually evaluated,
+    # the prices of the rest couldn't be fetched this time
+    async def evaluate(
+        self, watches: dict[str, list[Watch]]
+    ) -> tuple[list[WatchHit], set[str]]:
+        now = datetime.now(timezone.utc)
+        prices = await self.get_available_prices(list(watches))
+        hits = []
+        for item_id, item_prices in prices.items():
+            hits.extend(self._evaluate_item(watches[item_id], item_prices, now))
+        return hits, set(prices)
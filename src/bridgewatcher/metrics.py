@@ -0,0 +1,444 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from math import inf
+from time import perf_counter
+from typing import Any, Callable, Iterator, override
+
+from aiohttp import web
+
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.tracing import TRACER, span
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Everything below checks this flag first, so with metrics disabled an
+# instrumented call costs a single attribute lookup and nothing is recorded
+_enabled = False
+
+
+def enable_metrics() -> None:
+    global _enabled
+    _enabled = True
+
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        pass
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(
+            f"{name}{labels} {value}" for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        if _enabled:
+            self._values[self._key(labels)] += value
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @override
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def set(self, value: float, **labels: Any) -> None:
+        if _enabled:
+            self._values[self._key(labels)] = value
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        if _enabled:
+            self._values[self._key(labels)] += value
+
+    def dec(self, value: float = 1, **labels: Any) -> None:
+        if _enabled:
+            self._values[self._key(labels)] -= value
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @override
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = (*buckets, inf)
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not _enabled:
+            return
+
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        if not _enabled:
+            yield
+            return
+
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    @override
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = "+Inf" if bound == inf else str(bound)
+                labels = _format_labels((*self.labels, "le"), (*key, le))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, self._sums[key]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register[T: Metric](self, metric: T) -> T:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+COMMAND_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_command_duration_seconds",
+        "Time spent handling an application command",
+        ("command",),
+    )
+)
+COMMAND_ERRORS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_command_errors_total",
+        "Application commands that raised an exception",
+        ("command",),
+    )
+)
+INTERACTIONS_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_interactions_in_flight",
+        "Application commands currently being handled",
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_cache_requests_total",
+        "Redis cache lookups by key family and result",
+        ("family", "result"),
+    )
+)
+UPSTREAM_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_upstream_request_duration_seconds",
+        "Albion Online Data Project request latency",
+        ("server",),
+    )
+)
+UPSTREAM_REQUESTS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_upstream_requests_total",
+        "Albion Online Data Project requests by response status",
+        ("server", "status"),
+    )
+)
+CACHE_TTL = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_cache_ttl_seconds",
+        "Expiration given to every cached price list",
+        buckets=(60, 120, 300, 600, 900, 1200, 1800, 3600),
+    )
+)
+CACHE_REFETCHES = REGISTRY.register(
+    Counter(
+        "bridgewatcher_cache_refetches_total",
+        "Price lists fetched again after expiring by whether they changed",
+        ("result",),
+    )
+)
+CACHE_STALENESS = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_cache_staleness_seconds",
+        "How long newer prices went unseen behind a cached price list",
+        buckets=(0, 30, 60, 120, 300, 600, 900, 1800, 3600),
+    )
+)
+# a gauge because hot keys kept below the flat expiration cost requests
+UPSTREAM_REQUESTS_SAVED = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_upstream_requests_saved",
+        "Upstream requests avoided compared to the flat 5 minute expiration",
+    )
+)
+STORE_QUERY_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_store_query_duration_seconds",
+        "Storage backend query latency",
+        ("collection", "operation"),
+    )
+)
+EVENT_LOOP_LAG = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_event_loop_lag_seconds",
+        "How late the event loop woke up a sleeping task the last time",
+    )
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_admission_queue_depth",
+        "Commands waiting for a free slot",
+        ("command",),
+    )
+)
+ADMISSION_SHED = REGISTRY.register(
+    Counter(
+        "bridgewatcher_admission_shed_total",
+        "Commands turned away before running by the reason why",
+        ("command", "reason"),
+    )
+)
+EVENT_LOOP_STALLS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_event_loop_stalls_total",
+        "Times the event loop was blocked for longer than the stall threshold",
+    )
+)
+EVENT_LOOP_STALL_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_event_loop_stall_duration_seconds",
+        "How long the event loop stayed blocked once it stalled",
+        buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+    )
+)
+SHARD_READY = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_shard_ready",
+        "Whether the shard is connected to the gateway and has its guilds",
+        ("cluster", "shard"),
+    )
+)
+SHARD_LATENCY = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_shard_latency_seconds",
+        "Time between the last gateway heartbeat and its acknowledgement",
+        ("cluster", "shard"),
+    )
+)
+SHARD_GUILDS = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_shard_guilds",
+        "Guilds served by the shard",
+        ("cluster", "shard"),
+    )
+)
+ENDPOINT_INTERACTIONS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_endpoint_interactions_total",
+        "Interactions received over HTTP by how the endpoint answered them",
+        ("type", "response"),
+    )
+)
+COMPUTE_JOB_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_compute_job_duration_seconds",
+        "Time from submitting a job to the process pool to getting its result",
+        ("job",),
+    )
+)
+COMPUTE_JOBS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_compute_jobs_total",
+        "Process pool jobs by how they ended",
+        ("job", "result"),
+    )
+)
+
+LIQUIDITY_REFRESHED = REGISTRY.register(
+    Counter(
+        "bridgewatcher_liquidity_refreshed_items_total",
+        "Items whose traded volume was refreshed from the history",
+        ("server",),
+    )
+)
+WATCH_CYCLE_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_watch_cycle_duration_seconds",
+        "Time spent evaluating every watch and sending the alerts",
+        buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+    )
+)
+WATCHED_ITEMS = REGISTRY.register(
+    Gauge(
+        "bridgewatcher_watched_items",
+        "Distinct items fetched for the watches in the last cycle",
+        ("server",),
+    )
+)
+WATCH_ALERTS = REGISTRY.register(
+    Counter(
+        "bridgewatcher_watch_alerts_total",
+        "Alert messages sent to channels by whether they got through",
+        ("result",),
+    )
+)
+DIGEST_CYCLE_DURATION = REGISTRY.register(
+    Histogram(
+        "bridgewatcher_digest_cycle_duration_seconds",
+        "Time spent building the due digests and delivering them",
+        buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+    )
+)
+DIGESTS_BUILT = REGISTRY.register(
+    Counter(
+        "bridgewatcher_digests_built_total",
+        "Digests built, one per albion server and category that had subscribers",
+        ("server",),
+    )
+)
+DIGEST_DELIVERIES = REGISTRY.register(
+    Counter(
+        "bridgewatcher_digest_deliveries_total",
+        "Digest messages sent to channels by whether they got through",
+        ("result",),
+    )
+)
+
+
+def instrument_command(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            with TRACER.command(name):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+
+                INTERACTIONS_IN_FLIGHT.inc()
+                started = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    COMMAND_ERRORS.inc(command=name)
+                    raise
+                finally:
+                    COMMAND_DURATION.observe(perf_counter() - started, command=name)
+                    INTERACTIONS_IN_FLIGHT.dec()
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_query(collection: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        operation = func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            with span(f"{collection}.{operation}", "store"):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+
+                started = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    STORE_QUERY_DURATION.observe(
+                        perf_counter() - started,
+                        collection=collection,
+                        operation=operation,
+                    )
+
+        return wrapper
+
+    return decorator
+
+
+async def _serve_metrics(_: web.Request) -> web.Response:
+    return web.Response(
+        text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _serve_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    LOGGER.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,102 @@
+from collections import Counter
+from os.path import basename
+from sys import _current_frames
+from time import monotonic, sleep
+from tracemalloc import Snapshot, Statistic, StatisticDiff
+from types import FrameType
+
+PROFILER_INTERVAL = 0.005
+PROFILER_REPORT_SIZE = 25
+
+
+def _get_frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({basename(code.co_filename)})"
+
+
+def _collapse_stack(frame: FrameType | None) -> str:
+    names = []
+    while frame is not None:
+        names.append(_get_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# Samples another thread's stack from the calling thread, so the profiled loop
+# keeps running untouched and nothing at all is hooked in between profiles
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float = PROFILER_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+
+    def run(self, duration: float) -> Counter[str]:
+        samples: Counter[str] = Counter()
+        deadline = monotonic() + duration
+        while monotonic() < deadline:
+            frame = _current_frames().get(self.thread_id)
+            if frame is not None:
+                samples[_collapse_stack(frame)] += 1
+            del frame
+            sleep(self.interval)
+        return samples
+
+
+# one "stack count" per line, what flamegraph.pl and speedscope read
+def format_collapsed_stacks(samples: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def format_profile_report(
+    samples: Counter[str], size: int = PROFILER_REPORT_SIZE
+) -> str:
+    total = sum(samples.values())
+    if total == 0:
+        return "No samples were taken\n"
+
+    own: Counter[str] = Counter()
+    cumulative: Counter[str] = Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        # recursive functions only count once per sample
+        for frame in set(frames):
+            cumulative[frame] += count
+
+    lines = [f"{total} samples\n", "Own time:"]
+    lines.extend(
+        f"{count / total:7.2%}  {frame}" for frame, count in own.most_common(size)
+    )
+    lines.append("\nCumulative time:")
+    lines.extend(
+        f"{count / total:7.2%}  {frame}"
+        for frame, count in cumulative.most_common(size)
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _format_statistic(statistic: Statistic | StatisticDiff) -> str:
+    frame = statistic.traceback[0]
+    line = f"{frame.filename}:{frame.lineno}: {statistic.size / 1024:.1f} KiB in {statistic.count} blocks"
+    if isinstance(statistic, StatisticDiff):
+        line += (
+            f" ({statistic.size_diff / 1024:+.1f} KiB, {statistic.count_diff:+} blocks)"
+        )
+    return line
+
+
+def format_memory_report(
+    snapshot: Snapshot,
+    previous: Snapshot | None = None,
+    size: int = PROFILER_REPORT_SIZE,
+) -> str:
+    if previous is None:
+        statistics: list = snapshot.statistics("lineno")
+        title = "Top allocators:"
+    else:
+        statistics = snapshot.compare_to(previous, "lineno")
+        title = "Top allocators since the previous snapshot:"
+
+    total = sum(statistic.size for statistic in snapshot.statistics("filename"))
+    lines = [f"{total / 1024 / 1024:.1f} MiB traced\n", title]
+    lines.extend(_format_statistic(statistic) for statistic in statistics[:size])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,197 @@
+from asyncio import Queue, QueueFull, Task, create_task, sleep
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from json import dumps
+from secrets import token_hex
+from time import time_ns
+from typing import Any, Iterator
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+from bridgewatcher.loggers import LOGGER
+
+DEFAULT_SLOW_COMMAND_THRESHOLD = 2.0
+OTLP_EXPORT_INTERVAL = 5
+OTLP_QUEUE_SIZE = 1000
+
+# https://opentelemetry.io/docs/specs/otel/trace/api/#spankind
+OTLP_SPAN_KINDS = {"command": 2, "redis": 3, "store": 3, "http": 3, "discord": 3}
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    parent_id: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    span_id: str = field(default_factory=lambda: token_hex(8))
+    started_at: int = field(default_factory=time_ns)
+    ended_at: int | None = None
+    error: str | None = None
+    children: list["Span"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        ended_at = self.ended_at if self.ended_at is not None else time_ns()
+        return (ended_at - self.started_at) / 1e9
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> dict[str, Any]:
+        doc: dict[str, Any] = {
+            "name": self.name,
+            "kind": self.kind,
+            "ms": round(self.duration * 1000, 2),
+        }
+        if self.attributes:
+            doc["attributes"] = self.attributes
+        if self.error is not None:
+            doc["error"] = self.error
+        if self.children:
+            doc["children"] = [child.to_dict() for child in self.children]
+        return doc
+
+    def to_otlp(self) -> dict[str, Any]:
+        doc: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": OTLP_SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.started_at),
+            "endTimeUnixNano": str(self.ended_at or time_ns()),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in {"kind": self.kind, **self.attributes}.items()
+            ],
+        }
+        if self.parent_id is not None:
+            doc["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            doc["status"] = {"code": 2, "message": self.error}
+        return doc
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.slow_command_threshold = DEFAULT_SLOW_COMMAND_THRESHOLD
+        self.exporter: "OtlpExporter | None" = None
+
+    @contextmanager
+    def command(self, name: str, **attributes: Any) -> Iterator[Span]:
+        root = Span(name, "command", token_hex(16), attributes=attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            root.ended_at = time_ns()
+            _current_span.reset(token)
+            self._finish(root)
+
+    def _finish(self, root: Span) -> None:
+        if root.duration >= self.slow_command_threshold:
+            LOGGER.warning(f"Slow interaction: {dumps(root.to_dict())}")
+        if self.exporter is not None:
+            self.exporter.export(root)
+
+
+TRACER = Tracer()
+
+
+# Child spans only exist inside a command, anywhere else (seeding, background
+# tasks) this is a no-op so the instrumented code doesn't have to care
+@contextmanager
+def span(name: str, kind: str, **attributes: Any) -> Iterator[Span | None]:
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, kind, parent.trace_id, parent.span_id, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.ended_at = time_ns()
+        _current_span.reset(token)
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+# Ships finished traces as OTLP/JSON to a local collector in the background,
+# when the collector can't keep up the traces are dropped, never the commands
+class OtlpExporter:
+    def __init__(self, endpoint: str) -> None:
+        self.url = f"{endpoint.rstrip("/")}/v1/traces"
+        self._queue: Queue[Span] = Queue(OTLP_QUEUE_SIZE)
+        self._task: Task | None = None
+
+    def start(self) -> None:
+        self._task = create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self._flush()
+
+    def export(self, root: Span) -> None:
+        try:
+            self._queue.put_nowait(root)
+        except QueueFull:
+            LOGGER.debug("OTLP export queue is full, dropping a trace")
+
+    async def _run(self) -> None:
+        while True:
+            await sleep(OTLP_EXPORT_INTERVAL)
+            await self._flush()
+
+    async def _flush(self) -> None:
+        spans = []
+        while not self._queue.empty():
+            spans.extend(self._queue.get_nowait().walk())
+        if not spans:
+            return
+
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": "bridgewatcher"},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "bridgewatcher"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        try:
+            async with ClientSession(timeout=ClientTimeout(total=5)) as session:
+                async with session.post(self.url, json=body) as res:
+                    if not res.ok:
+                        LOGGER.warning(f"OTLP collector returned: {res.status}")
+        except (TimeoutError, ClientError):
+            LOGGER.warning("OTLP collector is unavailable", exc_info=True)
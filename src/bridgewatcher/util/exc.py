@@ -17,3 +17,18 @@ class NoItemFoundError(BridgewatcherError):
 
 
 class UntrackedItemRequested(BridgewatcherError): ...
+
+
+class CatalogNotReadyError(BridgewatcherError): ...
+
+
+class BackendConfigurationError(BridgewatcherError): ...
+
+
+class JobCancelledError(BridgewatcherError): ...
+
+
+class ClusterConfigurationError(BridgewatcherError): ...
+
+
+class EndpointConfigurationError(BridgewatcherError): ...
@@ -0,0 +1,89 @@
+from asyncio import AbstractEventLoop, TimerHandle
+from sys import _current_frames
+from threading import Event, Thread, get_ident
+from time import monotonic
+from traceback import format_stack
+
+from bridgewatcher.loggers import LOGGER
+from bridgewatcher.metrics import (
+    EVENT_LOOP_LAG,
+    EVENT_LOOP_STALL_DURATION,
+    EVENT_LOOP_STALLS,
+)
+
+WATCHDOG_INTERVAL = 0.1
+DEFAULT_STALL_THRESHOLD = 0.5
+# the bottom of the stack is always the same asyncio and discord.py plumbing
+STALL_STACK_DEPTH = 15
+
+
+# The loop keeps rescheduling a cheap heartbeat callback and a daemon thread
+# checks how long ago it last ran. When the loop is blocked the heartbeat
+# can't run, so the thread is the one that notices and grabs the stack of
+# whatever is blocking it while it's still on the stack.
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold: float = DEFAULT_STALL_THRESHOLD,
+        interval: float = WATCHDOG_INTERVAL,
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self._loop: AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._handle: TimerHandle | None = None
+        self._thread: Thread | None = None
+        self._stopped = Event()
+        self._last_beat = monotonic()
+
+    # has to be called from the loop's thread
+    def start(self, loop: AbstractEventLoop) -> None:
+        self._loop = loop
+        self._loop_thread_id = get_ident()
+        self._last_beat = monotonic()
+        self._handle = loop.call_later(self.interval, self._beat)
+
+        self._stopped.clear()
+        self._thread = Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self) -> None:
+        now = monotonic()
+        EVENT_LOOP_LAG.set(max(0.0, now - self._last_beat - self.interval))
+        self._last_beat = now
+        self._handle = self._loop.call_later(self.interval, self._beat)  # type: ignore
+
+    def _get_loop_stack(self) -> str:
+        frame = _current_frames().get(self._loop_thread_id)  # type: ignore
+        if frame is None:
+            return "<no frames>"
+        return "".join(format_stack(frame)[-STALL_STACK_DEPTH:])
+
+    def _watch(self) -> None:
+        stalled_since: float | None = None
+        while not self._stopped.wait(self.interval):
+            last_beat = self._last_beat
+            lag = monotonic() - last_beat - self.interval
+
+            if stalled_since is None and lag >= self.threshold:
+                stalled_since = last_beat
+                EVENT_LOOP_STALLS.inc()
+                LOGGER.warning(
+                    f"Event loop has been blocked for {lag:.2f}s, "
+                    f"it's currently at:\n{self._get_loop_stack()}"
+                )
+            elif stalled_since is not None and last_beat != stalled_since:
+                # a beat got through, so the stall is over
+                duration = last_beat - stalled_since - self.interval
+                EVENT_LOOP_STALL_DURATION.observe(duration)
+                LOGGER.warning(f"Event loop was blocked for {duration:.2f}s in total")
+                stalled_since = None